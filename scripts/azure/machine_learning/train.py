@@ -10,7 +10,10 @@ from azure.ai.ml.entities import Model
 from azure.ai.ml.constants import AssetTypes
 
 from src.model.director import ModelDirector
-from src.dataset.dataset_loader import DatasetLoader
+from src.model.builders.base import PRECISION_POLICIES, FLOAT32_PRECISION
+from src.model.execution import EXECUTION_MODES, GRAPH_EXECUTION, get_compile_options
+from src.dataset.dataset_loader import DatasetLoader, LOADER_MODES, GENERATOR_MODE
+from src.preprocessing.utils import HEIGHT, WIDTH, CHANNELS
 from src.config import (
     RANDOM_SEED, 
     EARLY_STOPPING_CONFIG, 
@@ -27,12 +30,12 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("azure")
 
 
-def get_compiled_model(model, optimizer, loss):
-    builder = BUILDERS[model]()
+def get_compiled_model(model, optimizer, loss, execution=GRAPH_EXECUTION, precision=FLOAT32_PRECISION, single_channel=False, input_size=(HEIGHT, WIDTH), channels=CHANNELS):
+    builder = BUILDERS[model](single_channel=single_channel, input_size=input_size, channels=channels)
 
     director = ModelDirector(builder)
-    model_nn = director.make()
-    logger.info(f"Built model_nn with {str(builder)}")
+    model_nn = director.make(precision=precision)
+    logger.info(f"Built model_nn with {str(builder)} in {precision} precision")
 
     optimizer_cls = {
         "adam": tf.keras.optimizers.Adam,
@@ -46,17 +49,19 @@ def get_compiled_model(model, optimizer, loss):
 
     metrics = [metric() for metric in METRICS]
 
-    model_nn.compile(optimizer=optimizer_cls, loss=loss_cls, metrics=metrics, run_eagerly=True)
-    logger.info("Compiled model")
+    model_nn.compile(
+        optimizer=optimizer_cls, loss=loss_cls, metrics=metrics, **get_compile_options(execution)
+    )
+    logger.info(f"Compiled model for {execution} execution")
 
     return model_nn
 
 
-def get_compiled_distributed_model(model, optimizer, loss):
+def get_compiled_distributed_model(model, optimizer, loss, execution=GRAPH_EXECUTION, precision=FLOAT32_PRECISION, single_channel=False, input_size=(HEIGHT, WIDTH), channels=CHANNELS):
     strategy = tf.distribute.MultiWorkerMirroredStrategy()
 
     with strategy.scope():
-        model_nn = get_compiled_model(model, optimizer, loss)
+        model_nn = get_compiled_model(model, optimizer, loss, execution, precision, single_channel, input_size, channels)
 
     return model_nn
 
@@ -84,7 +89,36 @@ def get_compiled_distributed_model(model, optimizer, loss):
 @click.option("--batch_size", type=click.INT, default=64, help="Batch size for dataset loaders")
 @click.option("--job_name", type=click.STRING, help="Azure Machine Learning job name")
 @click.option("--distributed", is_flag=True, help="Use distributed startegy")
-def run(model, train, test, optimizer, loss, epochs, batch_size, job_name, distributed):
+@click.option(
+    "--loader_mode",
+    type=click.Choice(LOADER_MODES),
+    default=GENERATOR_MODE,
+    help="Load batches with a Python generator or with parallel tf.data operations",
+)
+@click.option(
+    "--cache",
+    type=click.STRING,
+    default=None,
+    help="Cache training images in 'memory', in a disk snapshot directory or 'auto'",
+)
+@click.option(
+    "--execution",
+    type=click.Choice(EXECUTION_MODES),
+    default=GRAPH_EXECUTION,
+    help="Run training steps eagerly for debugging, as a graph or as a graph compiled with XLA",
+)
+@click.option(
+    "--precision",
+    type=click.Choice(PRECISION_POLICIES),
+    default=FLOAT32_PRECISION,
+    help="Precision policy of the model layers, mixed policies keep float32 weights and outputs",
+)
+@click.option(
+    "--single_channel",
+    is_flag=True,
+    help="Fold the greyscale to RGB conversion into the first convolution of the base model",
+)
+def run(model, train, test, optimizer, loss, epochs, batch_size, job_name, distributed, loader_mode, cache, execution, precision, single_channel):
     mlflow.set_experiment("lung-cancer-detection")
     mlflow_run = mlflow.start_run(run_name=f"train_{model}_{datetime.now().strftime('%Y%m%d%H%M%S')}")
 
@@ -93,19 +127,28 @@ def run(model, train, test, optimizer, loss, epochs, batch_size, job_name, distr
     mlflow.log_param("epochs", epochs)
     mlflow.log_param("batch_size", batch_size)
     mlflow.log_param("random_seed", RANDOM_SEED)
+    mlflow.log_param("execution", execution)
+    mlflow.log_param("precision", precision)
+    mlflow.log_param("single_channel", single_channel)
 
     logger.info(f"Started training run at {datetime.now()}")
     logger.info(
         f"Run parameters - optimizer: {optimizer}, loss: {loss}"
     )
     
+    train_loader = DatasetLoader(train, mode=loader_mode, cache=cache)
+    test_loader = DatasetLoader(test, mode=loader_mode)
+
+    # Datasets resized in preprocessing aren't resized again by the model
+    input_size = (train_loader.metadata.height, train_loader.metadata.width)
+    channels = train_loader.metadata.channels
+    mlflow.log_param("input_size", input_size)
+    mlflow.log_param("channels", channels)
+
     if not distributed:
-        model_nn = get_compiled_model(model, optimizer, loss)
+        model_nn = get_compiled_model(model, optimizer, loss, execution, precision, single_channel, input_size, channels)
     else:
-        model_nn = get_compiled_distributed_model(model, optimizer, loss)
-
-    train_loader = DatasetLoader(train)
-    test_loader = DatasetLoader(test)
+        model_nn = get_compiled_distributed_model(model, optimizer, loss, execution, precision, single_channel, input_size, channels)
 
     train_loader.set_seed(RANDOM_SEED)
     test_loader.set_seed(RANDOM_SEED)
@@ -116,6 +159,8 @@ def run(model, train, test, optimizer, loss, epochs, batch_size, job_name, distr
 
     history = model_nn.fit(train_dataset, epochs=epochs, callbacks=CALLBACKS)
     logger.info("Trained model")
+    if cache is not None:
+        logger.info(f"Training cache: {train_loader.cache_info()}")
 
     for metric, values in history.history.items():
         for step, value in enumerate(values):
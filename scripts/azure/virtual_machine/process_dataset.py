@@ -3,6 +3,14 @@ import os
 import click
 
 from src.preprocessing.dataset_processor import DatasetProcessor
+from src.preprocessing.utils import (
+    STORAGE_DTYPES,
+    FLOAT64,
+    OUTPUT_BACKENDS,
+    NPY_BACKEND,
+    CROP_MODES,
+    CROP_SIZE,
+)
 
 
 @click.command()
@@ -12,10 +20,31 @@ from src.preprocessing.dataset_processor import DatasetProcessor
     help="Path to output directory where processed dicoms will be saved")
 @click.option("-t", "--train_size", type=float, default=0.8,
     help="Train size for train/test split")
-def run(input_path, output_path, train_size):
+@click.option("-s", "--series_mode", is_flag=True,
+    help="Process each series at once as a 3D stack")
+@click.option("-c", "--catalog_path", type=click.Path(dir_okay=False, writable=True), default=None,
+    help="Path to the catalog index file, it's built if it doesn't exist")
+@click.option("-d", "--dtype", type=click.Choice(STORAGE_DTYPES), default=FLOAT64,
+    help="Storage dtype of processed images")
+@click.option("--resume/--no_resume", default=True,
+    help="Only process slices that the ledger of the output directory doesn't have as done")
+@click.option("-b", "--backend", type=click.Choice(OUTPUT_BACKENDS), default=NPY_BACKEND,
+    help="Output format, npy files in label folders or TFRecord shards")
+@click.option("--size", "sizes", type=int, multiple=True,
+    help="Size of a resized derivative of the dataset, e.g. input size of the model, can be repeated")
+@click.option("--crop", type=click.Choice(CROP_MODES), default=None,
+    help="Crop slices to the lungs of each slice or of each series, series requires series mode")
+@click.option("--crop_size", type=int, default=CROP_SIZE,
+    help="Size cropped slices are resampled to")
+@click.option("--stack_slices", is_flag=True,
+    help="Save every slice with its neighbours z-1 and z+1 as 3 channels, requires series mode")
+def run(input_path, output_path, train_size, series_mode, catalog_path, dtype, resume, backend, sizes, crop, crop_size, stack_slices):
     try:
-        dp = DatasetProcessor(input_path)
-        dp.process_and_save(output_path)
+        dp = DatasetProcessor(
+            input_path, series_mode=series_mode, catalog_path=catalog_path, crop=crop, crop_size=crop_size,
+            stack_slices=stack_slices,
+        )
+        dp.process_and_save(output_path, dtype=dtype, resume=resume, backend=backend, sizes=list(sizes))
         click.echo(f"Processing completed. Data saved to {output_path}")
     except Exception as e:
         click.echo(f"An error occurred: {e}", err=True)
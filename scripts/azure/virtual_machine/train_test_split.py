@@ -3,6 +3,7 @@ import os
 import click
 
 from src.preprocessing.dataset_processor import DatasetProcessor
+from src.preprocessing.utils import SPLIT_MODES, COPY_SPLIT
 
 
 @click.command()
@@ -10,11 +11,15 @@ from src.preprocessing.dataset_processor import DatasetProcessor
     help="Path to directory containing processed dataset")
 @click.option("-t", "--train_size", type=float, default=0.8,
     help="Train size for train/test split")
-def run(dataset_path, train_size):
+@click.option("-m", "--mode", type=click.Choice(SPLIT_MODES), default=COPY_SPLIT,
+    help="Copy, hardlink or move images into train and test folders, or only save manifests")
+@click.option("--seed", type=int, default=None,
+    help="Seed of the split")
+def run(dataset_path, train_size, mode, seed):
     try:
         dp = DatasetProcessor(dataset_path)
         click.echo(f"Splitting processed dataset at {dataset_path}\nTrain split: {train_size}")
-        dp.train_test_split(dataset_path, train_size=train_size)
+        dp.train_test_split(dataset_path, train_size=train_size, mode=mode, seed=seed)
         click.echo(f"Splitting completed.")
     except Exception as e:
         click.echo(f"An error occurred: {e}", err=True)
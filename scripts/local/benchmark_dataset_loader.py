@@ -0,0 +1,40 @@
+import time
+
+import click
+
+from src.dataset.dataset_loader import DatasetLoader, LOADER_MODES
+
+
+def time_loading(loader, epochs):
+    """Returns seconds and images per second of iterating over the dataset"""
+    dataset = loader.get_dataset()
+    images = 0
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for x, _ in dataset:
+            images += x.shape[0]
+    elapsed = time.perf_counter() - start
+    return elapsed, images / elapsed
+
+
+@click.command()
+@click.option("-d", "--dataset_path", type=click.Path(exists=True),
+    help="Path to directory containing processed dataset or to a manifest")
+@click.option("-b", "--batch_size", type=int, default=32,
+    help="Batch size of the loaders")
+@click.option("-e", "--epochs", type=int, default=1,
+    help="Number of passes over the dataset")
+def run(dataset_path, batch_size, epochs):
+    results = {
+        mode: time_loading(DatasetLoader(dataset_path, batch_size=batch_size, mode=mode), epochs)
+        for mode in LOADER_MODES
+    }
+
+    click.echo(f"Loaded {dataset_path}")
+    for mode, (elapsed, throughput) in results.items():
+        click.echo(f"  - {mode}: {elapsed:.1f} s, {throughput:.1f} images/s")
+    click.echo(f"  - speedup: {results[LOADER_MODES[0]][0] / results[LOADER_MODES[1]][0]:.2f}x")
+
+
+if __name__ == "__main__":
+    run()
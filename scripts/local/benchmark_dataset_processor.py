@@ -0,0 +1,75 @@
+import os
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+
+from src.preprocessing.annotation_processor import AnnotationProcessor
+from src.preprocessing.dataset_processor import DatasetProcessor
+from src.preprocessing.utils import (
+    NODULE,
+    NON_NODULE,
+    DICOM_KEY,
+    ANNOTATION_KEY,
+    BATCH_SIZE,
+    MAX_WORKERS,
+)
+
+
+def process_with_pool_per_series(dp, path):
+    """Previous DatasetProcessor behaviour, with a new pool for every series"""
+    for label in [NODULE, NON_NODULE]:
+        os.makedirs(os.path.join(path, label), exist_ok=True)
+
+    for paths_dictionary in dp._generate_annotation_and_dicom_paths():
+        dicom_paths = paths_dictionary[DICOM_KEY]
+        ap = AnnotationProcessor(path=paths_dictionary[ANNOTATION_KEY])
+        ap.process()
+
+        with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(dp._process_and_save, dicom_paths[i : i + BATCH_SIZE], ap.index, path)
+                for i in range(0, len(dicom_paths), BATCH_SIZE)
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+
+def count_slices(path):
+    return sum(len(os.listdir(os.path.join(path, label))) for label in [NODULE, NON_NODULE])
+
+
+def time_processing(func, output_path):
+    start = time.perf_counter()
+    func(output_path)
+    elapsed = time.perf_counter() - start
+    return elapsed, count_slices(output_path) / elapsed
+
+
+@click.command()
+@click.option("-i", "--input_path", type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Path to directory containing patient data with Dicom images")
+def run(input_path):
+    dp = DatasetProcessor(input_path)
+
+    with tempfile.TemporaryDirectory() as output_path:
+        per_series = time_processing(
+            lambda path: process_with_pool_per_series(dp, path),
+            os.path.join(output_path, "per_series"),
+        )
+        persistent = time_processing(
+            dp.process_and_save,
+            os.path.join(output_path, "persistent"),
+        )
+
+    click.echo(
+        f"Processed {input_path}\n"
+        f"  - pool per series: {per_series[0]:.1f} s, {per_series[1]:.1f} slices/s\n"
+        f"  - persistent pool: {persistent[0]:.1f} s, {persistent[1]:.1f} slices/s\n"
+        f"  - speedup: {per_series[0] / persistent[0]:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,67 @@
+import os
+import time
+
+import click
+import pydicom
+
+from src.preprocessing.dicom_processor import DicomProcessor
+from src.preprocessing.utils import DICOM_EXTENSION
+
+
+def legacy_pixel_access(path):
+    """Pixel data access pattern of the previous DicomProcessor implementation"""
+    dcm = pydicom.dcmread(path)
+    # _fix_outliers decoded, clipped and re-encoded the pixel data
+    image = dcm.pixel_array
+    image[image < 0] = 0
+    dcm.PixelData = image.tobytes()
+    # _create_lung_mask and process decoded the re-encoded pixel data again
+    _ = dcm.pixel_array
+    _ = dcm.pixel_array
+
+
+def single_decode_pixel_access(path):
+    """Pixel data access pattern of the current DicomProcessor implementation"""
+    dcm = pydicom.dcmread(path)
+    image = dcm.pixel_array
+    image[image < 0] = 0
+
+
+def time_per_slice(func, paths):
+    """Returns mean time per slice in milliseconds"""
+    start = time.perf_counter()
+    for path in paths:
+        func(path)
+    return (time.perf_counter() - start) / len(paths) * 1000
+
+
+@click.command()
+@click.option("-i", "--input_path", type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Path to directory containing Dicom images")
+@click.option("-n", "--num_slices", type=int, default=100,
+    help="Number of slices to benchmark")
+def run(input_path, num_slices):
+    paths = []
+    for root, _, files in os.walk(input_path):
+        paths += [os.path.join(root, f) for f in files if f.endswith(DICOM_EXTENSION)]
+    paths = sorted(paths)[:num_slices]
+
+    if len(paths) == 0:
+        click.echo(f"No dicom files found in {input_path}", err=True)
+        return
+
+    legacy = time_per_slice(legacy_pixel_access, paths)
+    single_decode = time_per_slice(single_decode_pixel_access, paths)
+    process = time_per_slice(lambda path: DicomProcessor(path).process(), paths)
+
+    click.echo(
+        f"Benchmarked {len(paths)} slices\n"
+        f"  - legacy pixel access: {legacy:.2f} ms/slice\n"
+        f"  - single decode pixel access: {single_decode:.2f} ms/slice\n"
+        f"  - saving: {legacy - single_decode:.2f} ms/slice\n"
+        f"  - DicomProcessor.process: {process:.2f} ms/slice"
+    )
+
+
+if __name__ == "__main__":
+    run()
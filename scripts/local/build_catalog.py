@@ -0,0 +1,20 @@
+import click
+
+from src.preprocessing.dataset_catalog import DatasetCatalog
+
+
+@click.command()
+@click.option("-i", "--input_path", type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Path to directory containing patient data with Dicom images")
+@click.option("-c", "--catalog_path", type=click.Path(dir_okay=False, writable=True),
+    help="Path to the catalog index file, existing index is updated incrementally")
+def run(input_path, catalog_path):
+    try:
+        catalog = DatasetCatalog(input_path, catalog_path)
+        catalog.build()
+        click.echo(f"Catalog with {len(catalog)} series saved to {catalog_path}")
+    except Exception as e:
+        click.echo(f"An error occurred: {e}", err=True)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,42 @@
+import click
+
+from src.preprocessing.dataset_processor import DatasetProcessor
+from src.preprocessing.utils import (
+    STORAGE_DTYPES,
+    FLOAT64,
+    PATCH_MODES,
+    PATCH_2D,
+    PATCH_SIZE,
+    NEGATIVE_RATIO,
+)
+
+
+@click.command()
+@click.option("-i", "--input_path", type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Path to directory containing patient data with Dicom images")
+@click.option("-o", "--output_path", type=click.Path(file_okay=False, dir_okay=True, writable=True),
+    help="Path to output directory where the packed patches will be saved")
+@click.option("-c", "--catalog_path", type=click.Path(dir_okay=False, writable=True), default=None,
+    help="Path to the catalog index file, it's built if it doesn't exist")
+@click.option("--size", type=int, default=PATCH_SIZE,
+    help="Height and width of the patches")
+@click.option("-m", "--mode", type=click.Choice(PATCH_MODES), default=PATCH_2D,
+    help="2D patches or 2.5D patches with the neighbouring slices as channels")
+@click.option("--negative_ratio", type=float, default=NEGATIVE_RATIO,
+    help="Number of negative patches per nodule patch of a series")
+@click.option("-d", "--dtype", type=click.Choice(STORAGE_DTYPES), default=FLOAT64,
+    help="Storage dtype of the patches")
+@click.option("--seed", type=int, default=None,
+    help="Seed of sampling negative patches")
+def run(input_path, output_path, catalog_path, size, mode, negative_ratio, dtype, seed):
+    try:
+        dp = DatasetProcessor(input_path, catalog_path=catalog_path)
+        dp.extract_patches(
+            output_path, size=size, mode=mode, negative_ratio=negative_ratio, dtype=dtype, seed=seed
+        )
+        click.echo(f"Patches saved to {output_path}")
+    except Exception as e:
+        click.echo(f"An error occurred: {e}", err=True)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,34 @@
+import click
+
+from src.preprocessing.dataset_processor import DatasetProcessor
+
+
+@click.command()
+@click.option("-i", "--input_path", type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Path to directory containing patient data with Dicom images")
+@click.option("-d", "--dataset_path", type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Path to directory containing processed dataset")
+@click.option("-c", "--catalog_path", type=click.Path(dir_okay=False, writable=True),
+    help="Path to the catalog index file, it's built if it doesn't exist")
+@click.option("-v", "--val_size", type=float, default=0.1,
+    help="Share of patients in the validation split")
+@click.option("-t", "--test_size", type=float, default=0.2,
+    help="Share of patients in the test split")
+@click.option("-k", "--folds", type=int, default=None,
+    help="Number of folds, saves k-fold manifests instead of train/val/test split")
+@click.option("--seed", type=int, default=None,
+    help="Seed of the split")
+def run(input_path, dataset_path, catalog_path, val_size, test_size, folds, seed):
+    try:
+        dp = DatasetProcessor(input_path, catalog_path=catalog_path)
+        if folds is None:
+            manifests = list(dp.patient_split(dataset_path, val_size, test_size, seed).values())
+        else:
+            manifests = [path for fold in dp.patient_k_fold(dataset_path, folds, seed) for path in fold.values()]
+
+        click.echo("Saved manifests:\n" + "\n".join(f"  - {path}" for path in manifests))
+    except Exception as e:
+        click.echo(f"An error occurred: {e}", err=True)
+
+if __name__ == "__main__":
+    run()
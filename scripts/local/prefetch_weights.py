@@ -0,0 +1,42 @@
+import click
+
+from src.config import MODELS, BUILDERS
+from src.model.weights import WEIGHTS_DIR_ENV, WeightStore, WeightStoreError
+
+
+@click.command()
+@click.option("-p", "--path", type=click.Path(file_okay=False, dir_okay=True, writable=True), default=None,
+    help=f"Path to the weight store directory, {WEIGHTS_DIR_ENV} by default")
+@click.option("-m", "--model", "models", type=click.Choice(MODELS), multiple=True, default=MODELS,
+    help="Model whose weights are prefetched, all models by default")
+@click.option("-f", "--force", is_flag=True,
+    help="Download weights again even if they're stored")
+def run(path, models, force):
+    try:
+        store = WeightStore(path)
+        if store.path is None:
+            raise WeightStoreError(f"Pass --path or set {WEIGHTS_DIR_ENV}")
+
+        for model in models:
+            builder = BUILDERS[model](weight_store=store)
+            name = str(builder)
+
+            if force:
+                store.remove(name)
+            elif store.contains(name):
+                try:
+                    store.resolve(name)
+                    click.echo(f"Weights of {name} are already stored")
+                    continue
+                except WeightStoreError as e:
+                    click.echo(f"{e}, downloading weights of {name} again")
+                    store.remove(name)
+
+            builder.set_model_layers()
+            click.echo(f"Weights of {name} saved to {store.save(name, builder.model_layers)}")
+    except Exception as e:
+        click.echo(f"An error occurred: {e}", err=True)
+
+
+if __name__ == "__main__":
+    run()
@@ -3,6 +3,21 @@ import os
 import click
 
 from src.preprocessing.dataset_processor import DatasetProcessor
+from src.preprocessing.utils import (
+    STORAGE_DTYPES,
+    FLOAT64,
+    OUTPUT_BACKENDS,
+    NPY_BACKEND,
+    SPLIT_MODES,
+    COPY_SPLIT,
+    MANIFEST_SPLIT,
+    get_resized_path,
+    CROP_MODES,
+    CROP_SIZE,
+)
+
+# Seed of the split of a dataset with derivatives, if none is given
+DERIVATIVES_SEED = 0
 
 
 @click.command()
@@ -12,12 +27,44 @@ from src.preprocessing.dataset_processor import DatasetProcessor
     help="Path to output directory where processed dicoms will be saved")
 @click.option("-t", "--train_size", type=float, default=0.8,
     help="Train size for train/test split")
-def run(input_path, output_path, train_size):
+@click.option("-s", "--series_mode", is_flag=True,
+    help="Process each series at once as a 3D stack")
+@click.option("-c", "--catalog_path", type=click.Path(dir_okay=False, writable=True), default=None,
+    help="Path to the catalog index file, it's built if it doesn't exist")
+@click.option("-d", "--dtype", type=click.Choice(STORAGE_DTYPES), default=FLOAT64,
+    help="Storage dtype of processed images")
+@click.option("--resume/--no_resume", default=True,
+    help="Only process slices that the ledger of the output directory doesn't have as done")
+@click.option("-b", "--backend", type=click.Choice(OUTPUT_BACKENDS), default=NPY_BACKEND,
+    help="Output format, npy files in label folders or TFRecord shards")
+@click.option("--split_mode", type=click.Choice(SPLIT_MODES), default=COPY_SPLIT,
+    help="Copy, hardlink or move images into train and test folders, or only save manifests")
+@click.option("--seed", type=int, default=None,
+    help=f"Seed of the train/test split, defaults to {DERIVATIVES_SEED} with --size so derivatives get the same split")
+@click.option("--size", "sizes", type=int, multiple=True,
+    help="Size of a resized derivative of the dataset, e.g. input size of the model, can be repeated")
+@click.option("--crop", type=click.Choice(CROP_MODES), default=None,
+    help="Crop slices to the lungs of each slice or of each series, series requires series mode")
+@click.option("--crop_size", type=int, default=CROP_SIZE,
+    help="Size cropped slices are resampled to")
+@click.option("--stack_slices", is_flag=True,
+    help="Save every slice with its neighbours z-1 and z+1 as 3 channels, requires series mode")
+def run(input_path, output_path, train_size, series_mode, catalog_path, dtype, resume, backend, split_mode, seed, sizes, crop, crop_size, stack_slices):
     try:
-        dp = DatasetProcessor(input_path)
-        dp.process_and_save(output_path)
-        dp.train_test_split(output_path, train_size=train_size)
-        dp.remove_processed_data(output_path)
+        dp = DatasetProcessor(
+            input_path, series_mode=series_mode, catalog_path=catalog_path, crop=crop, crop_size=crop_size,
+            stack_slices=stack_slices,
+        )
+        dp.process_and_save(output_path, dtype=dtype, resume=resume, backend=backend, sizes=list(sizes))
+
+        # Derivatives are split with the same seed, so they have the same train and test slices
+        if sizes and seed is None:
+            seed = DERIVATIVES_SEED
+        for path in [output_path, *(get_resized_path(output_path, size) for size in sizes)]:
+            dp.train_test_split(path, train_size=train_size, mode=split_mode, seed=seed)
+            # Manifests and split of shards only index the data, so it has to stay
+            if backend == NPY_BACKEND and split_mode != MANIFEST_SPLIT:
+                dp.remove_processed_data(path)
 
         click.echo(f"Processing completed. Data saved to {output_path}")
     except Exception as e:
@@ -0,0 +1,47 @@
+import click
+
+from src.config import MODELS, BUILDERS
+from src.dataset.dataset_loader import DatasetLoader
+from src.model.director import ModelDirector
+from src.model.feature_extractor import FeatureExtractor
+
+
+@click.command()
+@click.option("-m", "--model", type=click.Choice(MODELS), default="mobilenet",
+    help="Model whose head is trained")
+@click.option("-d", "--dataset_path", type=click.Path(exists=True),
+    help="Path to the training dataset, used if features weren't extracted yet")
+@click.option("-f", "--features_path", type=click.Path(file_okay=False, dir_okay=True, writable=True), required=True,
+    help="Path to directory with extracted features, they're extracted if they don't exist")
+@click.option("-e", "--epochs", type=int, default=10,
+    help="Number of epochs to train the head for")
+@click.option("-b", "--batch_size", type=int, default=64,
+    help="Batch size of features")
+@click.option("-o", "--output_path", type=click.Path(file_okay=False, dir_okay=True, writable=True), default=None,
+    help="Path where the whole model with the trained head is saved")
+def run(model, dataset_path, features_path, epochs, batch_size, output_path):
+    # Checked before building the model, and outside of try, so click reports it as usage error
+    if dataset_path is None and not FeatureExtractor.exists(features_path):
+        raise click.UsageError(f"Features don't exist in {features_path}, --dataset_path is required to extract them")
+
+    try:
+        builder = BUILDERS[model]()
+        model_nn = ModelDirector(builder).make()
+        extractor = FeatureExtractor(builder)
+
+        if not FeatureExtractor.exists(features_path):
+            click.echo(f"Extracting features of {dataset_path} to {features_path}")
+            loader = DatasetLoader(dataset_path, batch_size=batch_size)
+            extractor.extract(loader.get_dataset(), features_path)
+
+        extractor.head.compile(optimizer="adam", loss="binary_crossentropy", metrics=["accuracy"])
+        extractor.head.fit(FeatureExtractor.load(features_path, batch_size=batch_size), epochs=epochs)
+
+        if output_path is not None:
+            model_nn.save(output_path)
+            click.echo(f"Model saved to {output_path}")
+    except Exception as e:
+        click.echo(f"An error occurred: {e}", err=True)
+
+if __name__ == "__main__":
+    run()
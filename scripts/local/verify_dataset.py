@@ -0,0 +1,23 @@
+import click
+
+from src.dataset.dataset_loader import DatasetLoader
+
+
+@click.command()
+@click.option("-d", "--dataset_path", type=click.Path(exists=True),
+    help="Path to directory containing processed dataset or to a manifest")
+@click.option("-w", "--max_workers", type=int, default=None,
+    help="Number of threads checking images")
+def run(dataset_path, max_workers):
+    try:
+        loader = DatasetLoader(dataset_path)
+        corrupt = loader.verify(max_workers=max_workers)
+
+        click.echo(f"Verified {dataset_path}, {len(corrupt)} corrupt images quarantined in {loader.quarantine.path}")
+        for path in corrupt:
+            click.echo(f"  - {path}")
+    except Exception as e:
+        click.echo(f"An error occurred: {e}", err=True)
+
+if __name__ == "__main__":
+    run()
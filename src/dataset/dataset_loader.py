@@ -1,45 +1,319 @@
 import os
+import json
 import logging
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import tensorflow as tf
 
-from src.preprocessing.utils import NODULE, NON_NODULE, HEIGHT, WIDTH
+from src.dataset.quarantine import Quarantine, QUARANTINE_FILENAME
+from src.preprocessing.utils import (
+    NODULE,
+    NON_NODULE,
+    UINT16,
+    TFRECORD_BACKEND,
+    PACKED_BACKEND,
+    SHARD_CYCLE_LENGTH,
+    SHARD_SHUFFLE_BUFFER,
+    MANIFEST_EXTENSION,
+    DatasetMetadata,
+    load_manifest,
+)
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Loader modes
+GENERATOR_MODE = "generator"
+NATIVE_MODE = "native"
+LOADER_MODES = [GENERATOR_MODE, NATIVE_MODE]
+# Format of .npy files, header length follows the magic string and the version, a little
+# endian uint16 in version 1.0 and uint32 in version 2.0
+NPY_MAGIC = b"\x93NUMPY"
+NPY_VERSIONS = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+NPY_HEADER_LENGTH_OFFSET = 8
+NPY_PREAMBLE_LENGTHS = {1: 10, 2: 12}
+# Epoch cache
+AUTO_CACHE = "auto"
+CACHE_MEMORY_FRACTION = 0.5  # share of available memory the automatic cache may take
+
 
 class DatasetLoader:
-    """LIDC-IDRI dataset loader"""
+    """
+    LIDC-IDRI dataset loader, dataset_path is a dataset directory or a manifest file.
+
+    The generator mode loads batches of .npy files in a Python generator, the native mode
+    reads and decodes them with parallel tf.data operations and prefetches batches.
+    The cache keeps images read in the first epoch in memory ("memory"), in a disk snapshot
+    (path to a directory) or in memory if they fit and on disk otherwise ("auto").
+    With multiple workers every worker only reads its partition of the dataset, the number
+    of workers and worker index are read from TF_CONFIG if they are not given.
+    """
+
+    def __init__(
+        self,
+        dataset_path,
+        batch_size=32,
+        mode=GENERATOR_MODE,
+        cache=None,
+        num_workers=None,
+        worker_index=None,
+    ):
+        if mode not in LOADER_MODES:
+            raise ValueError(f"Loader mode {mode} not supported, use one of {LOADER_MODES}")
+
+        if num_workers is None and worker_index is None:
+            num_workers, worker_index = self._get_worker_from_tf_config()
+        self.num_workers = num_workers or 1
+        self.worker_index = worker_index or 0
+        if not 0 <= self.worker_index < self.num_workers:
+            raise ValueError(f"Worker index {self.worker_index} out of range of {self.num_workers} workers")
 
-    def __init__(self, dataset_path, batch_size=32):
         self.dataset_path = dataset_path
         self.batch_size = batch_size
+        self.mode = mode
+        self.cache = cache
+        self._epoch_cache = None
+        # Manifests are saved next to the data and its metadata
+        self.manifest = os.path.isfile(dataset_path) and dataset_path.endswith(MANIFEST_EXTENSION)
+        data_dir = os.path.dirname(os.path.abspath(dataset_path)) if self.manifest else dataset_path
+        self.metadata = DatasetMetadata.load(data_dir)
+        self.quarantine = Quarantine(os.path.join(data_dir, QUARANTINE_FILENAME))
         self._dataset = tf.data.Dataset
         logger.info(
-            f"Initialized DatasetLoader with dataset path: {dataset_path} and batch size: {batch_size}"
+            f"Initialized DatasetLoader with dataset path: {dataset_path}, batch size: {batch_size}"
+            f", storage dtype: {self.metadata.dtype}, mode: {mode}"
+            f" and worker {self.worker_index + 1}/{self.num_workers}"
         )
 
     def get_dataset(self) -> tf.data.Dataset:
         """Returns tf.data.Dataset"""
+        dataset = self._create_dataset()
+
+        # Dataset is already partitioned, so distribution strategy must not shard it again
+        if self.num_workers > 1:
+            options = tf.data.Options()
+            options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+            dataset = dataset.with_options(options)
+
+        return dataset
+
+    def _create_dataset(self) -> tf.data.Dataset:
+        if self.metadata.backend == TFRECORD_BACKEND:
+            return self._get_shard_dataset()
+
+        # Packed datasets are read by slicing one memory-mapped file in both modes
+        if self.metadata.backend == PACKED_BACKEND:
+            generator = self._packed_data_generator
+        # Cached images are served by the generator in both modes
+        elif self.cache is not None:
+            generator = self._cached_data_generator
+        elif self.mode == NATIVE_MODE:
+            return self._get_native_dataset()
+        else:
+            generator = self._data_generator
+
         return self._dataset.from_generator(
-            self._data_generator,
-            output_types=(tf.float64, tf.uint8),
+            generator,
+            output_types=(tf.as_dtype(self.metadata.decoded_dtype), tf.uint8),
             output_shapes=(
-                tf.TensorShape([None, HEIGHT, WIDTH]),  # None for partial batch size
+                tf.TensorShape([None, *self.metadata.shape]),  # None for partial batch size
                 tf.TensorShape([None]),
             ),
         )
 
+    def cache_info(self) -> dict:
+        """Returns hit rate and memory and disk footprint of the cache"""
+        if self._epoch_cache is None:
+            return {
+                "location": None,
+                "images": 0,
+                "cached": 0,
+                "hits": 0,
+                "misses": 0,
+                "hit_rate": 0.0,
+                "memory_bytes": 0,
+                "disk_bytes": 0,
+            }
+        return self._epoch_cache.info()
+
+    def verify(self, max_workers=None) -> list[str]:
+        """Checks every image in parallel, quarantines and returns paths of corrupt images"""
+        paths, _ = self._get_data()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            errors = list(executor.map(self._verify_image, paths))
+
+        corrupt = []
+        for path, error in zip(paths, errors):
+            if error is not None:
+                self.quarantine.add(path, error)
+                corrupt.append(path)
+
+        logger.info(f"Verified {len(paths)} images, {len(corrupt)} corrupt")
+        return corrupt
+
     def set_seed(self, seed: int) -> None:
         """Sets random seeds"""
         np.random.seed(seed)
         tf.random.set_seed(seed)
 
+    def _get_shard_dataset(self) -> tf.data.Dataset:
+        """Returns tf.data.Dataset reading shards in parallel"""
+        # Imported here, so npy datasets don't depend on the preprocessing package internals
+        from src.preprocessing.shard_writer import load_shard_index, IMAGE_FEATURE, LABEL_FEATURE
+
+        shard_paths = sorted(shard["path"] for shard in load_shard_index(self.dataset_path))
+
+        # Workers split the shard files, or the records when there are fewer files than workers
+        shard_records = len(shard_paths) < self.num_workers
+        if not shard_records:
+            shard_paths = shard_paths[self.worker_index :: self.num_workers]
+        logger.info(f"Dataset loaded from {len(shard_paths)} shards")
+
+        features = {
+            IMAGE_FEATURE: tf.io.FixedLenFeature([], tf.string),
+            LABEL_FEATURE: tf.io.FixedLenFeature([], tf.int64),
+        }
+
+        def parse(serialized):
+            example = tf.io.parse_single_example(serialized, features)
+            image = self._decode_image(example[IMAGE_FEATURE])
+            return image, tf.cast(example[LABEL_FEATURE], tf.uint8)
+
+        if shard_records:
+            # Records have to come in the same order on all workers to be split between them
+            records = tf.data.TFRecordDataset(shard_paths).shard(self.num_workers, self.worker_index)
+        else:
+            # Shards are shuffled and read in parallel
+            records = (
+                self._dataset.from_tensor_slices(shard_paths)
+                .shuffle(max(len(shard_paths), 1))
+                .interleave(
+                    tf.data.TFRecordDataset,
+                    cycle_length=SHARD_CYCLE_LENGTH,
+                    num_parallel_calls=tf.data.AUTOTUNE,
+                    deterministic=False,
+                )
+            )
+
+        # Records are shuffled within a buffer
+        return (
+            records
+            .map(parse, num_parallel_calls=tf.data.AUTOTUNE)
+            .shuffle(SHARD_SHUFFLE_BUFFER)
+            .batch(self.batch_size)
+            .prefetch(tf.data.AUTOTUNE)
+        )
+
+    def _get_native_dataset(self) -> tf.data.Dataset:
+        """Returns tf.data.Dataset reading and decoding .npy files in parallel"""
+        paths, labels = self._get_data()
+        # Layout of the files is checked on the first readable one, so a dataset the native
+        # mode can't read fails at once instead of skipping all of its images
+        for path in paths:
+            try:
+                header = self._read_npy_header(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Header of {path} can't be read.\n{e}")
+                continue
+            self._check_npy_header(path, *header)
+            break
+
+        def read(path, label):
+            contents = tf.io.read_file(path)
+            version = tf.io.decode_raw(tf.strings.substr(contents, len(NPY_MAGIC), 2), tf.uint8)
+            tf.debugging.Assert(
+                tf.strings.substr(contents, 0, len(NPY_MAGIC)) == NPY_MAGIC
+                and (version[0] == 1 or version[0] == 2)
+                and version[1] == 0,
+                [tf.constant("Not a .npy file of version 1.0 or 2.0:"), path],
+            )
+
+            # Image data starts after the preamble and the header
+            if version[0] == 1:
+                header_length = tf.cast(tf.io.decode_raw(
+                    tf.strings.substr(contents, NPY_HEADER_LENGTH_OFFSET, 2), tf.uint16
+                )[0], tf.int32)
+                offset = NPY_PREAMBLE_LENGTHS[1] + header_length
+            else:
+                header_length = tf.io.decode_raw(
+                    tf.strings.substr(contents, NPY_HEADER_LENGTH_OFFSET, 4), tf.int32
+                )[0]
+                offset = NPY_PREAMBLE_LENGTHS[2] + header_length
+            header = tf.strings.substr(contents, offset - header_length, header_length)
+            tf.debugging.Assert(
+                not tf.strings.regex_full_match(header, ".*'fortran_order': True.*"),
+                [tf.constant("Image is in Fortran order:"), path],
+            )
+
+            image_bytes = tf.strings.substr(contents, offset, tf.strings.length(contents) - offset)
+            return self._decode_image(image_bytes), label
+
+        # Only paths are shuffled, files are read in parallel and batches prefetched
+        return (
+            self._dataset.from_tensor_slices((
+                tf.constant(paths, dtype=tf.string), tf.constant(labels, dtype=tf.uint8)
+            ))
+            .shuffle(max(len(paths), 1))
+            .map(read, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+            # Corrupt samples are skipped, so batches are filled from the next samples
+            .ignore_errors(log_warning=True)
+            .batch(self.batch_size, num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE)
+        )
+
+    @staticmethod
+    def _read_npy_header(path: str) -> tuple[tuple, bool, np.dtype]:
+        """Returns shape, Fortran order and dtype of a .npy file of a version the native mode reads"""
+        with open(path, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version not in NPY_VERSIONS:
+                raise ValueError(f"Version {version} of {path} not supported, use one of {list(NPY_VERSIONS)}")
+            return NPY_VERSIONS[version](f)
+
+    def _check_npy_header(self, path: str, shape: tuple, fortran_order: bool, dtype: np.dtype) -> None:
+        """Raises ValueError if the native mode can't read the .npy file as an image of the dataset"""
+        if fortran_order:
+            raise ValueError(f"Image {path} is in Fortran order, the native mode reads C order")
+        if shape != self.metadata.shape or dtype != np.dtype(self.metadata.dtype):
+            raise ValueError(
+                f"Image {path} has shape {shape} and dtype {dtype}, "
+                f"expected {self.metadata.shape} and {self.metadata.dtype}"
+            )
+
+    def _decode_image(self, image_bytes: tf.Tensor) -> tf.Tensor:
+        """Returns normalized image decoded from raw bytes in the storage dtype"""
+        image = tf.io.decode_raw(image_bytes, tf.as_dtype(self.metadata.dtype))
+        image = tf.reshape(image, self.metadata.shape)
+        image = tf.cast(image, tf.as_dtype(self.metadata.decoded_dtype))
+        if self.metadata.dtype == UINT16:
+            image = image * self.metadata.scale
+        return image
+
     def _get_data(self):
+        """Returns flat list of paths to images of this worker with labels, without quarantined images"""
+        paths, labels = self._skip_quarantined(*self._list_data())
+
+        if self.num_workers == 1:
+            return paths, labels
+
+        # Every worker takes every num_workers-th image of the same sorted list
+        rows = sorted(zip(paths, labels))[self.worker_index :: self.num_workers]
+        logger.info(f"Worker {self.worker_index} reads {len(rows)} of {len(paths)} images")
+
+        return [path for path, _ in rows], [label for _, label in rows]
+
+    def _list_data(self):
         """Returns flat list of paths to nodule and non-nodule images with labels"""
+        if self.manifest:
+            rows = load_manifest(self.dataset_path)
+            logger.info("Dataset loaded from manifest")
+            return [path for path, _ in rows], [int(label == NODULE) for _, label in rows]
+
         nodule_path = os.path.join(self.dataset_path, NODULE)
         non_nodule_path = os.path.join(self.dataset_path, NON_NODULE)
 
@@ -62,6 +336,16 @@ class DatasetLoader:
 
         return paths, labels
 
+    def _skip_quarantined(self, paths, labels):
+        """Returns paths and labels without quarantined images"""
+        if len(self.quarantine) == 0:
+            return paths, labels
+
+        rows = [(path, label) for path, label in zip(paths, labels) if path not in self.quarantine]
+        logger.info(f"Skipped {len(paths) - len(rows)} quarantined images")
+
+        return [path for path, _ in rows], [label for _, label in rows]
+
     def _shuffle(self, paths, labels):
         """Shuffles dataset"""
         paths, labels = np.array(paths), np.array(labels)
@@ -75,42 +359,157 @@ class DatasetLoader:
 
         return paths, labels
 
-    def _load_batch_data(self, paths_batch, labels_batch):
-        """Loads batch of data"""
-        # def load(path: str) -> np.ndarray | None:
-        #    try:
-        #         data = np.load(path)
-        #     except ValueError as e:
-        #        logger.error(f"Error while loading {path}.\n{e}")
-        #         return None
-        #  
-        # batch_data = [(load(path), label) for path, label in zip(paths_batch, labels_batch)]
-        # batch_data = [(data, label) for data, label in batch_data if data is not None]
-        #  
-        # return batch_data
-        return [(np.load(path), label) for path, label in zip(paths_batch, labels_batch)]
-
     def _data_generator(self):
         """Loads and yields batches of data"""
         paths, labels = self._get_data()
 
         paths, labels = self._shuffle(paths, labels)
 
-        for i in range(0, len(paths), self.batch_size):
-            paths_batch = paths[i : i + self.batch_size]
-            labels_batch = labels[i : i + self.batch_size]
-            
+        def read(index, out):
+            # Memory-mapped file is decoded into the batch without a copy on the heap
+            self.metadata.decode(np.load(paths[index], mmap_mode="r"), out=out)
+
+        yield from self._generate_batches(np.arange(len(paths)), paths, labels, read)
+
+    def _generate_batches(self, indices, paths, labels, read):
+        """
+        Yields batches of images read straight into preallocated batch arrays.
+
+        Images that fail to load are quarantined and the batch is filled from the next
+        images, quarantined images are skipped without reading them.
+        """
+        def allocate():
+            return (
+                np.empty((self.batch_size, *self.metadata.shape), dtype=self.metadata.decoded_dtype),
+                np.empty(self.batch_size, dtype=np.uint8),
+            )
+
+        data_batch, labels_batch = allocate()
+        filled = 0
+        for index in indices:
+            if paths[index] in self.quarantine:
+                continue
+
             try:
-                batch_data = self._load_batch_data(paths_batch, labels_batch)
+                read(index, data_batch[filled])
             except Exception as e:
-                logger.error(f"Error while loading batch {i}.\n{e}")
+                logger.error(f"Error while loading {paths[index]}.\n{e}")
+                self.quarantine.add(paths[index], e)
                 continue
 
-            logger.info(f"Batch {i} loaded")
+            labels_batch[filled] = labels[index]
+            filled += 1
 
-            if len(batch_data) == 0:
-                continue
+            if filled == self.batch_size:
+                yield data_batch, labels_batch
+                data_batch, labels_batch = allocate()
+                filled = 0
+
+        # Last partial batch
+        if filled > 0:
+            yield data_batch[:filled], labels_batch[:filled]
+
+    def _verify_image(self, path):
+        """Returns error of a corrupt image, None if it's valid"""
+        try:
+            image = np.load(path, mmap_mode="r")
+            if image.shape != self.metadata.shape:
+                return ValueError(f"Image has shape {image.shape}, expected {self.metadata.shape}")
+            if image.dtype != np.dtype(self.metadata.dtype):
+                return ValueError(f"Image has dtype {image.dtype}, expected {self.metadata.dtype}")
+            if np.issubdtype(image.dtype, np.floating) and not np.isfinite(image).all():
+                return ValueError("Image has non-finite values")
+        except Exception as e:
+            return e
+
+        return None
+
+    def _packed_data_generator(self):
+        """Yields batches sliced from a packed dataset"""
+        # Imported here, so npy datasets don't depend on the preprocessing package internals
+        from src.preprocessing.packed_dataset import load_packed_dataset
+
+        images, _, labels = load_packed_dataset(self.dataset_path)
+        labels = (labels == NODULE).astype(np.uint8)
+        logger.info(f"Dataset of {len(labels)} images loaded from packed file")
+
+        # Shuffling only permutes the indices of this worker
+        indices = np.random.permutation(np.arange(len(labels))[self.worker_index :: self.num_workers])
+
+        for i in range(0, len(indices), self.batch_size):
+            # Sorted indices read the memory-mapped file in one forward pass
+            batch_indices = np.sort(indices[i : i + self.batch_size])
+
+            data_batch = np.empty(
+                (len(batch_indices), *self.metadata.shape), dtype=self.metadata.decoded_dtype
+            )
+            # Runs of consecutive indices are decoded from views of the memory map into the
+            # batch, fancy indexing would copy the stored images first
+            runs = np.split(np.arange(len(batch_indices)), np.flatnonzero(np.diff(batch_indices) != 1) + 1)
+            for run in runs:
+                start, stop = batch_indices[run[0]], batch_indices[run[-1]] + 1
+                self.metadata.decode(images[start:stop], out=data_batch[run[0] : run[-1] + 1])
+
+            yield data_batch, labels[batch_indices]
+
+    def _cached_data_generator(self):
+        """Yields batches of data, images are read from the cache after their first read"""
+        # Imported here, so loaders without cache don't depend on the preprocessing package
+        from src.dataset.epoch_cache import EpochCache
+
+        if self._epoch_cache is None:
+            paths, labels = self._get_data()
+            self._epoch_cache = EpochCache(
+                np.array(paths),
+                np.array(labels, dtype=np.uint8),
+                self.metadata,
+                self._get_cache_location(len(paths)),
+            )
+        epoch_cache = self._epoch_cache
+
+        # Every epoch is shuffled again over the cached images
+        indices = np.random.permutation(len(epoch_cache.paths))
+
+        yield from self._generate_batches(
+            indices, epoch_cache.paths, epoch_cache.labels, epoch_cache.read
+        )
+
+        info = epoch_cache.info()
+        logger.info(
+            f"Epoch cache hit rate: {info['hit_rate']:.1%}, {info['cached']}/{info['images']} images cached"
+            f" in {info['memory_bytes'] / 2**20:.0f} MB memory and {info['disk_bytes'] / 2**20:.0f} MB disk"
+        )
+
+    def _get_cache_location(self, no_images: int) -> str:
+        """Returns "memory" or path to the disk cache directory"""
+        from src.dataset.epoch_cache import MEMORY_CACHE, available_memory
+
+        if self.cache != AUTO_CACHE:
+            return self.cache
+
+        nbytes = no_images * int(np.prod(self.metadata.shape)) * np.dtype(self.metadata.decoded_dtype).itemsize
+        memory = available_memory()
+        if memory is not None and nbytes <= CACHE_MEMORY_FRACTION * memory:
+            return MEMORY_CACHE
+
+        # Snapshot of the partition of every worker of a dataset goes to its own local directory,
+        # so workers on one host don't share it
+        key = f"{os.path.abspath(self.dataset_path)}:{self.num_workers}:{self.worker_index}"
+        name = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(tempfile.gettempdir(), "dataset_cache", name)
+
+    @staticmethod
+    def _get_worker_from_tf_config():
+        """Returns number of workers and index of this worker from TF_CONFIG, None if it's not set"""
+        tf_config = json.loads(os.environ.get("TF_CONFIG", "{}"))
+        cluster = tf_config.get("cluster", {})
+        task = tf_config.get("task", {})
 
-            data_batch, batch_labels = zip(*batch_data)
+        # Chief trains like a worker and comes first
+        chiefs = cluster.get("chief", [])
+        workers = chiefs + cluster.get("worker", [])
+        if len(workers) == 0 or task.get("type") not in ("chief", "worker"):
+            return None, None
 
-            yield np.array(data_batch), np.array(labels_batch)
+        worker_index = task.get("index", 0) + (len(chiefs) if task["type"] == "worker" else 0)
+        return len(workers), worker_index
@@ -0,0 +1,163 @@
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from src.preprocessing.packed_dataset import load_packed_dataset, save_packed_index
+from src.preprocessing.utils import (
+    NODULE,
+    NON_NODULE,
+    NUMPY_EXTENSION,
+    PACKED_IMAGES_FILENAME,
+    PACKED_INDEX_FILENAME,
+    DatasetMetadata,
+)
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MEMORY_CACHE = "memory"
+
+
+class EpochCache:
+    """
+    Cache of decoded images for the epochs of a DatasetLoader.
+
+    Images are cached the first time they are read. The memory cache keeps decoded images in
+    one array in RAM. The disk cache keeps images in the storage dtype in a memory-mapped
+    file in the packed format, once complete it's reused by later runs. Images that fail to
+    load are quarantined by the loader, so they count as done for the completeness of the
+    cache and are dropped from the saved packed dataset.
+
+    Attributes:
+        paths (np.ndarray): Paths to the cached images.
+        labels (np.ndarray): Labels of the cached images.
+        metadata (DatasetMetadata): Storage format of the images.
+        location (str): "memory" or path to the cache directory.
+        hits (int): Number of images read from the cache.
+        misses (int): Number of images read from their files.
+
+    Methods:
+        read: Decodes image into given array, from the cache if it's there.
+        info: Returns hit rate and footprint of the cache.
+    """
+
+    def __init__(
+        self, paths: np.ndarray, labels: np.ndarray, metadata: DatasetMetadata, location: str
+    ):
+        self.paths = paths
+        self.labels = labels
+        self.metadata = metadata
+        self.location = location
+        self.hits = 0
+        self.misses = 0
+        self._images, self._cached = self._create_images()
+        self._failed = np.zeros(len(self.paths), dtype=bool)
+
+    def read(self, index: int, out: np.ndarray) -> None:
+        """Decodes image at index into out, caches it if it was read from its file"""
+        if self._cached[index]:
+            self.hits += 1
+            if self.location == MEMORY_CACHE:
+                np.copyto(out, self._images[index])
+            else:
+                self.metadata.decode(self._images[index], out=out)
+            return
+
+        self.misses += 1
+        try:
+            image = np.load(self.paths[index], mmap_mode="r")
+            self.metadata.decode(image, out=out)
+            self._images[index] = out if self.location == MEMORY_CACHE else image
+            self._cached[index] = True
+        except Exception:
+            self._failed[index] = True
+            raise
+        finally:
+            # Quarantined images aren't read again, so the last read completes the cache also if it fails
+            if self.location != MEMORY_CACHE and (self._cached | self._failed).all():
+                self._save_index()
+
+    def info(self) -> dict:
+        """Returns hit rate and footprint of the cache"""
+        reads = self.hits + self.misses
+        return {
+            "location": self.location,
+            "images": len(self.paths),
+            "cached": int(self._cached.sum()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / reads if reads else 0.0,
+            "memory_bytes": self._images.nbytes if self.location == MEMORY_CACHE else 0,
+            "disk_bytes": self._images.nbytes if self.location != MEMORY_CACHE else 0,
+        }
+
+    def _create_images(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns array of cached images and mask of images already cached"""
+        # Shape comes from the metadata, so an empty split or a corrupt first image don't matter
+        shape = (len(self.paths), *self.metadata.shape)
+
+        if self.location == MEMORY_CACHE:
+            return np.empty(shape, dtype=self.metadata.decoded_dtype), np.zeros(len(self.paths), dtype=bool)
+
+        # Complete disk cache of the same images is reused
+        if os.path.exists(os.path.join(self.location, PACKED_INDEX_FILENAME)):
+            images, uids, labels = load_packed_dataset(self.location)
+            if np.array_equal(uids, self._uids()) and np.array_equal(labels, self._label_names()):
+                logger.info(f"Reusing disk cache {self.location}")
+                return images, np.ones(len(self.paths), dtype=bool)
+            os.remove(os.path.join(self.location, PACKED_INDEX_FILENAME))
+
+        os.makedirs(self.location, exist_ok=True)
+        images = open_memmap(
+            os.path.join(self.location, PACKED_IMAGES_FILENAME),
+            mode="w+",
+            dtype=self.metadata.dtype,
+            shape=shape,
+        )
+        return images, np.zeros(len(self.paths), dtype=bool)
+
+    def _save_index(self) -> None:
+        """Saves index of the complete disk cache, so it's a packed dataset"""
+        self._images.flush()
+        kept = ~self._failed
+        if self._failed.any():
+            self._drop_failed(kept)
+        save_packed_index(self.location, self._uids()[kept], self._label_names()[kept], self.metadata)
+        logger.info(f"Disk cache {self.location} is complete")
+
+    def _drop_failed(self, kept: np.ndarray) -> None:
+        """Replaces the cached images with a copy without images that failed to load"""
+        # Packed images are indexed by their row, so failed rows can't stay in the file
+        images_path = os.path.join(self.location, PACKED_IMAGES_FILENAME)
+        compacted = open_memmap(
+            f"{images_path}.tmp",
+            mode="w+",
+            dtype=self.metadata.dtype,
+            shape=(int(kept.sum()), *self.metadata.shape),
+        )
+        for row, index in enumerate(np.flatnonzero(kept)):
+            compacted[row] = self._images[index]
+        compacted.flush()
+        del compacted
+
+        # Open memory map of this run keeps reading the replaced file
+        os.replace(f"{images_path}.tmp", images_path)
+        logger.info(f"Dropped {int((~kept).sum())} images that failed to load from disk cache {self.location}")
+
+    def _uids(self) -> np.ndarray:
+        return np.array([os.path.basename(path).removesuffix(NUMPY_EXTENSION) for path in self.paths])
+
+    def _label_names(self) -> np.ndarray:
+        return np.where(np.asarray(self.labels) == 1, NODULE, NON_NODULE)
+
+
+def available_memory() -> Optional[int]:
+    """Returns available physical memory in bytes, None if it can't be determined"""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
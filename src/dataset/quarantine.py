@@ -0,0 +1,63 @@
+import os
+import csv
+import logging
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+QUARANTINE_FILENAME = "quarantine.csv"
+
+
+class Quarantine:
+    """
+    Persistent list of images that failed to load.
+
+    Quarantined images are saved with the error to a CSV file next to the data, so later
+    epochs and runs skip them without opening them again. Delete the file to retry them.
+
+    Attributes:
+        path (str): The path to the quarantine file.
+
+    Methods:
+        add: Quarantines an image.
+        paths: Returns set of quarantined image paths.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._paths = None
+
+    def __contains__(self, image_path: str) -> bool:
+        return image_path in self.paths()
+
+    def __len__(self) -> int:
+        return len(self.paths())
+
+    def paths(self) -> set[str]:
+        """Returns quarantined image paths, loaded once"""
+        if self._paths is None:
+            self._paths = set()
+            if os.path.exists(self.path):
+                with open(self.path, newline="") as f:
+                    self._paths = {row["path"] for row in csv.DictReader(f)}
+        return self._paths
+
+    def add(self, image_path: str, error: Exception) -> None:
+        """Saves image path with the error, it's skipped from now on"""
+        if image_path in self:
+            return
+
+        new_file = not os.path.exists(self.path)
+        try:
+            with open(self.path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["path", "error", "quarantined_at"])
+                writer.writerow([image_path, str(error), datetime.now().isoformat()])
+        except OSError as e:
+            logger.error(f"Couldn't save {image_path} to quarantine {self.path}.\n{e}")
+
+        self._paths.add(image_path)
+        logger.warning(f"Quarantined {image_path}: {error}")
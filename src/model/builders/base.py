@@ -3,13 +3,23 @@ Module for the base class of model builders
 """
 import logging
 from abc import ABC, abstractmethod
+from typing import Optional
 
 import tensorflow as tf
 
+from src.model.builders.single_channel import fold_single_channel
+from src.model.weights import WeightStore
+from src.preprocessing.utils import HEIGHT, WIDTH, CHANNELS, CONTEXT_CHANNELS
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+FLOAT32_PRECISION = "float32"
+MIXED_FLOAT16_PRECISION = "mixed_float16"
+MIXED_BFLOAT16_PRECISION = "mixed_bfloat16"
+PRECISION_POLICIES = [FLOAT32_PRECISION, MIXED_FLOAT16_PRECISION, MIXED_BFLOAT16_PRECISION]
+
 
 class ModelBuilderError(Exception):
     """Base class for exceptions in this module"""
@@ -17,12 +27,41 @@ class ModelBuilderError(Exception):
 
 
 class ModelBuilder(ABC):
-    """Base class for model builders"""
-
-    def __init__(self):
+    """
+    Base class for model builders
+
+    Layers are created with the precision policy that is global when they are set. ModelDirector
+    sets the policy of the builder for the building steps, so the precision applies to all layers.
+    Pretrained weights of base models are loaded from the weight store if they're stored there.
+    Single-channel builders fold the greyscale to RGB conversion and the input preprocessing
+    into the first convolution of the base model, so it takes slices directly. The input size
+    is the size of slices fed to the model, slices resized in preprocessing to the input shape
+    of the base model aren't resized again. Stacks of neighbouring slices have 3 channels, they
+    feed the RGB channels of the base model instead of copies of one slice.
+    """
+
+    def __init__(
+        self,
+        precision: Optional[str] = None,
+        weight_store: Optional[WeightStore] = None,
+        single_channel: bool = False,
+        input_size: tuple[int, int] = (HEIGHT, WIDTH),
+        channels: int = CHANNELS,
+    ):
+        check_precision(precision)
+        if channels not in (CHANNELS, CONTEXT_CHANNELS):
+            raise ModelBuilderError(f"Channels must be {CHANNELS} or {CONTEXT_CHANNELS}, got {channels}")
+        if single_channel and channels != CHANNELS:
+            raise ModelBuilderError("Single-channel base models take slices with one channel")
+        self.precision = precision
+        self.weight_store = weight_store or WeightStore()
+        self.single_channel = single_channel
+        self.input_size = tuple(input_size)
+        self.channels = channels
         self.preprocessing_layers = None
         self.model_layers = None
         self.output_layers = None
+        self.input_cast_layer = None
         self.__model = None
 
     @abstractmethod
@@ -37,6 +76,7 @@ class ModelBuilder(ABC):
         self.preprocessing_layers = None
         self.model_layers = None
         self.output_layers = None
+        self.input_cast_layer = None
 
     @property
     def model(self):
@@ -48,6 +88,44 @@ class ModelBuilder(ABC):
         """Sets the built model"""
         self.__model = model
 
+    def pretrained_weights(self) -> str:
+        """Returns path to the stored weights of the base model, "imagenet" if they aren't stored"""
+        return self.weight_store.resolve(str(self))
+
+    def create_preprocessing_layers(self, input_shape: tuple, preprocess_input) -> tf.keras.Sequential:
+        """
+        Returns layers resizing slices to the input shape of the base model.
+
+        Slices are resized before they're converted to RGB and preprocessed, so the resizing runs
+        on one channel. Both are skipped for single-channel base models and the resizing is
+        skipped for slices that already have the input shape. Stacks of neighbouring slices
+        already have 3 channels, so they're only preprocessed.
+        """
+        layers = [tf.keras.layers.Reshape(target_shape=(*self.input_size, self.channels))]
+
+        if self.input_size != tuple(input_shape[:2]):
+            layers.append(tf.keras.layers.Resizing(height=input_shape[0], width=input_shape[1]))
+
+        if not self.single_channel:
+            if self.channels == CHANNELS:
+                layers.append(tf.keras.layers.Lambda(tf.image.grayscale_to_rgb))
+            layers.append(tf.keras.layers.Lambda(preprocess_input, input_shape=input_shape))
+
+        return tf.keras.Sequential(layers)
+
+    def create_base_model(self, application, input_shape: tuple, preprocess_input) -> tf.keras.Model:
+        """Returns frozen pretrained Keras application without top, single-channel if set"""
+        base_model = application(
+            input_shape=input_shape, include_top=False, weights=self.pretrained_weights()
+        )
+
+        if self.single_channel:
+            base_model = fold_single_channel(base_model, preprocess_input)
+
+        base_model.trainable = False
+
+        return base_model
+
     @abstractmethod
     def set_preprocessing_layers(self) -> None:
         """Sets the preprocessing layers of the model"""
@@ -71,6 +149,20 @@ class ModelBuilder(ABC):
         if not all(layers):
             raise ModelBuilderError("Not all layers are set")
 
+        # Input is cast once to the compute dtype, output layers of builders compute in float32.
+        # Linear activation is identity, Keras casts its input to the compute dtype of the policy
+        policy = tf.keras.mixed_precision.global_policy()
+        self.input_cast_layer = None
+        if policy.compute_dtype != "float32":
+            self.input_cast_layer = tf.keras.layers.Activation("linear", dtype=policy, name="input_cast")
+            layers.insert(0, self.input_cast_layer)
+
         self.model = tf.keras.Sequential(layers)
 
         return self.model
+
+
+def check_precision(precision: Optional[str]) -> None:
+    """Raises ModelBuilderError if precision isn't a supported precision policy"""
+    if precision is not None and precision not in PRECISION_POLICIES:
+        raise ModelBuilderError(f"Precision must be one of {PRECISION_POLICIES}, got {precision}")
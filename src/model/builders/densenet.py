@@ -6,7 +6,6 @@ import logging
 import tensorflow as tf
 
 from src.model.builders import ModelBuilder
-from src.preprocessing.utils import HEIGHT, WIDTH
 
 DENSENET_INPUT_SHAPE = (224, 224, 3)
 DENSENET_DENSE_UNITS = 128
@@ -26,39 +25,16 @@ class DenseNetBuilder(ModelBuilder):
 
     def set_preprocessing_layers(self):
         """Sets the preprocessing layers for the DenseNet model"""
-        reshape_layer = tf.keras.layers.Reshape(target_shape=(HEIGHT, WIDTH, 1))
-
-        greyscale_layer = tf.keras.layers.Lambda(tf.image.grayscale_to_rgb)
-
-        resize_layer = tf.keras.layers.Resizing(
-            height=DENSENET_INPUT_SHAPE[0], width=DENSENET_INPUT_SHAPE[1]
-        )
-
-        preprocess_input = tf.keras.applications.densenet.preprocess_input
-
-        preprocess_input_layer = tf.keras.layers.Lambda(
-            preprocess_input, input_shape=DENSENET_INPUT_SHAPE
-        )
-
-        self.preprocessing_layers = tf.keras.Sequential(
-            [
-                reshape_layer,
-                greyscale_layer,
-                resize_layer,
-                preprocess_input_layer,
-            ]
+        self.preprocessing_layers = self.create_preprocessing_layers(
+            DENSENET_INPUT_SHAPE, tf.keras.applications.densenet.preprocess_input
         )
         logger.info("DenseNet preprocessing layers set")
 
     def set_model_layers(self):
         """Sets the model layers for the DenseNet model"""
-        base_model = tf.keras.applications.densenet.DenseNet121(  
-            input_shape=DENSENET_INPUT_SHAPE, include_top=False, weights="imagenet"
+        self.model_layers = self.create_base_model(
+            tf.keras.applications.densenet.DenseNet121, DENSENET_INPUT_SHAPE, tf.keras.applications.densenet.preprocess_input
         )
-
-        base_model.trainable = False
-
-        self.model_layers = base_model
         logger.info("DenseNet model layers set")
 
     def set_output_layers(self):
@@ -72,7 +48,7 @@ class DenseNetBuilder(ModelBuilder):
         dropout_layer = tf.keras.layers.Dropout(rate=DENSENET_DROPOUT_RATE)
 
         output_layer = tf.keras.layers.Dense(
-            1, activation=DENSENET_OUTPUT_ACTIVATION
+            1, activation=DENSENET_OUTPUT_ACTIVATION, dtype="float32"
         )
 
         self.output_layers = tf.keras.Sequential(
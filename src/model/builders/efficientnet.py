@@ -6,7 +6,6 @@ import logging
 import tensorflow as tf
 
 from src.model.builders import ModelBuilder
-from src.preprocessing.utils import HEIGHT, WIDTH
 
 
 EFFICIENTNET_INPUT_SHAPE = (224, 224, 3)
@@ -28,39 +27,16 @@ class EfficientNetBuilder(ModelBuilder):
 
     def set_preprocessing_layers(self):
         """Sets the preprocessing layers for the EfficientNet model"""
-        reshape_layer = tf.keras.layers.Reshape(target_shape=(HEIGHT, WIDTH, 1))
-
-        greyscale_layer = tf.keras.layers.Lambda(tf.image.grayscale_to_rgb)
-
-        resize_layer = tf.keras.layers.Resizing(
-            height=EFFICIENTNET_INPUT_SHAPE[0], width=EFFICIENTNET_INPUT_SHAPE[1]
-        )
-
-        preprocess_input = tf.keras.applications.efficientnet.preprocess_input
-
-        preprocess_input_layer = tf.keras.layers.Lambda(
-            preprocess_input, input_shape=EFFICIENTNET_INPUT_SHAPE
-        )
-
-        self.preprocessing_layers = tf.keras.Sequential(
-            [
-                reshape_layer,
-                greyscale_layer,
-                resize_layer,
-                preprocess_input_layer,
-            ]
+        self.preprocessing_layers = self.create_preprocessing_layers(
+            EFFICIENTNET_INPUT_SHAPE, tf.keras.applications.efficientnet.preprocess_input
         )
         logger.info("EfficientNet preprocessing layers set")
 
     def set_model_layers(self):
         """Sets the model layers for the EfficientNet model"""
-        base_model = tf.keras.applications.EfficientNetB0(
-            input_shape=EFFICIENTNET_INPUT_SHAPE, include_top=False, weights="imagenet"
+        self.model_layers = self.create_base_model(
+            tf.keras.applications.EfficientNetB0, EFFICIENTNET_INPUT_SHAPE, tf.keras.applications.efficientnet.preprocess_input
         )
-
-        base_model.trainable = False
-
-        self.model_layers = base_model
         logger.info("EfficientNet model layers set")
 
     def set_output_layers(self):
@@ -74,7 +50,7 @@ class EfficientNetBuilder(ModelBuilder):
         dropout_layer = tf.keras.layers.Dropout(rate=EFFICIENTNET_DROPOUT_RATE)
 
         output_layer = tf.keras.layers.Dense(
-            1, activation=EFFICIENTNET_OUTPUT_ACTIVATION
+            1, activation=EFFICIENTNET_OUTPUT_ACTIVATION, dtype="float32"
         )
 
         self.output_layers = tf.keras.Sequential(
@@ -6,7 +6,6 @@ import logging
 import tensorflow as tf
 
 from src.model.builders import ModelBuilder
-from src.preprocessing.utils import HEIGHT, WIDTH
 
 
 MOBILENET_INPUT_SHAPE = (224, 224, 3)
@@ -27,43 +26,16 @@ class MobileNetBuilder(ModelBuilder):
 
     def set_preprocessing_layers(self):
         """Sets the preprocessing layers for the MobileNet model"""
-        reshape_layer = tf.keras.layers.Reshape(
-            target_shape=(HEIGHT, WIDTH, 1)
-        )
-
-        greyscale_layer = tf.keras.layers.Lambda(
-           tf.image.grayscale_to_rgb
-        )
-
-        resize_layer = tf.keras.layers.Resizing(
-            height=MOBILENET_INPUT_SHAPE[0], width=MOBILENET_INPUT_SHAPE[1]
-        )
-
-        preprocess_input = tf.keras.applications.mobilenet_v3.preprocess_input
-
-        preprocess_input_layer = tf.keras.layers.Lambda(
-            preprocess_input, input_shape=MOBILENET_INPUT_SHAPE
-        )
-
-        self.preprocessing_layers = tf.keras.Sequential(
-            [
-                reshape_layer,
-                greyscale_layer,
-                resize_layer,
-                preprocess_input_layer,
-            ]
+        self.preprocessing_layers = self.create_preprocessing_layers(
+            MOBILENET_INPUT_SHAPE, tf.keras.applications.mobilenet_v3.preprocess_input
         )
         logger.info("MobileNet preprocessing layers set")
 
     def set_model_layers(self):
         """Sets the model layers for the MobileNet model"""
-        base_model = tf.keras.applications.MobileNetV3Small(
-            input_shape=MOBILENET_INPUT_SHAPE, include_top=False, weights="imagenet"
+        self.model_layers = self.create_base_model(
+            tf.keras.applications.MobileNetV3Small, MOBILENET_INPUT_SHAPE, tf.keras.applications.mobilenet_v3.preprocess_input
         )
-
-        base_model.trainable = False
-
-        self.model_layers = base_model
         logger.info("MobileNet model layers set")
 
     def set_output_layers(self):
@@ -76,7 +48,7 @@ class MobileNetBuilder(ModelBuilder):
 
         dropout_layer = tf.keras.layers.Dropout(rate=MOBILENET_DROPOUT_RATE)
 
-        output_layer = tf.keras.layers.Dense(1, activation=MOBILENET_OUTPUT_ACTIVATION)
+        output_layer = tf.keras.layers.Dense(1, activation=MOBILENET_OUTPUT_ACTIVATION, dtype="float32")
 
         self.output_layers = tf.keras.Sequential(
             [pooling_layer, dense_layer, dropout_layer, output_layer]
@@ -6,7 +6,6 @@ import logging
 import tensorflow as tf
 
 from src.model.builders import ModelBuilder
-from src.preprocessing.utils import HEIGHT, WIDTH
 
 RESNET_INPUT_SHAPE = (224, 224, 3)
 RESNET_DENSE_UNITS = 128
@@ -26,39 +25,16 @@ class ResNetBuilder(ModelBuilder):
 
     def set_preprocessing_layers(self):
         """Sets the preprocessing layers for the ResNet model"""
-        reshape_layer = tf.keras.layers.Reshape(target_shape=(HEIGHT, WIDTH, 1))
-
-        greyscale_layer = tf.keras.layers.Lambda(tf.image.grayscale_to_rgb)
-
-        resize_layer = tf.keras.layers.Resizing(
-            height=RESNET_INPUT_SHAPE[0], width=RESNET_INPUT_SHAPE[1]
-        )
-
-        preprocess_input = tf.keras.applications.resnet.preprocess_input
-
-        preprocess_input_layer = tf.keras.layers.Lambda(
-            preprocess_input, input_shape=RESNET_INPUT_SHAPE
-        )
-
-        self.preprocessing_layers = tf.keras.Sequential(
-            [
-                reshape_layer,
-                greyscale_layer,
-                resize_layer,
-                preprocess_input_layer,
-            ]
+        self.preprocessing_layers = self.create_preprocessing_layers(
+            RESNET_INPUT_SHAPE, tf.keras.applications.resnet.preprocess_input
         )
         logger.info("ResNet preprocessing layers set")
 
     def set_model_layers(self):
         """Sets the model layers for the ResNet model"""
-        base_model = tf.keras.applications.resnet.ResNet50(  
-            input_shape=RESNET_INPUT_SHAPE, include_top=False, weights="imagenet"
+        self.model_layers = self.create_base_model(
+            tf.keras.applications.resnet.ResNet50, RESNET_INPUT_SHAPE, tf.keras.applications.resnet.preprocess_input
         )
-
-        base_model.trainable = False
-
-        self.model_layers = base_model
         logger.info("ResNet model layers set")
 
     def set_output_layers(self):
@@ -72,7 +48,7 @@ class ResNetBuilder(ModelBuilder):
         dropout_layer = tf.keras.layers.Dropout(rate=RESNET_DROPOUT_RATE)
 
         output_layer = tf.keras.layers.Dense(
-            1, activation=RESNET_OUTPUT_ACTIVATION
+            1, activation=RESNET_OUTPUT_ACTIVATION, dtype="float32"
         )
 
         self.output_layers = tf.keras.Sequential(
@@ -0,0 +1,109 @@
+"""
+Module for folding greyscale to RGB conversion and input preprocessing into base models
+"""
+import logging
+
+import numpy as np
+import tensorflow as tf
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Layers of base models between the input and the first convolution
+INPUT_LAYERS = (tf.keras.layers.Rescaling, tf.keras.layers.Normalization, tf.keras.layers.ZeroPadding2D)
+
+
+@tf.keras.utils.register_keras_serializable(package="lung_cancer_detection")
+class OffsetMap(tf.keras.layers.Layer):
+    """Layer adding a constant map, the response of the first convolution to the input offset"""
+
+    def build(self, input_shape):
+        self.offset_map = self.add_weight(
+            name="offset_map", shape=tuple(input_shape[1:]), initializer="zeros", trainable=False
+        )
+        super().build(input_shape)
+
+    def call(self, inputs):
+        return inputs + tf.cast(self.offset_map, inputs.dtype)
+
+
+def fold_single_channel(base_model: tf.keras.Model, preprocess_input) -> tf.keras.Model:
+    """
+    Returns base model taking single-channel input with the same pretrained features.
+
+    Greyscale slices tripled into RGB and preprocessed reach the first convolution as
+    scale[c] * x + offset[c] in every channel c, as preprocess_input and the preprocessing
+    layers of base models are affine per channel. The kernel of the first convolution is
+    summed over its input channels weighted by the scale. The response to the offset doesn't
+    depend on the input, but it does on the zero padding at the borders, so it's added as
+    a constant map before the activation of the convolution.
+    """
+    layers = base_model.layers[1:]
+    first = 0
+    while isinstance(layers[first], INPUT_LAYERS):
+        first += 1
+    input_layers, stem = layers[:first], layers[first]
+    padding_layers = [layer for layer in input_layers if isinstance(layer, tf.keras.layers.ZeroPadding2D)]
+
+    # The stem of ConvNeXt is a nested model starting with the convolution
+    stem_layers = stem.layers if isinstance(stem, tf.keras.Sequential) else [stem]
+    conv, stem_layers = stem_layers[0], stem_layers[1:]
+    if not isinstance(conv, tf.keras.layers.Conv2D):
+        raise ValueError(f"First layer {conv.name} of {base_model.name} isn't a convolution")
+
+    scale, offset = _input_affine(base_model.input_shape[1:], preprocess_input, input_layers)
+    kernel, *bias = conv.get_weights()
+    folded_kernel = np.einsum("hwcf,c->hwf", kernel, scale)[:, :, np.newaxis, :]
+
+    # Offset of the input is zero in the padding, like the input itself
+    mask = tf.ones((1, *base_model.input_shape[1:3], 1))
+    for layer in padding_layers:
+        mask = layer(mask)
+    offset_input = tf.cast(mask, tf.float32) * tf.constant(offset, dtype=tf.float32)
+    offset_map = conv.convolution_op(offset_input, tf.constant(kernel, dtype=tf.float32))[0]
+
+    inputs = tf.keras.Input(shape=(*base_model.input_shape[1:3], 1))
+    x = inputs
+    for layer in padding_layers:
+        x = layer(x)
+
+    # Offset map is added before the activation of the convolution
+    folded_conv = tf.keras.layers.Conv2D.from_config({**conv.get_config(), "activation": "linear"})
+    offset_map_layer = OffsetMap(name=f"{conv.name}_offset_map")
+    x = offset_map_layer(folded_conv(x))
+    folded_conv.set_weights([folded_kernel, *bias])
+    offset_map_layer.set_weights([offset_map.numpy()])
+    if conv.activation is not tf.keras.activations.linear:
+        x = tf.keras.layers.Activation(conv.activation, name=f"{conv.name}_activation")(x)
+
+    for layer in stem_layers:
+        x = layer(x)
+
+    # Rest of the base model reuses its layers and their pretrained weights
+    tail = tf.keras.Model(stem.inbound_nodes[0].output_tensors, base_model.output)
+    outputs = tail(x)
+
+    logger.info(f"Folded single-channel input into {conv.name} of {base_model.name}")
+    return tf.keras.Model(inputs, outputs, name=base_model.name)
+
+
+def _input_affine(input_shape: tuple, preprocess_input, layers: list) -> tuple[np.ndarray, np.ndarray]:
+    """Returns per channel scale and offset of greyscale input on its way to the first convolution"""
+    x = np.broadcast_to(np.array([0.0, 1.0], dtype=np.float32)[:, None, None, None], (2, *input_shape))
+    preprocessed = np.asarray(preprocess_input(x.copy()), dtype=np.float64)[:, 0, 0, :]
+    offset = preprocessed[0]
+    scale = preprocessed[1] - preprocessed[0]
+
+    for layer in layers:
+        if isinstance(layer, tf.keras.layers.Rescaling):
+            scale = scale * np.asarray(layer.scale)
+            offset = offset * np.asarray(layer.scale) + np.asarray(layer.offset)
+        elif isinstance(layer, tf.keras.layers.Normalization):
+            mean = np.asarray(layer.mean, dtype=np.float64).reshape(-1)
+            variance = np.asarray(layer.variance, dtype=np.float64).reshape(-1)
+            std = np.maximum(np.sqrt(variance), tf.keras.backend.epsilon())
+            scale = scale / std
+            offset = (offset - mean) / std
+
+    return scale, offset
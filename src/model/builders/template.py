@@ -6,7 +6,6 @@ import logging
 import tensorflow as tf
 
 from src.model.builders import ModelBuilder
-from src.preprocessing.utils import HEIGHT, WIDTH
 
 # TODO: Change the following constants
 TEMPLATE_INPUT_SHAPE = (224, 224, 3)
@@ -28,42 +27,21 @@ class TEMPLATEBuilder(ModelBuilder):
 
     def set_preprocessing_layers(self):
         """Sets the preprocessing layers for the TEMPLATE model"""
-        reshape_layer = tf.keras.layers.Reshape(target_shape=(HEIGHT, WIDTH, 1))
-
-        greyscale_layer = tf.keras.layers.Lambda(tf.image.grayscale_to_rgb)
-
-        resize_layer = tf.keras.layers.Resizing(
-            height=TEMPLATE_INPUT_SHAPE[0], width=TEMPLATE_INPUT_SHAPE[1]
-        )
-
         # TODO: Change the following preprocess_input function
-        preprocess_input = tf.keras.applications.TEMPLATE.preprocess_input
-
-        preprocess_input_layer = tf.keras.layers.Lambda(
-            preprocess_input, input_shape=TEMPLATE_INPUT_SHAPE
-        )
-
-        self.preprocessing_layers = tf.keras.Sequential(
-            [
-                reshape_layer,
-                greyscale_layer,
-                resize_layer,
-                preprocess_input_layer,
-            ]
+        self.preprocessing_layers = self.create_preprocessing_layers(
+            TEMPLATE_INPUT_SHAPE, tf.keras.applications.TEMPLATE.preprocess_input
         )
         # TODO: Change the following log message
         logger.info("TEMPLATE preprocessing layers set")
 
     def set_model_layers(self):
         """Sets the model layers for the TEMPLATE model"""  # TODO: Change the docstring
-        # TODO: Change the following base_model
-        base_model = tf.keras.applications.TEMPLATE.TEMPLATE(  
-            input_shape=TEMPLATE_INPUT_SHAPE, include_top=False, weights="imagenet"
+        # TODO: Change the following application and preprocess_input function
+        self.model_layers = self.create_base_model(
+            tf.keras.applications.TEMPLATE.TEMPLATE,
+            TEMPLATE_INPUT_SHAPE,
+            tf.keras.applications.TEMPLATE.preprocess_input,
         )
-
-        base_model.trainable = False
-
-        self.model_layers = base_model
         logger.info("TEMPLATE model layers set")  # TODO: Change the log message
 
     def set_output_layers(self):
@@ -77,7 +55,7 @@ class TEMPLATEBuilder(ModelBuilder):
         dropout_layer = tf.keras.layers.Dropout(rate=TEMPLATE_DROPOUT_RATE)
 
         output_layer = tf.keras.layers.Dense(
-            1, activation=TEMPLATE_OUTPUT_ACTIVATION
+            1, activation=TEMPLATE_OUTPUT_ACTIVATION, dtype="float32"
         )
 
         self.output_layers = tf.keras.Sequential(
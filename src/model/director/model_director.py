@@ -2,9 +2,13 @@
 Module for the ModelDirector class
 """
 import logging
+from typing import Optional
+
+import tensorflow as tf
 
 from src.model.director.base import BaseModelDirector
 from src.model.builders import ModelBuilder
+from src.model.builders.base import check_precision
 
 
 logger = logging.getLogger(__name__)
@@ -13,13 +17,29 @@ logger.setLevel(logging.INFO)
 
 class ModelDirector(BaseModelDirector):
     """Director class for model builders."""
-    def make(self):
-        """Builds and returns the built model."""
-        self._builder.reset()
-        self._builder.set_preprocessing_layers()
-        self._builder.set_model_layers()
-        self._builder.set_output_layers()
-        return self._builder.build()
+    def make(self, precision: Optional[str] = None):
+        """
+        Builds and returns the built model.
+
+        Layers are built with the precision policy, the precision of the builder by default.
+        The global policy is restored afterwards.
+        """
+        precision = precision or self._builder.precision
+        check_precision(precision)
+
+        previous_policy = tf.keras.mixed_precision.global_policy()
+        if precision is not None:
+            tf.keras.mixed_precision.set_global_policy(precision)
+            logger.info(f"Building {str(self._builder)} with {precision} precision")
+
+        try:
+            self._builder.reset()
+            self._builder.set_preprocessing_layers()
+            self._builder.set_model_layers()
+            self._builder.set_output_layers()
+            return self._builder.build()
+        finally:
+            tf.keras.mixed_precision.set_global_policy(previous_policy)
 
     @property
     def builder(self):
@@ -0,0 +1,23 @@
+"""
+Module with execution modes of model training
+"""
+EAGER_EXECUTION = "eager"
+GRAPH_EXECUTION = "graph"
+XLA_EXECUTION = "xla"
+EXECUTION_MODES = [EAGER_EXECUTION, GRAPH_EXECUTION, XLA_EXECUTION]
+
+
+def get_compile_options(execution: str = GRAPH_EXECUTION) -> dict:
+    """
+    Returns keyword arguments of Model.compile for the execution mode.
+
+    Eager mode runs every step op by op in Python, which is slow but easy to debug. Graph mode
+    traces steps into a tf.function and XLA mode additionally compiles them with XLA.
+    """
+    if execution not in EXECUTION_MODES:
+        raise ValueError(f"Execution mode {execution} not supported, use one of {EXECUTION_MODES}")
+
+    return {
+        "run_eagerly": execution == EAGER_EXECUTION,
+        "jit_compile": execution == XLA_EXECUTION,
+    }
@@ -0,0 +1,81 @@
+"""
+Module for the FeatureExtractor class
+"""
+import os
+import logging
+
+import numpy as np
+import tensorflow as tf
+
+from src.model.builders import ModelBuilder
+from src.model.builders.base import ModelBuilderError
+
+
+FEATURES_FILENAME = "features.npy"
+LABELS_FILENAME = "labels.npy"
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class FeatureExtractor:
+    """
+    Extractor of frozen backbone features for training of model heads.
+
+    The preprocessing layers, the frozen base model and the pooling layer of a built model
+    run once per slice and the pooled embeddings are saved to disk. The head, the output
+    layers after pooling, is then trained on the saved embeddings. The head shares its
+    layers with the built model, so the model is trained together with the head.
+    """
+
+    def __init__(self, builder: ModelBuilder):
+        layers = [builder.preprocessing_layers, builder.model_layers, builder.output_layers]
+        if not all(layers):
+            raise ModelBuilderError("Not all layers are set")
+
+        if builder.model_layers.trainable:
+            logger.warning(f"Base model of {str(builder)} is trainable, extracted features will go stale")
+
+        # Embeddings are computed with the input cast of the built model, if it has one
+        pooling_layer, *head_layers = builder.output_layers.layers
+        input_layers = [builder.input_cast_layer] if builder.input_cast_layer is not None else []
+        self.embedding_model = tf.keras.Sequential(
+            [*input_layers, builder.preprocessing_layers, builder.model_layers, pooling_layer]
+        )
+        self.head = tf.keras.Sequential(head_layers)
+        logger.info(f"Initialized FeatureExtractor with {str(builder)}")
+
+    def extract(self, dataset: tf.data.Dataset, path: str) -> None:
+        """Saves embeddings and labels of all batches of the dataset to path"""
+        embed = tf.function(lambda x: self.embedding_model(x, training=False))
+
+        features, labels = [], []
+        for x, y in dataset:
+            features.append(embed(x).numpy())
+            labels.append(y.numpy())
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, FEATURES_FILENAME), np.concatenate(features).astype(np.float32))
+        np.save(os.path.join(path, LABELS_FILENAME), np.concatenate(labels))
+        logger.info(f"Extracted features of {sum(len(batch) for batch in labels)} slices to {path}")
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """Returns whether features were already extracted to path"""
+        return all(
+            os.path.exists(os.path.join(path, filename))
+            for filename in [FEATURES_FILENAME, LABELS_FILENAME]
+        )
+
+    @staticmethod
+    def load(path: str, batch_size: int = 32, shuffle: bool = True) -> tf.data.Dataset:
+        """Returns dataset of saved embeddings and labels"""
+        features = np.load(os.path.join(path, FEATURES_FILENAME))
+        labels = np.load(os.path.join(path, LABELS_FILENAME))
+
+        dataset = tf.data.Dataset.from_tensor_slices((features, labels))
+        if shuffle:
+            dataset = dataset.shuffle(len(labels), reshuffle_each_iteration=True)
+
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
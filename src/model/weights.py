@@ -0,0 +1,122 @@
+"""
+Module for the WeightStore class
+"""
+import os
+import json
+import hashlib
+import logging
+from typing import Optional
+
+import tensorflow as tf
+
+
+WEIGHTS_DIR_ENV = "MODEL_WEIGHTS_DIR"
+WEIGHTS_MANIFEST_FILENAME = "manifest.json"
+WEIGHTS_EXTENSION = ".h5"
+IMAGENET_WEIGHTS = "imagenet"
+CHECKSUM_CHUNK_SIZE = 1 << 20
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class WeightStoreError(Exception):
+    """Base class for exceptions in this module"""
+    ...
+
+
+class WeightStore:
+    """
+    Local store of pretrained weights of base models.
+
+    Weights are saved as one file per model with their sha256 checksums in manifest.json,
+    so builders load them from disk instead of downloading them. The directory is taken from
+    the MODEL_WEIGHTS_DIR environment variable if it isn't given.
+
+    Attributes:
+        path (str): The path to the store directory, None if the store isn't configured.
+
+    Methods:
+        resolve: Returns weights argument of a Keras application for a model.
+        save: Saves weights of a base model to the store.
+        contains: Returns whether weights of a model are stored.
+        remove: Removes weights of a model from the store.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get(WEIGHTS_DIR_ENV)
+
+    def resolve(self, name: str) -> str:
+        """
+        Returns path to the stored weights of the model, verified against their checksum.
+
+        Falls back to "imagenet", which downloads the weights, if they aren't stored.
+        """
+        if not self.contains(name):
+            if self.path is not None:
+                logger.warning(f"Weights of {name} aren't stored in {self.path}, downloading them")
+            return IMAGENET_WEIGHTS
+
+        entry = self._load_manifest()[name]
+        weights_path = os.path.join(self.path, entry["filename"])
+        if _sha256(weights_path) != entry["sha256"]:
+            raise WeightStoreError(f"Checksum of {weights_path} doesn't match the manifest")
+
+        logger.info(f"Resolved weights of {name} to {weights_path}")
+        return weights_path
+
+    def contains(self, name: str) -> bool:
+        """Returns whether weights of the model are stored"""
+        if self.path is None:
+            return False
+        entry = self._load_manifest().get(name)
+        return entry is not None and os.path.exists(os.path.join(self.path, entry["filename"]))
+
+    def save(self, name: str, model: tf.keras.Model) -> str:
+        """Saves weights of the model with their checksum, returns path to the weights"""
+        if self.path is None:
+            raise WeightStoreError(f"Store directory isn't set, set {WEIGHTS_DIR_ENV} or pass path")
+
+        os.makedirs(self.path, exist_ok=True)
+        filename = f"{name.lower()}{WEIGHTS_EXTENSION}"
+        weights_path = os.path.join(self.path, filename)
+        model.save_weights(weights_path)
+
+        manifest = self._load_manifest()
+        manifest[name] = {"filename": filename, "sha256": _sha256(weights_path)}
+        self._save_manifest(manifest)
+
+        logger.info(f"Saved weights of {name} to {weights_path}")
+        return weights_path
+
+    def remove(self, name: str) -> None:
+        """Removes weights of the model, so they're downloaded again"""
+        if not self.contains(name):
+            return
+
+        manifest = self._load_manifest()
+        os.remove(os.path.join(self.path, manifest.pop(name)["filename"]))
+        self._save_manifest(manifest)
+        logger.info(f"Removed weights of {name} from {self.path}")
+
+    def _save_manifest(self, manifest: dict) -> None:
+        temp_path = os.path.join(self.path, f"{WEIGHTS_MANIFEST_FILENAME}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temp_path, os.path.join(self.path, WEIGHTS_MANIFEST_FILENAME))
+
+    def _load_manifest(self) -> dict:
+        manifest_path = os.path.join(self.path, WEIGHTS_MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path) as f:
+            return json.load(f)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
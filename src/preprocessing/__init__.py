@@ -1,4 +1,6 @@
 from .base import BaseProcessor
+from .annotation_index import AnnotationIndex
 from .annotation_processor import AnnotationProcessor
 from .dicom_processor import DicomProcessor
+from .series_processor import SeriesProcessor
 from .dataset_processor import DatasetProcessor
@@ -0,0 +1,64 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import numpy as np
+
+from src.preprocessing.utils import *
+
+
+class AnnotationIndex:
+    """
+    Sorted z position index of the processed annotations of one series.
+
+    The index is built once per series. Annotations and their polygons are grouped by z position,
+    so matching a slice to its annotations is a binary search with tolerance instead of a scan
+    over all annotations with exact float comparison.
+
+    Attributes:
+        tolerance (float): Maximal distance between matching slice and annotation z positions.
+        z_positions (list[float]): Sorted unique z positions of annotations.
+
+    Methods:
+        lookup: Returns annotations matching a z position.
+        polygons: Returns polygons of annotations matching a z position.
+    """
+
+    def __init__(self, annotations: list[ProcessedAnnotation], tolerance: float = Z_TOLERANCE):
+        self.tolerance = tolerance
+
+        grouped = defaultdict(list)
+        for annotation in annotations:
+            grouped[annotation.z_position].append(annotation)
+
+        self.z_positions = sorted(grouped)
+        self._annotations = [grouped[z_position] for z_position in self.z_positions]
+        self._polygons = [
+            [
+                (np.asarray(annotation.y_positions), np.asarray(annotation.x_positions))
+                for annotation in group
+            ]
+            for group in self._annotations
+        ]
+
+    def __len__(self) -> int:
+        return len(self.z_positions)
+
+    def __contains__(self, z_position: float) -> bool:
+        start, end = self._range(z_position)
+        return start < end
+
+    def lookup(self, z_position: float) -> list[ProcessedAnnotation]:
+        """Returns annotations within tolerance of the z position"""
+        start, end = self._range(z_position)
+        return [annotation for group in self._annotations[start:end] for annotation in group]
+
+    def polygons(self, z_position: float) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Returns (y, x) polygons of annotations within tolerance of the z position"""
+        start, end = self._range(z_position)
+        return [polygon for group in self._polygons[start:end] for polygon in group]
+
+    def _range(self, z_position: float) -> tuple[int, int]:
+        """Returns range of groups with abs(z - z_position) < tolerance"""
+        start = bisect_right(self.z_positions, z_position - self.tolerance)
+        end = bisect_left(self.z_positions, z_position + self.tolerance, lo=start)
+        return start, end
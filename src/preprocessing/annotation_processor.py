@@ -1,5 +1,6 @@
 import xml.etree.ElementTree as ET
 
+from src.preprocessing.annotation_index import AnnotationIndex
 from src.preprocessing.base import BaseProcessor
 from src.preprocessing.utils import *
 
@@ -13,6 +14,7 @@ class AnnotationProcessor(BaseProcessor):
     Attributes:
         path (str): The path to the XML file containing annotations.
         _data (set[float]): Set of z positions of nodules after processing.
+        _index (AnnotationIndex): Z position index of processed annotations, built once.
 
     Methods inherited from BaseProcessor:
         process, save, process_and_save.
@@ -20,6 +22,7 @@ class AnnotationProcessor(BaseProcessor):
     def __init__(self, path):
         self.path = path
         self._data = []
+        self._index = None
 
     def process(self, as_output: bool = False) -> list[ProcessedAnnotation]:
         """Returns a list of processed annotations""" 
@@ -27,6 +30,7 @@ class AnnotationProcessor(BaseProcessor):
         tree = ET.parse(self.path)
         root = tree.getroot()
         self._process(root)
+        self._index = None
 
         return self._data if as_output else None
 
@@ -52,12 +56,20 @@ class AnnotationProcessor(BaseProcessor):
     @data.setter
     def data(self, value):
         self._data = value
+        self._index = None
 
     @property
     def z_positions(self):
         z_positions = [pa.z_position for pa in self._data]
         return set(z_positions)
 
+    @property
+    def index(self) -> AnnotationIndex:
+        """Z position index of processed annotations"""
+        if self._index is None:
+            self._index = AnnotationIndex(self._data)
+        return self._index
+
     def _process(self, root):
         _ = lambda s: f"{ANNOTATION_NAMESPACE}{str(s)}"  # adds namespace name to string
 
@@ -0,0 +1,202 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from itertools import groupby
+from typing import Iterator, Optional
+
+import pydicom
+
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slices (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    uid TEXT,
+    z_position REAL,
+    series_uid TEXT,
+    patient_id TEXT,
+    rows INTEGER,
+    columns INTEGER,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slices_directory ON slices (directory);
+CREATE INDEX IF NOT EXISTS slices_uid ON slices (uid);
+CREATE TABLE IF NOT EXISTS annotations (
+    directory TEXT PRIMARY KEY,
+    path TEXT NOT NULL
+);
+"""
+
+
+class DatasetCatalog:
+    """
+    On-disk index of the DICOM slices and XML annotations of a dataset.
+
+    The catalog is built in a single walk over the dataset. DICOM headers are read with pixel
+    data skipped and stored in an SQLite database together with the source mtime and size,
+    so rebuilding only re-reads new or changed files. Later processing stages query the
+    catalog instead of walking the tree and opening files again.
+
+    Attributes:
+        path (str): The path to the directory containing DICOM and XML files.
+        index_path (str): The path to the SQLite database file.
+
+    Methods:
+        build: Scans the dataset and updates the index.
+        exists: Checks whether the index was already built.
+        series: Yields paths to annotation and dicoms of every annotated series.
+        slices: Returns catalogued slice headers.
+        patient_ids: Returns patient id of every slice uid.
+    """
+
+    def __init__(self, path: str, index_path: str):
+        self.path = path
+        self.index_path = index_path
+
+    def __len__(self) -> int:
+        """Returns number of annotated series"""
+        with closing(self._connect()) as connection:
+            (count,) = connection.execute(
+                "SELECT COUNT(DISTINCT s.directory) FROM slices s"
+                " JOIN annotations a ON s.directory = a.directory"
+            ).fetchone()
+        return count
+
+    def exists(self) -> bool:
+        """Returns whether the index file exists"""
+        return os.path.exists(self.index_path)
+
+    def build(self) -> None:
+        """Scans the dataset in a single pass and updates the index"""
+        logger.info(f"Catalog build of {self.path} started at {datetime.now()}")
+
+        with closing(self._connect()) as connection:
+            known = {
+                path: (mtime, size)
+                for path, mtime, size in connection.execute(
+                    "SELECT path, mtime, size FROM slices"
+                )
+            }
+
+            dicom_stats, annotations = self._scan()
+
+            # Only new or changed dicoms need their header read
+            changed = [
+                (path, stat) for path, stat in dicom_stats.items()
+                if known.get(path) != stat
+            ]
+            removed = [(path,) for path in known.keys() - dicom_stats.keys()]
+
+            with ThreadPoolExecutor(max_workers=CATALOG_MAX_WORKERS) as executor:
+                rows = list(executor.map(lambda item: self._read_header(*item), changed))
+
+            with connection:
+                connection.executemany("DELETE FROM slices WHERE path = ?", removed)
+                connection.executemany(
+                    "INSERT OR REPLACE INTO slices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [row for row in rows if row is not None],
+                )
+                connection.execute("DELETE FROM annotations")
+                connection.executemany(
+                    "INSERT INTO annotations VALUES (?, ?)", annotations.items()
+                )
+
+        logger.info(
+            f"Catalog build ended at {datetime.now()}: {len(dicom_stats)} slices, "
+            f"{len(changed)} read, {len(removed)} removed, {len(annotations)} annotations."
+        )
+
+    def series(self) -> Iterator[dict]:
+        """Yields a dictionary with path to annotation and z-sorted paths to dicoms"""
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT a.directory, a.path, s.path FROM annotations a"
+                " JOIN slices s ON s.directory = a.directory"
+                " ORDER BY a.directory, s.z_position, s.path"
+            ).fetchall()
+
+        for (_, annotation_path), group in groupby(rows, key=lambda row: row[:2]):
+            yield {
+                DICOM_KEY: [dicom_path for _, _, dicom_path in group],
+                ANNOTATION_KEY: annotation_path,
+            }
+
+    def slices(self, directory: Optional[str] = None) -> list[dict]:
+        """Returns catalogued slice headers, optionally of one directory"""
+        query = "SELECT * FROM slices"
+        params = ()
+        if directory is not None:
+            query += " WHERE directory = ?"
+            params = (directory,)
+
+        with closing(self._connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(query, params)]
+
+    def patient_ids(self) -> dict[str, str]:
+        """Returns patient id of every slice uid, series uid or directory if it's missing"""
+        with closing(self._connect()) as connection:
+            return dict(connection.execute(
+                "SELECT uid, COALESCE(patient_id, series_uid, directory) FROM slices"
+                " WHERE uid IS NOT NULL"
+            ).fetchall())
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns connection to the index, connections are not kept so catalog can be pickled"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        connection = sqlite3.connect(self.index_path)
+        connection.executescript(CATALOG_SCHEMA)
+        return connection
+
+    def _scan(self) -> tuple[dict, dict]:
+        """Returns stats of all dicoms and annotation path of every directory"""
+        dicom_stats = {}
+        annotations = {}
+
+        for root, _, files in os.walk(self.path):
+            directory = os.path.realpath(root)
+            xml_files = [f for f in files if f.endswith(ANNOTATION_EXTENSION)]
+
+            for f in files:
+                if f.endswith(DICOM_EXTENSION):
+                    path = os.path.join(directory, f)
+                    stat = os.stat(path)
+                    dicom_stats[path] = (stat.st_mtime, stat.st_size)
+
+            if len(xml_files) == 1:
+                annotations[directory] = os.path.join(directory, xml_files[0])
+            elif len(xml_files) > 1:
+                logger.error(f"Multiple XML files found in {directory}. Expected only one.")
+
+        return dicom_stats, annotations
+
+    @staticmethod
+    def _read_header(path: str, stat: tuple[float, int]) -> Optional[tuple]:
+        """Returns slice row read from dicom header without pixel data"""
+        try:
+            dicom = pydicom.dcmread(path, stop_before_pixels=True)
+        except Exception as e:
+            logger.error(f"Error while reading header of {path}.\n{e}")
+            return None
+
+        slice_location = dicom.get(SLICE_LOCATION)
+
+        return (
+            path,
+            os.path.dirname(path),
+            dicom.get(SOP_INSTANCE_UID),
+            float(slice_location) if slice_location is not None else None,
+            dicom.get(SERIES_INSTANCE_UID),
+            dicom.get(PATIENT_ID),
+            dicom.get(ROWS),
+            dicom.get(COLUMNS),
+            *stat,
+        )
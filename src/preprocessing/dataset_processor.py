@@ -1,17 +1,28 @@
 import os
 import shutil
 import logging
+import dataclasses
+import functools
+import multiprocessing
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import Mapping, Optional
 from datetime import datetime
 
 import numpy as np
 from tqdm import tqdm
 
 from src.preprocessing.base import BaseProcessor
+from src.preprocessing.annotation_index import AnnotationIndex
 from src.preprocessing.annotation_processor import AnnotationProcessor
+from src.preprocessing.dataset_catalog import DatasetCatalog
 from src.preprocessing.dicom_processor import DicomProcessor
+from src.preprocessing.lung_crop import crop_processed_dicoms, resize_image, save_crops
+from src.preprocessing.packed_dataset import PackedWriter, save_packed_dataset
+from src.preprocessing.patch_extractor import PatchExtractor
+from src.preprocessing.patient_splitter import PatientSplitter
+from src.preprocessing.processing_ledger import ProcessingLedger
+from src.preprocessing.series_processor import SeriesProcessor, stack_neighbours
 from src.preprocessing.utils import *
 
 
@@ -28,21 +39,64 @@ class DatasetProcessor(BaseProcessor):
 
     Attributes:
         path (str): The path to the directory containing DICOM and XML files.
+        series_mode (bool): Whether to process each series at once with SeriesProcessor.
+        catalog (DatasetCatalog): Optional index of the dataset, used instead of walking the directory.
+        crop (str): Whether slices are cropped to the lungs of each slice or of each series.
+        crop_size (int): Size the cropped slices are resampled to.
+        stack_slices (bool): Whether every slice is saved with its neighbours z-1 and z+1 as channels.
+        metadata (DatasetMetadata): Storage format of saved images.
+        sizes (list[int]): Sizes of resized derivatives saved next to the images.
         _data (dict): Dictionary containing processed DICOMs and labels.
 
     Methods inherited from BaseProcessor:
         process, save, process_and_save.
 
     Private Methods:
-        _process_parallel: Processes the dataset in parallel using multiple CPU cores.
+        _process_parallel: Processes the dataset in parallel using one pool of CPU cores.
+        _generate_tasks: Generates batches of DICOM files across all series.
         _process: Processes a batch of DICOM files.
+        _collect_processed: Collects processed DICOMs returned by workers.
         _process_and_save: Processes and saves a batch of DICOM files.
+        _process_and_write_shards: Processes a series of DICOM files and writes it to shards.
+        _save_resized: Saves resized derivatives of a processed DICOM.
+        _extract_patches: Processes a series of DICOM files and extracts its patches.
+        _record_crops: Saves boxes of cropped slices next to the data.
+        _process_dicoms: Yields processed DICOMs from a batch of DICOM files.
+        _get_pending_series: Filters out DICOM files that the ledger has as done.
         _generate_annotation_and_dicom_paths: Generates paths for DICOM and XML files.
         _get_annotation_xml_path: Returns the path to the XML annotation within a directory.
     """
 
-    def __init__(self, path: str):
+    def __init__(
+        self,
+        path: str,
+        series_mode: bool = False,
+        catalog_path: Optional[str] = None,
+        crop: Optional[str] = None,
+        crop_size: int = CROP_SIZE,
+        stack_slices: bool = False,
+    ):
+        if crop is not None and crop not in CROP_MODES:
+            raise ValueError(f"Crop mode {crop} not supported, use one of {CROP_MODES}")
+        # Workers only see the whole series in series mode
+        if crop == CROP_SERIES and not series_mode:
+            raise ValueError(f"Crop mode {CROP_SERIES} requires series_mode")
+        if stack_slices and not series_mode:
+            raise ValueError("Stacking slices requires series_mode")
+        # Neighbours cropped to their own boxes wouldn't be aligned
+        if stack_slices and crop == CROP_SLICE:
+            raise ValueError(f"Stacking slices requires crop mode {CROP_SERIES}")
+
         self.path = path
+        self.series_mode = series_mode
+        self.catalog = (
+            DatasetCatalog(path, catalog_path) if catalog_path is not None else None
+        )
+        self.crop = crop
+        self.crop_size = crop_size
+        self.stack_slices = stack_slices
+        self.metadata = DatasetMetadata()
+        self.sizes = []
         self._data = {
             DICOM_KEY: [],
             ANNOTATION_KEY: [],
@@ -53,7 +107,7 @@ class DatasetProcessor(BaseProcessor):
         self, as_output: bool = False
     ) -> Mapping[list[ProcessedDicom], list[str]]:
         """Processes whole directory and optionaly returns dictionary with processed dicoms and labels"""
-        self._process_parallel(self._process)
+        self._process_parallel(self._process, result_handler=self._collect_processed)
         return self._data if as_output else None
 
     def save(self, path: str) -> None:
@@ -65,11 +119,78 @@ class DatasetProcessor(BaseProcessor):
             output_path = os.path.join(path, label, filename)
             np.save(output_path, processed_dicom.image)
 
-    def process_and_save(self, path: str) -> None:
-        """Processes whole directory and saves it to given output directory"""
+    def process_and_save(
+        self,
+        path: str,
+        dtype: str = FLOAT64,
+        resume: bool = True,
+        backend: str = NPY_BACKEND,
+        sizes: Optional[list[int]] = None,
+    ) -> None:
+        """
+        Processes whole directory and saves it to given output directory in given dtype.
+
+        Processed slices are recorded in a ledger in the output directory. When resuming, only
+        new, changed or failed slices and slices processed with other parameters are processed.
+        The npy backend saves every slice to its label folder, the tfrecord backend writes
+        size-bounded shards with an index. With sizes, the npy backend also saves a derivative
+        of every slice resized to each size, in a size x size directory with its own metadata.
+        Derivatives saved with other parameters are removed, as the ledger reprocesses their slices.
+        Boxes of cropped slices in the original frame are saved to crops.csv by uid.
+        Stacked slices are saved with their neighbours as 3 channels, recorded in the metadata.
+        """
         logger.info(f"Processings started at {datetime.now()}")
-        self._process_parallel(self._process_and_save, path)
-        logger.info(f"Processing ended at {datetime.now()}")
+        self.metadata = DatasetMetadata.from_dtype(dtype, backend)
+        if self.crop is not None:
+            self.metadata = dataclasses.replace(
+                self.metadata, height=self.crop_size, width=self.crop_size, crop=self.crop
+            )
+        if self.stack_slices:
+            self.metadata = dataclasses.replace(self.metadata, channels=CONTEXT_CHANNELS)
+        self.sizes = sorted(set(sizes or []))
+        if self.sizes and backend != NPY_BACKEND:
+            raise ValueError(f"Resized derivatives are only saved with {NPY_BACKEND} backend")
+
+        ledger = ProcessingLedger(
+            os.path.join(path, LEDGER_FILENAME), self._processing_params()
+        )
+        self.metadata = dataclasses.replace(self.metadata, params_hash=ledger.params_hash)
+        crops_path = os.path.join(path, CROPS_FILENAME)
+        if not resume:
+            ledger.reset()
+            if os.path.exists(crops_path):
+                os.remove(crops_path)
+
+        # Derivatives are keyed by the parameters hash before any slice is saved to them,
+        # so the next run knows they are stale if the parameters change
+        self._remove_stale_resized(path)
+        for size in self.sizes:
+            resized_path = get_resized_path(path, size)
+            os.makedirs(resized_path, exist_ok=True)
+            dataclasses.replace(self.metadata, height=size, width=size).save(resized_path)
+
+        def record(results):
+            ledger.record(results)
+            if self.crop is not None:
+                self._record_crops(crops_path, results)
+
+        worker_func = (
+            self._process_and_write_shards
+            if self.metadata.backend == TFRECORD_BACKEND
+            else self._process_and_save
+        )
+        self._process_parallel(worker_func, path, result_handler=record, ledger=ledger)
+
+        if self.metadata.backend == TFRECORD_BACKEND:
+            self._save_shard_index(path, ledger)
+        self.metadata.save(path)
+        logger.info(f"Processing ended at {datetime.now()}, ledger: {ledger.summary()}")
+
+    def __getstate__(self):
+        """Excludes processed data, so it isn't sent to workers with every task"""
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
 
     @property
     def data(self):
@@ -85,8 +206,31 @@ class DatasetProcessor(BaseProcessor):
     def data(self, value):
         self._data = value
 
-    def train_test_split(self, path: str, train_size: float = 0.8):
-        """Splits the dataset into training and testing sets"""
+    def train_test_split(
+        self,
+        path: str,
+        train_size: float = 0.8,
+        mode: str = COPY_SPLIT,
+        seed: Optional[int] = None,
+    ):
+        """
+        Splits the dataset into training and testing sets.
+
+        The copy mode copies images into train and test directories, hardlink and rename modes
+        link or move them within the filesystem and the manifest mode only saves train and test
+        manifests next to the data. The packed mode packs images of each split into one file.
+        The split is reproducible with a seed.
+        """
+        if mode not in SPLIT_MODES:
+            raise ValueError(f"Split mode {mode} not supported, use one of {SPLIT_MODES}")
+
+        rng = np.random.default_rng(seed)
+
+        # Sharded datasets are split by shard index, without copying any data
+        if DatasetMetadata.load(path).backend == TFRECORD_BACKEND:
+            self._split_shards(path, train_size, rng)
+            return
+
         # Check if nodue and non nodule folders exist
         if not all(
             os.path.exists(os.path.join(path, category))
@@ -98,9 +242,23 @@ class DatasetProcessor(BaseProcessor):
             )
             return
 
+        if mode == MANIFEST_SPLIT:
+            self._split_manifests(path, train_size, rng)
+            return
+
+        if mode == PACKED_SPLIT:
+            self._split_packed(path, train_size, rng)
+            return
+
         train_dir = os.path.join(path, TRAIN_FOLDER)
         test_dir = os.path.join(path, TEST_FOLDER)
 
+        # Split directories are loaded on their own, so they need the metadata too
+        metadata = DatasetMetadata.load(path)
+        for split_dir in [train_dir, test_dir]:
+            os.makedirs(split_dir, exist_ok=True)
+            metadata.save(split_dir)
+
         for category in [NODULE, NON_NODULE]:
             os.makedirs(os.path.join(train_dir, category), exist_ok=True)
             os.makedirs(os.path.join(test_dir, category), exist_ok=True)
@@ -110,33 +268,182 @@ class DatasetProcessor(BaseProcessor):
                 os.path.join(train_dir, category),
                 os.path.join(test_dir, category),
                 train_size,
+                mode,
+                rng,
             )
 
-    def _split_data(self, source, train_dir, test_dir, split_size):
-        files = os.listdir(source)
+    def patient_split(
+        self,
+        path: str,
+        val_size: float = 0.1,
+        test_size: float = 0.2,
+        seed: Optional[int] = None,
+    ) -> dict[str, str]:
+        """Saves stratified patient-level train, validation and test manifests"""
+        return self._get_patient_splitter(path).split(val_size, test_size, seed)
+
+    def patient_k_fold(self, path: str, k: int = 5, seed: Optional[int] = None) -> list[dict[str, str]]:
+        """Saves stratified patient-level train and validation manifests of k folds"""
+        return self._get_patient_splitter(path).k_fold(k, seed)
+
+    def pack(self, source: str, path: str) -> None:
+        """Packs images of a processed directory or a manifest into one file in path"""
+        if os.path.isfile(source) and source.endswith(MANIFEST_EXTENSION):
+            rows = load_manifest(source)
+            metadata = DatasetMetadata.load(os.path.dirname(os.path.abspath(source)))
+        else:
+            rows = [
+                (os.path.join(source, category, file), category)
+                for category in [NODULE, NON_NODULE]
+                for file in sorted(os.listdir(os.path.join(source, category)))
+            ]
+            metadata = DatasetMetadata.load(source)
 
-        # Shuffle the files randomly
-        shuffled_files = np.random.permutation(files)
+        save_packed_dataset(path, rows, metadata)
 
-        # Calculate the split index
-        split_index = int(len(shuffled_files) * split_size)
+    def extract_patches(
+        self,
+        path: str,
+        size: int = PATCH_SIZE,
+        mode: str = PATCH_2D,
+        negative_ratio: float = NEGATIVE_RATIO,
+        dtype: str = FLOAT64,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Extracts nodule-centred and negative patches of every series into a packed dataset in path.
+
+        Every series is processed at once like in series mode and its patches are appended
+        to the packed dataset by the main process, see PatchExtractor.
+        """
+        extractor = PatchExtractor(size, mode, negative_ratio, seed)
+        metadata = dataclasses.replace(
+            DatasetMetadata.from_dtype(dtype), height=size, width=size, channels=extractor.channels
+        )
+
+        with PackedWriter(path, metadata) as writer:
+            self._process_parallel(
+                functools.partial(self._extract_patches, extractor, metadata),
+                result_handler=lambda result: writer.write(*result),
+                whole_series=True,
+            )
+
+    def _remove_stale_resized(self, path: str) -> None:
+        """Removes derivatives saved with other processing parameters, or not requested anymore"""
+        for resized_path in list_resized_paths(path):
+            if DatasetMetadata.load(resized_path).params_hash != self.metadata.params_hash:
+                shutil.rmtree(resized_path)
+                logger.info(f"Removed stale resized derivative {resized_path}")
+
+    def _get_patient_splitter(self, path: str) -> PatientSplitter:
+        # Patients of slices are only known from the catalog
+        if self.catalog is None:
+            raise ValueError("Patient-level split requires DatasetProcessor with catalog_path.")
+        # Build is incremental, so patients added to the dataset since are catalogued
+        self.catalog.build()
 
-        train_files = shuffled_files[:split_index]
-        test_files = shuffled_files[split_index:]
+        return PatientSplitter(path, self.catalog)
 
-        # Copy files to the respective directories
+    def _split_shards(self, path: str, train_size: float, rng: np.random.Generator) -> None:
+        """Splits shards of the dataset into training and testing shard indexes"""
+        from src.preprocessing.shard_writer import load_shard_index, save_shard_index
+
+        if not os.path.exists(os.path.join(path, SHARD_INDEX_FILENAME)):
+            logger.info(f"Shard index does not exist. Process the dataset first.")
+            return
+
+        shards = load_shard_index(path)
+        shuffled_shards = [shards[i] for i in rng.permutation(len(shards))]
+
+        # Fill the training set with whole shards until it reaches train_size of the records
+        train_records = int(sum(shard["records"] for shard in shards) * train_size)
+        records = np.cumsum([shard["records"] for shard in shuffled_shards])
+        split_index = int(np.searchsorted(records, train_records, side="right"))
+
+        metadata = DatasetMetadata.load(path)
+        for folder, split_shards in [
+            (TRAIN_FOLDER, shuffled_shards[:split_index]),
+            (TEST_FOLDER, shuffled_shards[split_index:]),
+        ]:
+            split_dir = os.path.join(path, folder)
+            os.makedirs(split_dir, exist_ok=True)
+            metadata.save(split_dir)
+            save_shard_index(split_dir, split_shards)
+
+    def _split_manifests(self, path: str, train_size: float, rng: np.random.Generator) -> None:
+        """Saves train and test manifests of the images in label folders"""
+        train_rows, test_rows = self._split_rows(path, train_size, rng)
+
+        for folder, rows in [(TRAIN_FOLDER, train_rows), (TEST_FOLDER, test_rows)]:
+            save_manifest(os.path.join(path, f"{folder}{MANIFEST_EXTENSION}"), rows)
+
+        logger.info(f"Saved manifests of {len(train_rows)} train and {len(test_rows)} test images.")
+
+    def _split_packed(self, path: str, train_size: float, rng: np.random.Generator) -> None:
+        """Packs train and test images in label folders into one file per split"""
+        train_rows, test_rows = self._split_rows(path, train_size, rng)
+
+        metadata = DatasetMetadata.load(path)
+        for folder, rows in [(TRAIN_FOLDER, train_rows), (TEST_FOLDER, test_rows)]:
+            save_packed_dataset(os.path.join(path, folder), rows, metadata)
+
+    def _split_rows(self, path: str, train_size: float, rng: np.random.Generator) -> tuple:
+        """Returns (image path, label) rows of train and test images in label folders"""
+        train_rows, test_rows = [], []
+        for category in [NODULE, NON_NODULE]:
+            source = os.path.join(path, category)
+            train_files, test_files = self._shuffle_and_split(source, train_size, rng)
+            train_rows += [(os.path.join(source, file), category) for file in train_files]
+            test_rows += [(os.path.join(source, file), category) for file in test_files]
+
+        return train_rows, test_rows
+
+    def _split_data(self, source, train_dir, test_dir, split_size, mode=COPY_SPLIT, rng=None):
+        train_files, test_files = self._shuffle_and_split(
+            source, split_size, rng or np.random.default_rng()
+        )
+
+        transfer = {
+            COPY_SPLIT: shutil.copy,
+            HARDLINK_SPLIT: self._link_file,
+            RENAME_SPLIT: shutil.move,
+        }[mode]
+
+        # Copy, link or move files to the respective directories
         with tqdm(total=len(train_files)) as pbar:
             for file in train_files:
-                shutil.copy(os.path.join(source, file), train_dir)
+                transfer(os.path.join(source, file), train_dir)
                 pbar.update(1)
 
         with tqdm(total=len(test_files)) as pbar:
             for file in test_files:
-                shutil.copy(os.path.join(source, file), test_dir)
+                transfer(os.path.join(source, file), test_dir)
                 pbar.update(1)
 
+    @staticmethod
+    def _link_file(source: str, directory: str) -> None:
+        """Hardlinks file into directory, replacing a file left by a previous split"""
+        destination = os.path.join(directory, os.path.basename(source))
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.link(source, destination)
+
+    @staticmethod
+    def _shuffle_and_split(source: str, split_size: float, rng: np.random.Generator) -> tuple:
+        """Returns shuffled files of source split into two parts"""
+        # Sorted, so the same seed gives the same split regardless of the listing order
+        files = sorted(os.listdir(source))
+
+        # Shuffle the files randomly
+        shuffled_files = rng.permutation(files)
+
+        # Calculate the split index
+        split_index = int(len(shuffled_files) * split_size)
+
+        return shuffled_files[:split_index], shuffled_files[split_index:]
+
     def remove_processed_data(self, path: str):
-        """Removes all processed data from the directory"""
+        """Removes processed images from the directory, the ledger is kept for images in label folders"""
         categories = []
         # Check if nodule folder exists
         if not os.path.exists(os.path.join(path, NODULE)):
@@ -149,6 +456,10 @@ class DatasetProcessor(BaseProcessor):
             logger.info(f"Directory {NON_NODULE} does not exist.")
         else:
             categories.append(NON_NODULE)
+
+        # Shards folder exists when the dataset was saved with tfrecord backend
+        if os.path.exists(os.path.join(path, SHARDS_FOLDER)):
+            categories.append(SHARDS_FOLDER)
         
         if len(categories) == 0:
             logger.info(f"No nodule and non nodule directories to remove.")
@@ -156,6 +467,14 @@ class DatasetProcessor(BaseProcessor):
 
         for category in categories:
             shutil.rmtree(os.path.join(path, category))
+
+        if os.path.exists(index_path := os.path.join(path, SHARD_INDEX_FILENAME)):
+            os.remove(index_path)
+
+        # Ledger of label folders is kept, slices of removed images aren't done, so the next run
+        # processes them again. Shard index is built from the ledger, so it can't list removed shards
+        if SHARDS_FOLDER in categories and os.path.exists(ledger_path := os.path.join(path, LEDGER_FILENAME)):
+            os.remove(ledger_path)
         logger.info(f"Removed processed data.") 
 
     def remove_train_test_data(self, path: str):
@@ -181,117 +500,359 @@ class DatasetProcessor(BaseProcessor):
             shutil.rmtree(os.path.join(path, category))
         logger.info(f"Removed train and test directories.")
 
-    def _process_parallel(self, worker_func, path=None):
+    def _process_parallel(self, worker_func, path=None, result_handler=None, ledger=None, whole_series=False):
         if path:
             # Create output directory if it doesn't exist
             os.makedirs(path, exist_ok=True)
 
-            # Create label directories, here processed dicoms will be saved
-            for label in [NODULE, NON_NODULE]:
-                label_path = os.path.join(path, label)
-                os.makedirs(label_path, exist_ok=True)
-
-        dataset_size = self._check_dataset_size()
-        logger.info(f"Processing dataset with {dataset_size} scans.")
-
-        with tqdm(total=dataset_size) as pbar:
-            for paths_dictionary in self._generate_annotation_and_dicom_paths():
-                # Unpack the dictionary
-                dicom_paths = paths_dictionary[DICOM_KEY]
-                annotation_path = paths_dictionary[ANNOTATION_KEY]
-
-                # Get all z position of nodules
-                ap = AnnotationProcessor(path=annotation_path)
-                ap.process()
-                nodule_positions = ap.z_positions
-
-                # List of all future tasks
-                futures = []
-
-                # Create batches from dicom_paths, this will reduco I/O frequency
-                dicom_batches = [
-                    dicom_paths[i : i + BATCH_SIZE]
-                    for i in range(0, len(dicom_paths), BATCH_SIZE)
-                ]
-
-                logger.info(f"Starting parallel processing.")
-
-                with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                    for dicom_batch in dicom_batches:
-                        # Submit a new task to the executor.
-                        # The _process_and_save function will process the DICOM and save it.
-                        future = executor.submit(
-                            worker_func,
-                            dicom_batch,
-                            nodule_positions,
-                            ap.data,
-                            path,
-                        )
-                        futures.append(future)
-
-                    # Wait for all tasks to complete and handle exceptions if necessary
-                    for future in as_completed(futures):
-                        try:
-                            future.result()
-                        except Exception as e:
-                            logger.exception(f"Error processing batch:\n{e}")
-
-                logger.info(f"Finished parallel processing succesfully.")
-                pbar.update(1)
+            # Create label directories or shards directory, here processed dicoms will be saved
+            folders = [SHARDS_FOLDER] if self._writes_whole_series() else [NODULE, NON_NODULE]
+            for folder in folders:
+                os.makedirs(os.path.join(path, folder), exist_ok=True)
+                for size in self.sizes:
+                    os.makedirs(os.path.join(get_resized_path(path, size), folder), exist_ok=True)
+
+        # Build only reads new or changed dicoms, so series added since the last run are processed
+        if self.catalog is not None:
+            self.catalog.build()
+
+        # Walk the dataset once, the list of paths is small compared to the images
+        series = list(self._generate_annotation_and_dicom_paths())
+        logger.info(f"Processing dataset with {len(series)} scans.")
+
+        if ledger is not None:
+            series = self._get_pending_series(series, ledger)
+
+        # When every series is one task, largest go first to balance the workers
+        whole_series = whole_series or self.series_mode or self._writes_whole_series()
+        if whole_series:
+            series.sort(key=lambda paths_dictionary: len(paths_dictionary[DICOM_KEY]), reverse=True)
+
+        max_workers = MAX_WORKERS or os.cpu_count()
+        max_in_flight = max_workers * TASKS_IN_FLIGHT_PER_WORKER
+
+        # Number of unfinished tasks of each series, a series is done after its last task
+        remaining_tasks = {}
+        in_flight = {}
+
+        logger.info(f"Starting parallel processing with {max_workers} workers.")
+
+        # Shard writers use TensorFlow, which is not safe to use in forked processes
+        mp_context = (
+            multiprocessing.get_context("spawn") if self._writes_whole_series() else None
+        )
+
+        # One pool for the whole dataset, fed from a flat queue of tasks across series
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=mp_context
+        ) as executor, tqdm(total=len(series)) as pbar:
+
+            def handle_completed(futures):
+                for future in futures:
+                    series_index = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                        if result_handler is not None:
+                            result_handler(result)
+                    except Exception as e:
+                        logger.exception(f"Error processing batch:\n{e}")
+
+                    remaining_tasks[series_index] -= 1
+                    if remaining_tasks[series_index] == 0:
+                        pbar.update(1)
+
+            for series_index, dicom_batch, annotation_index, no_tasks in self._generate_tasks(series, whole_series):
+                # Set once from all tasks of the series, tasks finished before the next is submitted
+                # don't bring it to zero early
+                remaining_tasks.setdefault(series_index, no_tasks)
+
+                # Bound the number of submitted tasks, so task arguments don't pile up in memory
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    handle_completed(done)
+
+                future = executor.submit(worker_func, dicom_batch, annotation_index, path)
+                in_flight[future] = series_index
+
+            handle_completed(as_completed(list(in_flight)))
+
+        logger.info(f"Finished parallel processing succesfully.")
+
+    def _get_pending_series(self, series: list[dict], ledger: ProcessingLedger) -> list[dict]:
+        """Returns series with dicoms that the ledger doesn't have as done"""
+        pending_series = []
+        for paths_dictionary in series:
+            dicom_paths = paths_dictionary[DICOM_KEY]
+            pending_paths = [path for path in dicom_paths if not ledger.is_done(path)]
+
+            if len(pending_paths) == 0:
+                continue
+
+            # Series mode needs the whole stack, because the threshold is shared
+            # Shards of a series are replaced as a whole
+            whole_series = self.series_mode or self._writes_whole_series()
+            pending_series.append({
+                DICOM_KEY: dicom_paths if whole_series else pending_paths,
+                ANNOTATION_KEY: paths_dictionary[ANNOTATION_KEY],
+            })
+
+        logger.info(
+            f"Ledger has {len(series) - len(pending_series)} scans done, "
+            f"{len(pending_series)} scans pending."
+        )
+        return pending_series
+
+    def _processing_params(self) -> dict:
+        """Returns parameters that processed outputs depend on"""
+        params = {
+            "version": PROCESSING_VERSION,
+            "series_mode": self.series_mode,
+            "dtype": self.metadata.dtype,
+            "backend": self.metadata.backend,
+        }
+        # Only added with derivatives, so ledgers of datasets without them stay valid
+        if self.sizes:
+            params["sizes"] = self.sizes
+        if self.crop is not None:
+            params["crop"] = self.crop
+            params["crop_size"] = self.crop_size
+        if self.stack_slices:
+            params["stack_slices"] = self.stack_slices
+        return params
+
+    def _writes_whole_series(self) -> bool:
+        """Returns whether every series is written by one task into its own shards"""
+        return self.metadata.backend == TFRECORD_BACKEND
+
+    def _generate_tasks(self, series: list[dict], whole_series: bool = False):
+        """Yields series index, batch of dicom paths, annotation index and number of tasks of the series"""
+        for series_index, paths_dictionary in enumerate(series):
+            # Unpack the dictionary
+            dicom_paths = paths_dictionary[DICOM_KEY]
+            annotation_path = paths_dictionary[ANNOTATION_KEY]
+
+            # Build z position index of nodules once per series
+            ap = AnnotationProcessor(path=annotation_path)
+            ap.process()
+            annotation_index = ap.index
+
+            # Create batches from dicom_paths, this will reduco I/O frequency
+            # In series mode the whole series is processed as one stack
+            batch_size = len(dicom_paths) if whole_series else BATCH_SIZE
+            batches = [dicom_paths[i : i + batch_size] for i in range(0, len(dicom_paths), batch_size)]
+            for dicom_batch in batches:
+                yield series_index, dicom_batch, annotation_index, len(batches)
 
     def _process(
         self,
         dicom_paths: list[str],
-        nodule_positions: set[float],
-        annotations: list[ProcessedAnnotation],
+        annotation_index: AnnotationIndex,
         path=None,
-    ) -> None:
-        for dicom_path in dicom_paths:
-            # Get processed image, uid for filename and slice z position
-            dp = DicomProcessor(path=dicom_path, annotations=annotations)
-            processed_dicom = dp.process(as_output=True)
-
-            if processed_dicom is None:
-                logger.error(f"Processing dicom {dp.path} returned None.")
-                return
-
+    ) -> list[tuple[ProcessedDicom, str]]:
+        results = []
+        for processed_dicom in self._process_dicoms(dicom_paths, annotation_index):
             # Check whether slice contains a nodule
             label = (
-                NODULE if processed_dicom.z_position in nodule_positions else NON_NODULE
+                NODULE if processed_dicom.z_position in annotation_index else NON_NODULE
             )
 
+            results.append((processed_dicom, label))
+
+        # Workers run in separate processes, results are collected by the main process
+        return results
+
+    def _collect_processed(self, results: list[tuple[ProcessedDicom, str]]) -> None:
+        for processed_dicom, label in results:
             self._data[DICOM_KEY].append(processed_dicom)
             self._data[ANNOTATION_KEY].append(label)
 
     def _process_and_save(
         self,
         dicom_paths: list[str],
-        nodule_positions: set[float],
-        annotations: list[ProcessedAnnotation],
+        annotation_index: AnnotationIndex,
         path: str,
-    ) -> None:
-        for dicom_path in dicom_paths:
-            # Get processed image, uid for filename and slice z position
-            dp = DicomProcessor(path=dicom_path, annotations=annotations)
-            processed_dicom = dp.process(as_output=True)
-
-            if processed_dicom is None:
-                logger.error(f"Processing dicom {dp.path} returned None")
-                return
-
+    ) -> list[dict]:
+        results = []
+        for processed_dicom in self._process_dicoms(dicom_paths, annotation_index):
             # Check whether slice contains a nodule
             label = (
-                NODULE if processed_dicom.z_position in nodule_positions else NON_NODULE
+                NODULE if processed_dicom.z_position in annotation_index else NON_NODULE
             )
 
             # Save image in correct label folder
             filename = f"{processed_dicom.uid}{NUMPY_EXTENSION}"
             output_path = os.path.join(path, label, filename)
-            np.save(output_path, processed_dicom.image)
+            np.save(output_path, self.metadata.encode(processed_dicom.image))
+            self._save_resized(processed_dicom, label, path)
             logger.info(f"Saved DICOM Image to {output_path}")
 
+            results.append(
+                self._ledger_result(
+                    processed_dicom.path, DONE, processed_dicom.uid, label, output_path, processed_dicom.crop_box
+                )
+            )
+
+        # Slices that didn't return an image are recorded as failed and retried next run
+        processed_paths = {result["source_path"] for result in results}
+        results += [
+            self._ledger_result(dicom_path, FAILED)
+            for dicom_path in dicom_paths
+            if dicom_path not in processed_paths
+        ]
+
+        return results
+
+    def _save_resized(self, processed_dicom: ProcessedDicom, label: str, path: str) -> None:
+        """Saves derivatives of the processed dicom resized to every size"""
+        for size in self.sizes:
+            resized_image = resize_image(processed_dicom.image, size)
+            filename = f"{processed_dicom.uid}{NUMPY_EXTENSION}"
+            np.save(
+                os.path.join(get_resized_path(path, size), label, filename),
+                self.metadata.encode(resized_image),
+            )
+
+    @staticmethod
+    def _extract_patches(
+        extractor: PatchExtractor,
+        metadata: DatasetMetadata,
+        dicom_paths: list[str],
+        annotation_index: AnnotationIndex,
+        path=None,
+    ) -> tuple[np.ndarray, list[str], list[str]]:
+        sp = SeriesProcessor(paths=dicom_paths, annotations=annotation_index)
+        processed_dicoms = sp.process(as_output=True)
+
+        if processed_dicoms is None:
+            logger.error(f"Processing series {sp.path} returned None.")
+            return np.empty((0,)), [], []
+
+        patches, uids, labels = extractor.extract(processed_dicoms, annotation_index, sp.masks)
+        logger.info(
+            f"Extracted {labels.count(NODULE)} nodule and {labels.count(NON_NODULE)} "
+            f"non-nodule patches of {sp.path}"
+        )
+
+        # Patches are encoded by workers, so the main process only writes them
+        return metadata.encode(patches), uids, labels
+
+    def _process_and_write_shards(
+        self,
+        dicom_paths: list[str],
+        annotation_index: AnnotationIndex,
+        path: str,
+    ) -> list[dict]:
+        # Imported here, so TensorFlow is only loaded by workers writing shards
+        from src.preprocessing.shard_writer import ShardWriter
+
+        results = []
+        with ShardWriter(os.path.join(path, SHARDS_FOLDER)) as writer:
+            for processed_dicom in self._process_dicoms(dicom_paths, annotation_index):
+                # Check whether slice contains a nodule
+                label = (
+                    NODULE if processed_dicom.z_position in annotation_index else NON_NODULE
+                )
+
+                shard_path = writer.write(
+                    self.metadata.encode(processed_dicom.image), label, processed_dicom.uid
+                )
+
+                results.append(
+                    self._ledger_result(
+                        processed_dicom.path, DONE, processed_dicom.uid, label, shard_path, processed_dicom.crop_box
+                    )
+                )
+
+        # Slices that didn't return an image are recorded as failed and retried next run
+        processed_paths = {result["source_path"] for result in results}
+        results += [
+            self._ledger_result(dicom_path, FAILED)
+            for dicom_path in dicom_paths
+            if dicom_path not in processed_paths
+        ]
+
+        return results
+
+    @staticmethod
+    def _save_shard_index(path: str, ledger: ProcessingLedger) -> None:
+        """Saves index of shards with number of records and nodules from the ledger"""
+        from src.preprocessing.shard_writer import save_shard_index
+
+        shards = {}
+        for output_path, label in ledger.done_outputs():
+            shard = shards.setdefault(output_path, {"path": output_path, "records": 0, "nodules": 0})
+            shard["records"] += 1
+            shard["nodules"] += int(label == NODULE)
+
+        save_shard_index(path, sorted(shards.values(), key=lambda shard: shard["path"]))
+        logger.info(f"Saved index of {len(shards)} shards.")
+
+    @staticmethod
+    def _record_crops(path: str, results: list[dict]) -> None:
+        """Saves boxes of slices cropped by workers, results are collected by the main process"""
+        rows = [(result["uid"], result["crop_box"]) for result in results if result.get("crop_box")]
+        if rows:
+            save_crops(path, rows)
+
+    @staticmethod
+    def _ledger_result(source_path, status, uid=None, label=None, output_path=None, crop_box=None) -> dict:
+        """Returns ledger result of a source dicom with its current mtime and size"""
+        stat = os.stat(source_path)
+        return {
+            "source_path": source_path,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "status": status,
+            "uid": uid,
+            "label": label,
+            "output_path": output_path,
+            "crop_box": crop_box,
+        }
+
+    def _process_dicoms(
+        self,
+        dicom_paths: list[str],
+        annotation_index: AnnotationIndex,
+    ):
+        """Yields processed dicoms with uid for filename and slice z position"""
+        if self.series_mode:
+            sp = SeriesProcessor(paths=dicom_paths, annotations=annotation_index)
+            processed_dicoms = sp.process(as_output=True)
+
+            if processed_dicoms is None:
+                logger.error(f"Processing series {sp.path} returned None.")
+                return
+
+            if self.crop is not None:
+                processed_dicoms = crop_processed_dicoms(processed_dicoms, self.crop, self.crop_size)
+            if self.stack_slices:
+                processed_dicoms = stack_neighbours(processed_dicoms)
+            yield from processed_dicoms
+            return
+
+        for dicom_path in dicom_paths:
+            dp = DicomProcessor(path=dicom_path, annotations=annotation_index)
+            try:
+                processed_dicom = dp.process(as_output=True)
+            except Exception as e:
+                # One corrupt slice shouldn't fail the whole batch
+                logger.exception(f"Error processing dicom {dp.path}:\n{e}")
+                continue
+
+            if processed_dicom is None:
+                logger.error(f"Processing dicom {dp.path} returned None.")
+                continue
+
+            if self.crop is not None:
+                processed_dicom, = crop_processed_dicoms([processed_dicom], self.crop, self.crop_size)
+            yield processed_dicom
+
     def _generate_annotation_and_dicom_paths(self) -> tuple:
         """Yields a dictionary with path to annotation and paths to dicoms"""
+        if self.catalog is not None:
+            yield from self.catalog.series()
+            return
+
         for root, _, files in os.walk(self.path, topdown=False):
             if len(files) == 0:
                 continue
@@ -334,6 +895,3 @@ class DatasetProcessor(BaseProcessor):
         else:
             logger.exception("Multiple XML files found. Expected only one.")
             return None
-
-    def _check_dataset_size(self) -> int:
-        return sum(1 for _ in self._generate_annotation_and_dicom_paths())
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Optional, Union
 
 import pydicom
 import numpy as np
@@ -14,6 +14,7 @@ from skimage.morphology import (
 )
 from skimage.draw import polygon
 
+from src.preprocessing.annotation_index import AnnotationIndex
 from src.preprocessing.base import BaseProcessor
 from src.preprocessing.utils import *
 
@@ -37,12 +38,19 @@ class DicomProcessor(BaseProcessor):
         process, save, process_and_save.
 
     Private Methods:
-        _create_lung_mask: Creates a binary mask from the DICOM data.
-        _fix_outliers: Fixes outlier values in the DICOM data.
+        _create_lung_mask: Creates a binary mask from the decoded DICOM image.
+        _fix_outliers: Fixes outlier values in the decoded DICOM image.
     """
-    def __init__(self, path: str, annotations: Optional[list[ProcessedAnnotation]] = None):
+    def __init__(
+        self,
+        path: str,
+        annotations: Optional[Union[list[ProcessedAnnotation], AnnotationIndex]] = None,
+    ):
         self.path = path
         self._data = None
+        # Annotations are matched to slices by z position index
+        if annotations is not None and not isinstance(annotations, AnnotationIndex):
+            annotations = AnnotationIndex(annotations)
         self.annotations = annotations or None
 
     def process(self, as_output: bool = False) -> ProcessedDicom:
@@ -54,11 +62,11 @@ class DicomProcessor(BaseProcessor):
             logger.error(f"Dicom {self.path} doesn't have necessary tags.")
             return
 
-        # Create a lung mask
-        mask = self._create_lung_mask(dicom)
+        # Decode pixel data once, every following step works on this array
+        image = self._fix_outliers(dicom.pixel_array)
 
-        # Get image from dicom object
-        image = dicom.pixel_array
+        # Create a lung mask
+        mask = self._create_lung_mask(image, dicom.SliceLocation)
 
         # Segment lungs by multiplying image with mask
         image_segmented = image * mask
@@ -80,6 +88,7 @@ class DicomProcessor(BaseProcessor):
             image=image_processed,
             uid=uid,
             z_position=z_position,
+            path=self.path,
         )
 
         self._data = processed_dicom
@@ -117,12 +126,8 @@ class DicomProcessor(BaseProcessor):
         self._data = value
 
     
-    def _create_lung_mask(self, dcm: pydicom.dataset.FileDataset) -> np.ndarray:
-        """Returns a binary mask from dicom object"""
-        # Fix outliers and load dicom pixel array
-        dcm = self._fix_outliers(dcm)
-        image = dcm.pixel_array
-
+    def _create_lung_mask(self, image: np.ndarray, z_position: float) -> np.ndarray:
+        """Returns a binary mask from decoded dicom image"""
         # Select threshold using the Otsu method
         thresh = threshold_otsu(image)
 
@@ -147,36 +152,26 @@ class DicomProcessor(BaseProcessor):
         mask_opened = binary_opening(mask_closed)
 
         # If annotations were provided include them, sometimes binarization misses them
-        mask = mask_opened if self.annotations is None else self._include_annotation(dcm, mask_opened) 
+        mask = mask_opened if self.annotations is None else self._include_annotation(z_position, mask_opened)
 
         return mask
     
     def _include_annotation(
-        self, dcm: pydicom.dataset.FileDataset, mask_opened: np.ndarray
+        self, z_position: float, mask_opened: np.ndarray
     ) -> np.ndarray:
-        z_position = dcm.SliceLocation
-        for annotation in self.annotations:
-            if abs(annotation.z_position - z_position) < 1e-5:
-                rr, cc = polygon(annotation.y_positions, annotation.x_positions)
-                mask_opened[rr, cc] = True
+        for y_positions, x_positions in self.annotations.polygons(z_position):
+            rr, cc = polygon(y_positions, x_positions)
+            mask_opened[rr, cc] = True
 
         return mask_opened
 
     @staticmethod
-    def _fix_outliers(
-        dcm: pydicom.dataset.FileDataset
-    ) -> pydicom.dataset.FileDataset:
-        """Returns dicom object without negative values"""
-        # Get image from dicom object
-        image = dcm.pixel_array
-
-        # Set negative values to 0
+    def _fix_outliers(image: np.ndarray) -> np.ndarray:
+        """Returns decoded dicom image without negative values"""
+        # Set negative values to 0 in place, pixel data is never re-encoded
         image[image < 0] = 0
 
-        # Save image data back to dicom object
-        dcm.PixelData = image.tobytes()
-
-        return dcm
+        return image
 
     @staticmethod
     def _check_dicom_tags(dicom):
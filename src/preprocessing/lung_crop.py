@@ -0,0 +1,114 @@
+"""
+Module for cropping processed slices to the bounding box of the lungs
+"""
+import os
+import csv
+import dataclasses
+
+import numpy as np
+from skimage.transform import resize
+
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CROP_COLUMNS = ["uid", "y0", "x0", "y1", "x1"]
+
+
+def lung_bounding_box(images: np.ndarray, margin: int = CROP_MARGIN) -> tuple[int, int, int, int]:
+    """
+    Returns square (y0, x0, y1, x1) box around the lungs of a slice or a z-sorted stack.
+
+    Pixels outside the lung mask are zero after segmentation, so the box bounds the nonzero
+    pixels of all given slices with a margin. The shorter side is extended around the centre,
+    so resampling the crop keeps the aspect ratio. Empty slices are not cropped.
+    """
+    height, width = images.shape[-2:]
+    lungs = images.reshape(-1, height, width).any(axis=0)
+    rows, columns = np.flatnonzero(lungs.any(axis=1)), np.flatnonzero(lungs.any(axis=0))
+    if len(rows) == 0:
+        return 0, 0, height, width
+
+    side = min(
+        max(rows[-1] - rows[0], columns[-1] - columns[0]) + 1 + 2 * margin,
+        height,
+        width,
+    )
+    y0 = _clip_start((rows[0] + rows[-1] + 1 - side) // 2, side, height)
+    x0 = _clip_start((columns[0] + columns[-1] + 1 - side) // 2, side, width)
+    return int(y0), int(x0), int(y0 + side), int(x0 + side)
+
+
+def crop_and_resize(image: np.ndarray, box: tuple[int, int, int, int], size: int) -> np.ndarray:
+    """Returns region of the box resampled to size x size"""
+    y0, x0, y1, x1 = box
+    return resize_image(image[y0:y1, x0:x1], size)
+
+
+def crop_processed_dicoms(
+    processed_dicoms: list[ProcessedDicom], mode: str, size: int
+) -> list[ProcessedDicom]:
+    """Returns processed dicoms cropped to the lungs of each slice or of the whole series"""
+    if mode == CROP_SERIES and processed_dicoms:
+        box = lung_bounding_box(np.stack([processed_dicom.image for processed_dicom in processed_dicoms]))
+        boxes = [box] * len(processed_dicoms)
+    else:
+        boxes = [lung_bounding_box(processed_dicom.image) for processed_dicom in processed_dicoms]
+
+    return [
+        dataclasses.replace(
+            processed_dicom,
+            image=crop_and_resize(processed_dicom.image, box, size),
+            crop_box=box,
+        )
+        for processed_dicom, box in zip(processed_dicoms, boxes)
+    ]
+
+
+def to_original_frame(
+    y: np.ndarray, x: np.ndarray, box: tuple[int, int, int, int], size: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns pixel coordinates in a cropped slice mapped back to the original frame"""
+    y0, x0, y1, x1 = box
+    return (
+        y0 + (np.asarray(y) + 0.5) * (y1 - y0) / size - 0.5,
+        x0 + (np.asarray(x) + 0.5) * (x1 - x0) / size - 0.5,
+    )
+
+
+def resize_image(image: np.ndarray, size: int) -> np.ndarray:
+    """Returns image resized to size x size like the Resizing layers of model builders"""
+    return resize(
+        image,
+        (size, size),
+        order=RESIZE_ORDER,
+        mode="edge",
+        anti_aliasing=False,
+        preserve_range=True,
+    )
+
+
+def save_crops(path: str, rows: list[tuple[str, tuple[int, int, int, int]]]) -> None:
+    """Appends (uid, box) rows to the crops file, later rows replace earlier ones on load"""
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(CROP_COLUMNS)
+        writer.writerows((uid, *box) for uid, box in rows)
+
+
+def load_crops(path: str) -> dict[str, tuple[int, int, int, int]]:
+    """Returns boxes of cropped slices by uid"""
+    with open(path, newline="") as f:
+        return {
+            row["uid"]: tuple(int(row[column]) for column in CROP_COLUMNS[1:])
+            for row in csv.DictReader(f)
+        }
+
+
+def _clip_start(start: int, side: int, length: int) -> int:
+    """Returns start of a side long interval shifted to lie within [0, length)"""
+    return min(max(start, 0), length - side)
@@ -0,0 +1,142 @@
+import os
+import csv
+import dataclasses
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from tqdm import tqdm
+
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def save_packed_dataset(path: str, rows: list[tuple[str, str]], metadata: DatasetMetadata) -> None:
+    """
+    Packs images of (image path, label) rows into one contiguous array file.
+
+    Images are written in the order of rows into images.npy, index.csv holds the uid and label
+    of every image at the same position. Metadata with the packed backend is saved next to them.
+    """
+    if len(rows) == 0:
+        logger.error(f"No images to pack into {path}.")
+        return
+
+    os.makedirs(path, exist_ok=True)
+    shape = np.load(rows[0][0], mmap_mode="r").shape
+    images = open_memmap(
+        os.path.join(path, PACKED_IMAGES_FILENAME),
+        mode="w+",
+        dtype=metadata.dtype,
+        shape=(len(rows), *shape),
+    )
+
+    with tqdm(total=len(rows)) as pbar:
+        for i, (image_path, _) in enumerate(rows):
+            images[i] = np.load(image_path, mmap_mode="r")
+            pbar.update(1)
+    images.flush()
+    del images
+
+    save_packed_index(
+        path,
+        [os.path.basename(image_path).removesuffix(NUMPY_EXTENSION) for image_path, _ in rows],
+        [label for _, label in rows],
+        metadata,
+    )
+    logger.info(f"Packed {len(rows)} images into {path}")
+
+
+def save_packed_index(path: str, uids: list[str], labels: list[str], metadata: DatasetMetadata) -> None:
+    """Saves uid and label of every packed image and metadata with the packed backend"""
+    with open(os.path.join(path, PACKED_INDEX_FILENAME), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["uid", "label"])
+        writer.writerows(zip(uids, labels))
+
+    dataclasses.replace(metadata, backend=PACKED_BACKEND).save(path)
+
+
+def load_packed_dataset(path: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns memory-mapped images with uids and labels of a packed dataset"""
+    images = np.load(os.path.join(path, PACKED_IMAGES_FILENAME), mmap_mode="r")
+
+    with open(os.path.join(path, PACKED_INDEX_FILENAME), newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    uids = np.array([row["uid"] for row in rows])
+    labels = np.array([row["label"] for row in rows])
+
+    return images, uids, labels
+
+
+class PackedWriter:
+    """
+    Writer of a packed dataset whose number of images isn't known in advance.
+
+    Encoded images are appended in batches to a raw file, so they don't have to be kept
+    in memory. On close the raw file is copied into images.npy and the index is saved.
+
+    Attributes:
+        path (str): The path to the packed dataset directory.
+        metadata (DatasetMetadata): Storage format of the images.
+
+    Methods:
+        write: Appends a batch of encoded images with their uids and labels.
+        close: Saves images.npy and the index.
+    """
+
+    def __init__(self, path: str, metadata: DatasetMetadata):
+        self.path = path
+        self.metadata = metadata
+        self._uids = []
+        self._labels = []
+        self._shape = None
+        os.makedirs(path, exist_ok=True)
+        self._raw_path = os.path.join(path, PACKED_RAW_FILENAME)
+        self._raw = open(self._raw_path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, images: np.ndarray, uids: list[str], labels: list[str]) -> None:
+        """Appends encoded images with their uids and labels"""
+        if len(uids) == 0:
+            return
+        if self._shape is None:
+            self._shape = images.shape[1:]
+        elif images.shape[1:] != self._shape:
+            raise ValueError(f"Images have shape {images.shape[1:]}, expected {self._shape}")
+
+        self._raw.write(np.ascontiguousarray(images, dtype=self.metadata.dtype).tobytes())
+        self._uids += list(uids)
+        self._labels += list(labels)
+
+    def close(self) -> None:
+        if self._raw.closed:
+            return
+        self._raw.close()
+
+        if len(self._uids) == 0:
+            os.remove(self._raw_path)
+            logger.error(f"No images to pack into {self.path}.")
+            return
+
+        shape = (len(self._uids), *self._shape)
+        raw = np.memmap(self._raw_path, dtype=self.metadata.dtype, mode="r", shape=shape)
+        images = open_memmap(
+            os.path.join(self.path, PACKED_IMAGES_FILENAME), mode="w+", dtype=self.metadata.dtype, shape=shape
+        )
+        for i in range(0, len(raw), PACKED_COPY_CHUNK):
+            images[i : i + PACKED_COPY_CHUNK] = raw[i : i + PACKED_COPY_CHUNK]
+        images.flush()
+        del images, raw
+        os.remove(self._raw_path)
+
+        save_packed_index(self.path, self._uids, self._labels, self.metadata)
+        logger.info(f"Packed {len(self._uids)} images into {self.path}")
@@ -0,0 +1,173 @@
+"""
+Module for the PatchExtractor class
+"""
+import zlib
+from typing import Optional
+
+import numpy as np
+from scipy import ndimage as ndi
+from skimage.draw import polygon
+
+from src.preprocessing.annotation_index import AnnotationIndex
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class PatchExtractor:
+    """
+    Extractor of fixed-size patches from a processed series.
+
+    Positive patches are centred on the nodules annotated on a slice, polygons of all readers
+    are merged and every connected nodule gives one patch. Negative patches are centred on
+    random pixels inside the lung mask, far enough from nodules that they don't contain
+    any. Patches are 2D, or 2.5D with the neighbouring slices z-1 and z+1 as channels, whose
+    negatives don't contain nodules of the neighbouring slices either.
+
+    Attributes:
+        size (int): Height and width of the patches.
+        mode (str): "2d" or "2.5d".
+        negative_ratio (float): Number of negative patches per positive patch of a series.
+        seed (int): Seed of sampling negatives, combined with the series, None for random.
+
+    Methods:
+        extract: Returns patches of a z-sorted processed series with their uids and labels.
+    """
+
+    def __init__(
+        self,
+        size: int = PATCH_SIZE,
+        mode: str = PATCH_2D,
+        negative_ratio: float = NEGATIVE_RATIO,
+        seed: Optional[int] = None,
+    ):
+        if mode not in PATCH_MODES:
+            raise ValueError(f"Patch mode {mode} not supported, use one of {PATCH_MODES}")
+
+        self.size = size
+        self.mode = mode
+        self.negative_ratio = negative_ratio
+        self.seed = seed
+
+    @property
+    def channels(self) -> int:
+        return CONTEXT_CHANNELS if self.mode == PATCH_25D else CHANNELS
+
+    def extract(
+        self,
+        processed_dicoms: list[ProcessedDicom],
+        annotations: AnnotationIndex,
+        lung_masks: Optional[np.ndarray] = None,
+    ) -> tuple[np.ndarray, list[str], list[str]]:
+        """
+        Returns patches of the series with their uids and labels.
+
+        Uids are the uid of the slice with the (y, x) centre of the patch, so patches can be
+        mapped back to their slices. Negatives are sampled in the lung masks of the series,
+        see SeriesProcessor, or in the nonzero pixels of the segmented slices without them.
+        """
+        volume = np.stack([processed_dicom.image for processed_dicom in processed_dicoms])
+        nodules = self._nodule_masks(processed_dicoms, volume.shape[1:], annotations)
+        # Pixels outside the lung mask are zero after segmentation
+        lungs = lung_masks if lung_masks is not None else volume > 0
+
+        centres = []
+        for z, nodule_mask in nodules.items():
+            labels, no_nodules = ndi.label(nodule_mask)
+            for y, x in ndi.center_of_mass(nodule_mask, labels, range(1, no_nodules + 1)):
+                centres.append((z, int(round(y)), int(round(x)), NODULE))
+
+        no_negatives = max(round(self.negative_ratio * len(centres)), MIN_NEGATIVES_PER_SERIES)
+        negatives = self._sample_negatives(lungs, nodules, no_negatives, self._rng(processed_dicoms[0].uid))
+        centres += [(z, y, x, NON_NODULE) for z, y, x in negatives]
+
+        patches = np.empty((len(centres), *self._patch_shape()), dtype=volume.dtype)
+        for patch, (z, y, x, _) in zip(patches, centres):
+            patch[...] = self._patch(volume, z, y, x)
+        uids = [f"{processed_dicoms[z].uid}_{y}_{x}" for z, y, x, _ in centres]
+        labels = [label for *_, label in centres]
+
+        return patches, uids, labels
+
+    def _nodule_masks(
+        self, processed_dicoms: list[ProcessedDicom], shape: tuple[int, int], annotations: AnnotationIndex
+    ) -> dict[int, np.ndarray]:
+        """Returns masks of annotated nodules of slices with any"""
+        masks = {}
+        for z, processed_dicom in enumerate(processed_dicoms):
+            polygons = annotations.polygons(processed_dicom.z_position)
+            if len(polygons) == 0:
+                continue
+
+            mask = np.zeros(shape, dtype=bool)
+            for y_positions, x_positions in polygons:
+                rr, cc = polygon(y_positions, x_positions, shape=shape)
+                mask[rr, cc] = True
+                # Small nodules are annotated with a single point, which isn't a polygon
+                mask[
+                    np.clip(np.round(y_positions).astype(int), 0, shape[0] - 1),
+                    np.clip(np.round(x_positions).astype(int), 0, shape[1] - 1),
+                ] = True
+            masks[z] = mask
+
+        return masks
+
+    def _sample_negatives(
+        self, lungs: np.ndarray, nodules: dict[int, np.ndarray], no_negatives: int, rng: np.random.Generator
+    ) -> list[tuple[int, int, int]]:
+        """Returns (z, y, x) centres of negative patches inside the lungs away from nodules"""
+        height, width = lungs.shape[1:]
+        # Patches near the border are shifted, so a centre is excluded if its shifted patch
+        # contains a nodule, the filter gives that for the centre of the shifted patch
+        rows = np.clip(np.arange(height), self.size // 2, height - self.size + self.size // 2)
+        columns = np.clip(np.arange(width), self.size // 2, width - self.size + self.size // 2)
+        excluded = np.zeros(lungs.shape, dtype=bool)
+        for z, nodule_mask in nodules.items():
+            excluded[z] = ndi.maximum_filter(nodule_mask, size=self.size)[np.ix_(rows, columns)]
+
+        # 2.5D patches also hold the slices z-1 and z+1
+        if self.mode == PATCH_25D:
+            excluded = ndi.maximum_filter1d(excluded, size=3, axis=0)
+
+        candidates = lungs & ~excluded
+
+        counts = candidates.sum(axis=(1, 2))
+        if counts.sum() == 0:
+            logger.warning("Series has no lung pixels to sample negative patches from")
+            return []
+
+        slices = rng.choice(len(lungs), size=no_negatives, p=counts / counts.sum())
+
+        centres = []
+        for z in slices:
+            y, x = np.nonzero(candidates[z])
+            i = rng.integers(len(y))
+            centres.append((int(z), int(y[i]), int(x[i])))
+
+        return centres
+
+    def _patch(self, volume: np.ndarray, z: int, y: int, x: int) -> np.ndarray:
+        """Returns patch centred on (y, x) shifted to lie within the slice"""
+        height, width = volume.shape[1:]
+        y0 = min(max(y - self.size // 2, 0), height - self.size)
+        x0 = min(max(x - self.size // 2, 0), width - self.size)
+
+        if self.mode == PATCH_2D:
+            return volume[z, y0 : y0 + self.size, x0 : x0 + self.size]
+
+        # Neighbours of the first and the last slice are the slices themselves
+        neighbours = [max(z - 1, 0), z, min(z + 1, len(volume) - 1)]
+        return np.moveaxis(volume[neighbours, y0 : y0 + self.size, x0 : x0 + self.size], 0, -1)
+
+    def _patch_shape(self) -> tuple[int, ...]:
+        if self.mode == PATCH_2D:
+            return self.size, self.size
+        return self.size, self.size, self.channels
+
+    def _rng(self, uid: str) -> np.random.Generator:
+        """Returns generator seeded by the seed and the series, so series don't depend on their order"""
+        if self.seed is None:
+            return np.random.default_rng()
+        return np.random.default_rng([self.seed, zlib.crc32(uid.encode())])
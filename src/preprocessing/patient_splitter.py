@@ -0,0 +1,146 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from src.preprocessing.dataset_catalog import DatasetCatalog
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class PatientSplitter:
+    """
+    Patient-level splitter of a processed dataset.
+
+    Processed slices are grouped by the patient of their source dicom, taken from the
+    catalog, so all slices of a patient end up in the same split. Patients are stratified
+    by whether any of their slices contains a nodule, every split gets the same share of
+    patients with and without nodules. Splits are saved as manifests next to the data,
+    no images are copied.
+
+    Attributes:
+        path (str): The path to the processed dataset with label folders.
+        catalog (DatasetCatalog): Catalog of the source dataset.
+
+    Methods:
+        split: Saves train, validation and test manifests.
+        k_fold: Saves train and validation manifests of every fold.
+    """
+
+    def __init__(self, path: str, catalog: DatasetCatalog):
+        self.path = path
+        self.catalog = catalog
+
+    def split(
+        self, val_size: float = 0.1, test_size: float = 0.2, seed: Optional[int] = None
+    ) -> dict[str, str]:
+        """Saves train, validation and test manifests, returns their paths"""
+        if val_size < 0 or test_size < 0 or val_size + test_size >= 1:
+            raise ValueError(f"Invalid split sizes: val_size={val_size}, test_size={test_size}")
+
+        rng = np.random.default_rng(seed)
+        paths, labels, patient_index, positive = self._load_slices()
+
+        fractions = np.array([1 - val_size - test_size, val_size, test_size])
+        patient_groups = self._assign_groups(positive, fractions, rng)
+        slice_groups = patient_groups[patient_index]
+
+        manifests = {}
+        for group, folder in enumerate([TRAIN_FOLDER, VALIDATION_FOLDER, TEST_FOLDER]):
+            manifests[folder] = self._save_manifest(
+                f"{folder}{MANIFEST_EXTENSION}", paths, labels, slice_groups == group
+            )
+
+        train_patients, val_patients, test_patients = np.bincount(patient_groups, minlength=3)
+        logger.info(
+            f"Split {len(positive)} patients into {train_patients} train, "
+            f"{val_patients} validation and {test_patients} test patients"
+        )
+
+        return manifests
+
+    def k_fold(self, k: int = 5, seed: Optional[int] = None) -> list[dict[str, str]]:
+        """Saves train and validation manifests of k folds, returns their paths"""
+        if k < 2:
+            raise ValueError(f"Number of folds has to be at least 2, got {k}")
+
+        rng = np.random.default_rng(seed)
+        paths, labels, patient_index, positive = self._load_slices()
+
+        patient_folds = self._assign_folds(positive, k, rng)
+        slice_folds = patient_folds[patient_index]
+
+        folds = []
+        for fold in range(k):
+            folds.append({
+                folder: self._save_manifest(
+                    f"fold{fold}_{folder}{MANIFEST_EXTENSION}", paths, labels, selected
+                )
+                for folder, selected in [
+                    (TRAIN_FOLDER, slice_folds != fold),
+                    (VALIDATION_FOLDER, slice_folds == fold),
+                ]
+            })
+
+        logger.info(f"Split {len(positive)} patients into {k} folds")
+
+        return folds
+
+    def _load_slices(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns paths, labels and patient index of processed slices and stratum of patients"""
+        patient_ids = self.catalog.patient_ids()
+
+        paths, labels, patients = [], [], []
+        for label in [NODULE, NON_NODULE]:
+            label_path = os.path.join(self.path, label)
+            for file in sorted(os.listdir(label_path)):
+                uid = file.removesuffix(NUMPY_EXTENSION)
+                if uid not in patient_ids:
+                    logger.error(f"Slice {uid} is not in the catalog, it's left out of the split.")
+                    continue
+                paths.append(os.path.join(label_path, file))
+                labels.append(label)
+                patients.append(patient_ids[uid])
+
+        if len(paths) == 0:
+            raise ValueError(f"No catalogued slices found in {self.path}. Process the dataset first.")
+
+        paths, labels = np.array(paths), np.array(labels)
+        _, patient_index = np.unique(np.array(patients), return_inverse=True)
+
+        # Patient is positive if any of its slices contains a nodule
+        positive = np.bincount(patient_index, weights=labels == NODULE) > 0
+
+        return paths, labels, patient_index, positive
+
+    @staticmethod
+    def _assign_groups(positive: np.ndarray, fractions: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Returns group of every patient, each stratum is split by fractions"""
+        groups = np.empty(len(positive), dtype=int)
+        for stratum in [True, False]:
+            patients = rng.permutation(np.flatnonzero(positive == stratum))
+            cuts = np.round(np.cumsum(fractions)[:-1] * len(patients)).astype(int)
+            groups[patients] = np.searchsorted(cuts, np.arange(len(patients)), side="right")
+
+        return groups
+
+    @staticmethod
+    def _assign_folds(positive: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+        """Returns fold of every patient, each stratum is dealt over the folds"""
+        folds = np.empty(len(positive), dtype=int)
+        offset = 0
+        for stratum in [True, False]:
+            patients = rng.permutation(np.flatnonzero(positive == stratum))
+            # Continue dealing where the previous stratum stopped, so folds have equal sizes
+            folds[patients] = (offset + np.arange(len(patients))) % k
+            offset += len(patients)
+
+        return folds
+
+    def _save_manifest(self, filename: str, paths: np.ndarray, labels: np.ndarray, selected: np.ndarray) -> str:
+        manifest_path = os.path.join(self.path, filename)
+        save_manifest(manifest_path, list(zip(paths[selected], labels[selected])))
+        return manifest_path
@@ -0,0 +1,149 @@
+import os
+import json
+import sqlite3
+import hashlib
+from contextlib import closing
+from datetime import datetime
+
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slices (
+    source_path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    uid TEXT,
+    label TEXT,
+    output_path TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+class ProcessingLedger:
+    """
+    Durable record of processed slices of a dataset.
+
+    For every source dicom the ledger keeps its mtime and size, a hash of the processing
+    parameters, the processing status and the saved output. A re-run of the processing only
+    needs the slices that are new, changed, failed, were processed with other parameters or
+    whose output was removed or moved.
+    Outputs that are replaced by a re-run are removed, so stale images don't stay behind.
+
+    Attributes:
+        path (str): The path to the SQLite database file.
+        params (dict): Processing parameters of the current run.
+        params_hash (str): Hash of the processing parameters.
+
+    Methods:
+        is_done: Checks whether a source dicom needs no processing.
+        record: Saves results of processed slices.
+        done_outputs: Returns outputs of slices done with current parameters.
+        reset: Removes all records.
+        summary: Returns number of slices for each status.
+    """
+
+    def __init__(self, path: str, params: dict):
+        self.path = path
+        self.params = params
+        self.params_hash = hashlib.sha1(
+            json.dumps(params, sort_keys=True).encode()
+        ).hexdigest()
+        self._records = None
+
+    def is_done(self, source_path: str) -> bool:
+        """Returns whether source dicom was processed unchanged with current parameters and its output exists"""
+        record = self._get_records().get(source_path)
+        if record is None:
+            return False
+
+        mtime, size, params_hash, status, output_path = record
+        stat = os.stat(source_path)
+        return all([
+            status == DONE,
+            params_hash == self.params_hash,
+            (mtime, size) == (stat.st_mtime, stat.st_size),
+            output_path is not None and os.path.exists(output_path),
+        ])
+
+    def record(self, results: list[dict]) -> None:
+        """Saves results of processed slices and removes outputs they replaced"""
+        records = self._get_records()
+        updated_at = datetime.now().isoformat()
+
+        rows = []
+        for result in results:
+            source_path = result["source_path"]
+            output_path = result.get("output_path")
+
+            # Remove output of previous processing if this one didn't overwrite it
+            previous = records.get(source_path)
+            if previous is not None and previous[4] not in (None, output_path):
+                if os.path.exists(previous[4]):
+                    os.remove(previous[4])
+
+            rows.append((
+                source_path,
+                result.get("mtime"),
+                result.get("size"),
+                self.params_hash,
+                result["status"],
+                result.get("uid"),
+                result.get("label"),
+                output_path,
+                updated_at,
+            ))
+            records[source_path] = (
+                result.get("mtime"), result.get("size"), self.params_hash, result["status"], output_path
+            )
+
+        # Commit after every batch, so a crash loses at most the batches in flight
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO slices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def done_outputs(self) -> list[tuple[str, str]]:
+        """Returns output path and label of every slice done with current parameters"""
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT output_path, label FROM slices WHERE status = ? AND params = ?",
+                (DONE, self.params_hash),
+            ).fetchall()
+
+    def reset(self) -> None:
+        """Removes all records, so every slice is processed again"""
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM slices")
+        self._records = {}
+
+    def summary(self) -> dict:
+        """Returns number of slices for each status"""
+        with closing(self._connect()) as connection:
+            return dict(connection.execute(
+                "SELECT status, COUNT(*) FROM slices GROUP BY status"
+            ).fetchall())
+
+    def _get_records(self) -> dict:
+        """Returns records by source path, loaded once for fast lookups"""
+        if self._records is None:
+            with closing(self._connect()) as connection:
+                self._records = {
+                    source_path: (mtime, size, params_hash, status, output_path)
+                    for source_path, mtime, size, params_hash, status, output_path in connection.execute(
+                        "SELECT source_path, mtime, size, params, status, output_path FROM slices"
+                    )
+                }
+        return self._records
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        connection.executescript(LEDGER_SCHEMA)
+        return connection
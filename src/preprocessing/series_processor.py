@@ -0,0 +1,241 @@
+import os
+import dataclasses
+from typing import Optional, Union
+
+import pydicom
+import numpy as np
+from scipy import ndimage as ndi
+from skimage.filters import threshold_otsu
+from skimage.draw import polygon
+
+from src.preprocessing.annotation_index import AnnotationIndex
+from src.preprocessing.base import BaseProcessor
+from src.preprocessing.dicom_processor import DicomProcessor
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Structuring elements connecting pixels only within a slice of a (z, y, x) stack
+IN_PLANE_FULL = np.zeros((3, 3, 3), dtype=bool)
+IN_PLANE_FULL[1] = True
+IN_PLANE_CROSS = np.zeros((3, 3, 3), dtype=bool)
+IN_PLANE_CROSS[1] = ndi.generate_binary_structure(2, 1)
+
+
+class SeriesProcessor(BaseProcessor):
+    """
+    Processor for handling a whole DICOM series at once.
+
+    This class reads all slices of a series into one z-sorted 3D stack and creates
+    lung masks for the whole stack with vectorized operations, instead of running
+    the segmentation slice by slice like DicomProcessor. The Otsu threshold is
+    computed once for the series, so masks are consistent across neighbouring slices.
+
+    Attributes:
+        paths (list[str]): Paths to the DICOM files of the series.
+        _data (list[ProcessedDicom]): Z-sorted processed DICOMs after processing.
+        masks (np.ndarray): Z-sorted lung masks of the series after processing.
+
+    Methods inherited from BaseProcessor:
+        process, save, process_and_save.
+
+    Private Methods:
+        _load_series: Reads the series into a z-sorted stack.
+        _create_lung_masks: Creates binary masks for the whole stack.
+        _clear_border: Removes objects touching the in-plane border of each slice.
+        _remove_small_objects: Removes small objects within each slice.
+        _remove_small_holes: Fills small holes within each slice.
+        _include_annotations: Adds annotated nodules to the masks.
+    """
+    def __init__(
+        self,
+        paths: list[str],
+        annotations: Optional[Union[list[ProcessedAnnotation], AnnotationIndex]] = None,
+    ):
+        self.paths = paths
+        self.path = os.path.commonpath(paths) if paths else None
+        self._data = None
+        self.masks = None
+        # Annotations are matched to slices by z position index
+        if annotations is not None and not isinstance(annotations, AnnotationIndex):
+            annotations = AnnotationIndex(annotations)
+        self.annotations = annotations or None
+
+    def process(self, as_output: bool = False) -> list[ProcessedDicom]:
+        """Returns z-sorted normalized and segmented images with uids and z positions"""
+        logger.info(f"Started processing series {self.path}")
+        series = self._load_series()
+        if series is None:
+            return
+
+        volume, uids, z_positions, paths = series
+
+        # Create lung masks for the whole stack
+        masks = self._create_lung_masks(volume, z_positions)
+        self.masks = masks
+
+        # Segment lungs by multiplying stack with masks
+        volume_segmented = volume * masks
+
+        # Normalize every slice by its own maximum
+        max_values = volume_segmented.max(axis=(1, 2), keepdims=True)
+        for z_position in z_positions[max_values.ravel() == 0]:
+            logger.error(f"Lung segmentation of slice {z_position} in {self.path} returned empty image.")
+        volume_processed = volume_segmented / np.where(max_values == 0, 1, max_values)
+
+        self._data = [
+            ProcessedDicom(image=image, uid=uid, z_position=z_position, path=path)
+            for image, uid, z_position, path in zip(volume_processed, uids, z_positions, paths)
+        ]
+
+        return self._data if as_output else None
+
+    def save(self, path: str) -> None:
+        if self._data is None:
+            logger.error(f"Attempt to save an empty series.")
+            return
+
+        for processed_dicom in self._data:
+            filename = f"{processed_dicom.uid}{NUMPY_EXTENSION}"
+            output_path = os.path.join(path, filename)
+            np.save(output_path, processed_dicom.image)
+
+    def process_and_save(self, path: str) -> None:
+        self.process()
+        self.save(path)
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.getter
+    def data(self):
+        if self._data is None:
+            self.process()
+
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def _load_series(self) -> Optional[tuple[np.ndarray, list[str], np.ndarray, list[str]]]:
+        """Returns z-sorted stack of decoded slices with their uids, z positions and paths"""
+        dicoms = []
+        for path in self.paths:
+            dicom = pydicom.dcmread(path)
+            if DicomProcessor._check_dicom_tags(dicom):
+                logger.error(f"Dicom {path} doesn't have necessary tags.")
+                continue
+            dicoms.append((path, dicom))
+
+        if len(dicoms) == 0:
+            logger.error(f"Series {self.path} doesn't have any valid dicoms.")
+            return
+
+        if len({(dicom.Rows, dicom.Columns) for _, dicom in dicoms}) > 1:
+            logger.error(f"Series {self.path} has slices with different shapes.")
+            return
+
+        dicoms.sort(key=lambda item: float(item[1].SliceLocation))
+        paths = [path for path, _ in dicoms]
+        dicoms = [dicom for _, dicom in dicoms]
+
+        # Decode pixel data once per slice, straight into the stack
+        volume = np.stack([dicom.pixel_array for dicom in dicoms])
+        volume = DicomProcessor._fix_outliers(volume)
+
+        uids = [dicom.SOPInstanceUID for dicom in dicoms]
+        z_positions = np.array([dicom.SliceLocation for dicom in dicoms], dtype=float)
+
+        return volume, uids, z_positions, paths
+
+    def _create_lung_masks(self, volume: np.ndarray, z_positions: np.ndarray) -> np.ndarray:
+        """Returns binary masks for the whole stack"""
+        # Select one threshold for the series using the Otsu method
+        thresh = threshold_otsu(volume)
+
+        # Reverse binarization of the stack
+        masks = volume < thresh
+
+        # Remove border, now only lungs and some noise is visible
+        masks = self._clear_border(masks)
+
+        # Remove small artifacts around lungs
+        masks = self._remove_small_objects(masks)
+
+        # Fill holes within lungs
+        masks = self._remove_small_holes(masks)
+
+        # Binary closing remove larger holes, erosion keeps the image border like skimage
+        masks = ndi.binary_dilation(masks, structure=IN_PLANE_CROSS)
+        masks = ndi.binary_erosion(masks, structure=IN_PLANE_CROSS, border_value=True)
+
+        # Binary opening to disconnect lungs
+        masks = ndi.binary_erosion(masks, structure=IN_PLANE_CROSS, border_value=True)
+        masks = ndi.binary_dilation(masks, structure=IN_PLANE_CROSS)
+
+        # If annotations were provided include them, sometimes binarization misses them
+        if self.annotations is not None:
+            masks = self._include_annotations(masks, z_positions)
+
+        return masks
+
+    @staticmethod
+    def _clear_border(masks: np.ndarray) -> np.ndarray:
+        """Returns masks without objects touching the in-plane border of their slice"""
+        labels, _ = ndi.label(masks, structure=IN_PLANE_FULL)
+
+        border_labels = np.unique(np.concatenate([
+            labels[:, 0, :].ravel(),
+            labels[:, -1, :].ravel(),
+            labels[:, :, 0].ravel(),
+            labels[:, :, -1].ravel(),
+        ]))
+
+        return masks & ~np.isin(labels, border_labels)
+
+    @staticmethod
+    def _remove_small_objects(masks: np.ndarray, min_size: int = MIN_OBJECT_SIZE) -> np.ndarray:
+        """Returns masks without objects smaller than min_size within their slice"""
+        labels, _ = ndi.label(masks, structure=IN_PLANE_CROSS)
+        component_sizes = np.bincount(labels.ravel())
+        too_small = component_sizes < min_size
+        too_small[0] = False
+
+        return masks & ~too_small[labels]
+
+    @classmethod
+    def _remove_small_holes(cls, masks: np.ndarray, area_threshold: int = MAX_HOLE_AREA) -> np.ndarray:
+        """Returns masks with holes smaller than area_threshold filled within their slice"""
+        return ~cls._remove_small_objects(~masks, area_threshold)
+
+    def _include_annotations(self, masks: np.ndarray, z_positions: np.ndarray) -> np.ndarray:
+        """Returns masks with annotated nodules included"""
+        for i, z_position in enumerate(z_positions):
+            for y_positions, x_positions in self.annotations.polygons(z_position):
+                rr, cc = polygon(y_positions, x_positions, shape=masks.shape[1:])
+                masks[i, rr, cc] = True
+
+        return masks
+
+
+def stack_neighbours(processed_dicoms: list[ProcessedDicom]):
+    """
+    Yields z-sorted processed dicoms with slices z-1, z and z+1 as channels of each image.
+
+    Stacks are built from the images of the series, so every slice is decoded once instead of
+    once for each stack it's part of. Neighbours of the first and the last slice are the slices
+    themselves. Stacks are yielded one by one, so the series isn't held three times in memory.
+    """
+    for z, processed_dicom in enumerate(processed_dicoms):
+        neighbours = [
+            processed_dicoms[max(z - 1, 0)],
+            processed_dicom,
+            processed_dicoms[min(z + 1, len(processed_dicoms) - 1)],
+        ]
+        yield dataclasses.replace(
+            processed_dicom, image=np.stack([neighbour.image for neighbour in neighbours], axis=-1)
+        )
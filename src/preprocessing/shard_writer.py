@@ -0,0 +1,99 @@
+import os
+import uuid
+
+import tensorflow as tf
+
+from src.preprocessing.utils import *
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Features of a serialized slice
+IMAGE_FEATURE = "image"
+LABEL_FEATURE = "label"
+UID_FEATURE = "uid"
+
+
+class ShardWriter:
+    """
+    Writer of processed slices into size-bounded TFRecord shards.
+
+    Every writer creates its own shard files with a unique prefix, so parallel workers never
+    write to the same file. A new shard is started when the current one reaches max_bytes.
+
+    Attributes:
+        path (str): The path to the directory where shards are saved.
+        max_bytes (int): Maximal size of one shard.
+
+    Methods:
+        write: Writes one encoded slice and returns path to its shard.
+        close: Closes the current shard.
+    """
+
+    def __init__(self, path: str, max_bytes: int = SHARD_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._prefix = uuid.uuid4().hex
+        self._part = 0
+        self._writer = None
+        self._shard_path = None
+        self._shard_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, image: np.ndarray, label: str, uid: str) -> str:
+        """Writes encoded image with label and uid, returns path to the shard"""
+        serialized = tf.train.Example(features=tf.train.Features(feature={
+            IMAGE_FEATURE: tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+            LABEL_FEATURE: tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label == NODULE)])),
+            UID_FEATURE: tf.train.Feature(bytes_list=tf.train.BytesList(value=[str(uid).encode()])),
+        })).SerializeToString()
+
+        if self._writer is None or self._shard_bytes + len(serialized) > self.max_bytes:
+            self._open_next_shard()
+
+        self._writer.write(serialized)
+        self._shard_bytes += len(serialized)
+
+        return self._shard_path
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _open_next_shard(self) -> None:
+        self.close()
+        self._shard_path = os.path.join(
+            self.path, f"{self._prefix}-{self._part:03d}{TFRECORD_EXTENSION}"
+        )
+        self._writer = tf.io.TFRecordWriter(self._shard_path)
+        self._shard_bytes = 0
+        self._part += 1
+        logger.info(f"Writing shard {self._shard_path}")
+
+
+def save_shard_index(path: str, shards: list[dict]) -> None:
+    """Saves index of shards with their number of records, shard paths are relative to path"""
+    index = [
+        {**shard, "path": os.path.relpath(shard["path"], path)}
+        for shard in shards
+    ]
+    with open(os.path.join(path, SHARD_INDEX_FILENAME), "w") as f:
+        json.dump(index, f, indent=2)
+
+
+def load_shard_index(path: str) -> list[dict]:
+    """Returns index of shards saved in path with absolute shard paths"""
+    with open(os.path.join(path, SHARD_INDEX_FILENAME)) as f:
+        index = json.load(f)
+
+    return [
+        {**shard, "path": os.path.normpath(os.path.join(path, shard["path"]))}
+        for shard in index
+    ]
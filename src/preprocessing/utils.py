@@ -1,5 +1,10 @@
+import os
+import re
+import csv
+import json
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
+from typing import Optional
 
 import numpy as np
 
@@ -8,10 +13,63 @@ NODULE = "nodule"
 NON_NODULE = "non_nodule"
 TRAIN_FOLDER = "train"
 TEST_FOLDER = "test"
+VALIDATION_FOLDER = "val"
 # Extensions
 DICOM_EXTENSION = ".dcm"
 NUMPY_EXTENSION = ".npy"
 ANNOTATION_EXTENSION = ".xml"
+MANIFEST_EXTENSION = ".csv"
+# Split modes
+COPY_SPLIT = "copy"
+HARDLINK_SPLIT = "hardlink"
+RENAME_SPLIT = "rename"
+MANIFEST_SPLIT = "manifest"
+PACKED_SPLIT = "packed"
+SPLIT_MODES = [COPY_SPLIT, HARDLINK_SPLIT, RENAME_SPLIT, MANIFEST_SPLIT, PACKED_SPLIT]
+# Dataset metadata
+METADATA_FILENAME = "metadata.json"
+# Storage dtypes
+FLOAT64 = "float64"
+FLOAT32 = "float32"
+FLOAT16 = "float16"
+UINT16 = "uint16"
+STORAGE_DTYPES = [FLOAT64, FLOAT32, FLOAT16, UINT16]
+UINT16_SCALE = 1 / np.iinfo(np.uint16).max
+# Output backends
+NPY_BACKEND = "npy"
+TFRECORD_BACKEND = "tfrecord"
+OUTPUT_BACKENDS = [NPY_BACKEND, TFRECORD_BACKEND]
+PACKED_BACKEND = "packed"  # packed splits, written from npy datasets
+# Packed datasets
+PACKED_IMAGES_FILENAME = "images.npy"
+PACKED_INDEX_FILENAME = "index.csv"
+PACKED_RAW_FILENAME = "images.raw"  # images appended before their number is known
+PACKED_COPY_CHUNK = 1024  # images copied at once from the raw file
+# Shards
+SHARDS_FOLDER = "shards"
+SHARD_INDEX_FILENAME = "index.json"
+TFRECORD_EXTENSION = ".tfrecord"
+SHARD_MAX_BYTES = 200 * 2**20  # recommended TFRecord shard size is 100-200 MB
+SHARD_CYCLE_LENGTH = 8  # shards read in parallel by DatasetLoader
+SHARD_SHUFFLE_BUFFER = 1024  # records shuffled across interleaved shards
+# Resized derivatives
+RESIZED_FOLDER_FORMAT = "{height}x{width}"
+RESIZED_FOLDER_PATTERN = re.compile(r"\d+x\d+")
+RESIZE_ORDER = 1  # bilinear, like the Resizing layers of model builders
+# Lung crop
+CROP_SLICE = "slice"
+CROP_SERIES = "series"
+CROP_MODES = [CROP_SLICE, CROP_SERIES]
+CROP_SIZE = 256
+CROP_MARGIN = 8  # pixels kept around the lungs
+CROPS_FILENAME = "crops.csv"
+# Patches
+PATCH_2D = "2d"
+PATCH_25D = "2.5d"  # neighbouring slices as channels
+PATCH_MODES = [PATCH_2D, PATCH_25D]
+PATCH_SIZE = 64
+NEGATIVE_RATIO = 3  # negative patches per positive patch of a series
+MIN_NEGATIVES_PER_SERIES = 4  # series without nodules still give negatives
 # Path dictionary
 DICOM_KEY = "dicom"
 ANNOTATION_KEY = "annotation"
@@ -24,22 +82,39 @@ EDGE_MAP = "edgeMap"
 Y_COORD = "yCoord"
 X_COORD = "xCoord"
 ANNOTATION_NAMESPACE = "{http://www.nih.gov}"
+Z_TOLERANCE = 1e-5  # tolerance of matching annotation and slice z positions
 # Dicom tags
 SLICE_LOCATION = "SliceLocation"
 SOP_INSTANCE_UID = "SOPInstanceUID"
 PIXEL_DATA = "PixelData"
+SERIES_INSTANCE_UID = "SeriesInstanceUID"
+PATIENT_ID = "PatientID"
+ROWS = "Rows"
+COLUMNS = "Columns"
+# Catalog
+CATALOG_FILENAME = "catalog.sqlite"
+CATALOG_MAX_WORKERS = 16  # header reads are I/O bound, threads hide disk latency
 # Parallelization
 BATCH_SIZE = 10
 MAX_WORKERS = None  # this will use all cores
+TASKS_IN_FLIGHT_PER_WORKER = 4  # bounds submitted tasks while keeping workers busy
 # Dicom image processing
 CLOSING_DISK_DIAMETER = 15
 OPENING_DISK_DIAMETER = 5
+MIN_OBJECT_SIZE = 64  # skimage remove_small_objects default
+MAX_HOLE_AREA = 64  # skimage remove_small_holes default
+# Ledger
+LEDGER_FILENAME = "ledger.sqlite"
+PROCESSING_VERSION = 1  # bump when processing changes, so outputs are invalidated
+DONE = "done"
+FAILED = "failed"
 # Logging
 PREPROCESSING_LOG = "preprocessing.log"
 # Processed dicom
 HEIGHT = 512
 WIDTH = 512
 CHANNELS = 1
+CONTEXT_CHANNELS = 3  # slices z-1, z and z+1
 
 
 @dataclass
@@ -48,10 +123,113 @@ class ProcessedDicom:
     image: np.ndarray
     uid: str
     z_position: float
+    path: Optional[str] = None
+    crop_box: Optional[tuple[int, int, int, int]] = None  # (y0, x0, y1, x1) in the original frame
 
 @dataclass
 class ProcessedAnnotation:
     """Annotation coordinates on a single dicom"""
     z_position: float
     x_positions: list[float]
-    y_positions: list[float]
\ No newline at end of file
+    y_positions: list[float]
+
+
+@dataclass
+class DatasetMetadata:
+    """Storage format and resolution of processed images saved next to the data"""
+    dtype: str = FLOAT64
+    scale: float = 1.0
+    backend: str = NPY_BACKEND
+    height: int = HEIGHT
+    width: int = WIDTH
+    channels: int = CHANNELS
+    crop: Optional[str] = None
+    params_hash: Optional[str] = None  # processing parameters the images were saved with
+
+    def save(self, path: str) -> None:
+        with open(os.path.join(path, METADATA_FILENAME), "w") as f:
+            json.dump(asdict(self), f)
+
+    @classmethod
+    def load(cls, path: str) -> "DatasetMetadata":
+        """Returns metadata saved in path, defaults for data saved without metadata"""
+        metadata_path = os.path.join(path, METADATA_FILENAME)
+        if not os.path.exists(metadata_path):
+            return cls()
+
+        with open(metadata_path) as f:
+            return cls(**json.load(f))
+
+    @classmethod
+    def from_dtype(cls, dtype: str, backend: str = NPY_BACKEND) -> "DatasetMetadata":
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Storage dtype {dtype} not supported, use one of {STORAGE_DTYPES}")
+        if backend not in OUTPUT_BACKENDS:
+            raise ValueError(f"Output backend {backend} not supported, use one of {OUTPUT_BACKENDS}")
+        return cls(dtype=dtype, scale=UINT16_SCALE if dtype == UINT16 else 1.0, backend=backend)
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        """Shape of one image, single-channel images have no channel axis"""
+        if self.channels == CHANNELS:
+            return self.height, self.width
+        return self.height, self.width, self.channels
+
+    @property
+    def decoded_dtype(self) -> str:
+        """Dtype of decoded images, compact storage dtypes are decoded to float32"""
+        return FLOAT64 if self.dtype == FLOAT64 else FLOAT32
+
+    def encode(self, image: np.ndarray) -> np.ndarray:
+        """Returns normalized image converted to the storage dtype"""
+        if self.dtype == UINT16:
+            return np.round(image / self.scale).astype(np.uint16)
+        return image.astype(self.dtype, copy=False)
+
+    def decode(self, image: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Returns stored image converted back to normalized floats, optionally written into out"""
+        if out is None:
+            out = np.empty(image.shape, dtype=self.decoded_dtype)
+        # Numpy would broadcast the image into an out of another shape
+        if out.shape != image.shape:
+            raise ValueError(f"Image of shape {image.shape} can't be decoded into out of shape {out.shape}")
+        if self.dtype == UINT16:
+            return np.multiply(image, np.float32(self.scale), out=out)
+        np.copyto(out, image)
+        return out
+
+
+def get_resized_path(path: str, size: int) -> str:
+    """Returns path to the derivative of a processed dataset resized to size x size"""
+    return os.path.join(path, RESIZED_FOLDER_FORMAT.format(height=size, width=size))
+
+
+def list_resized_paths(path: str) -> list[str]:
+    """Returns paths to the resized derivatives of a processed dataset"""
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        os.path.join(path, folder)
+        for folder in os.listdir(path)
+        if RESIZED_FOLDER_PATTERN.fullmatch(folder) and os.path.isdir(os.path.join(path, folder))
+    )
+
+
+def save_manifest(path: str, rows: list[tuple[str, str]]) -> None:
+    """Saves manifest of (image path, label) rows, image paths are relative to the manifest"""
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["path", "label"])
+        for image_path, label in rows:
+            writer.writerow([os.path.relpath(image_path, directory), label])
+
+
+def load_manifest(path: str) -> list[tuple[str, str]]:
+    """Returns (absolute image path, label) rows of a manifest"""
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        return [
+            (os.path.normpath(os.path.join(directory, row["path"])), row["label"])
+            for row in csv.DictReader(f)
+        ]
@@ -1,11 +1,27 @@
+import os
+import sys
+import json
+import subprocess
+
 import pytest
 import numpy as np
 import tensorflow as tf
 
-from src.dataset.dataset_loader import DatasetLoader
+from src.dataset.dataset_loader import DatasetLoader, LOADER_MODES
+from src.preprocessing.shard_writer import ShardWriter, save_shard_index
+from src.preprocessing.packed_dataset import PackedWriter, save_packed_dataset
+from src.preprocessing.utils import (
+    DatasetMetadata,
+    STORAGE_DTYPES,
+    TFRECORD_BACKEND,
+    NODULE,
+    save_manifest,
+)
 
 HEIGHT = 512
 WIDTH = 512
+RESIZED_SIZE = 32
+PATCH_SIZE = 16
 
 BATCH_SIZE = 32
 
@@ -37,12 +53,256 @@ class TestDatasetLoader:
         dataset = loader.get_dataset()
         assert isinstance(dataset, tf.data.Dataset)
 
-    def test_dataset(self, mock_dataset_dir):
+    @pytest.mark.parametrize("mode", LOADER_MODES)
+    def test_dataset(self, mock_dataset_dir, mode):
         """Test that the created tf.data.Dataset returns the correct data."""
-        loader = DatasetLoader(mock_dataset_dir)
+        loader = DatasetLoader(mock_dataset_dir, mode=mode)
         dataset = loader.get_dataset()
         
         for x, y in dataset:
             assert x.shape == (NO_IMAGES, HEIGHT, WIDTH)
             assert y.shape == (NO_IMAGES,)
             break
+
+    def test_invalid_mode(self, mock_dataset_dir):
+        """Test that an unknown loader mode is rejected."""
+        with pytest.raises(ValueError):
+            DatasetLoader(mock_dataset_dir, mode="threads")
+
+    @pytest.mark.parametrize("mode", LOADER_MODES)
+    @pytest.mark.parametrize("dtype", STORAGE_DTYPES)
+    def test_storage_dtype(self, tmp_path, dtype, mode):
+        """Test that images saved in compact dtypes are decoded to normalized floats."""
+        metadata = DatasetMetadata.from_dtype(dtype)
+        image = np.random.rand(HEIGHT, WIDTH)
+        for label in ["nodule", "non_nodule"]:
+            (tmp_path / label).mkdir()
+            np.save(tmp_path / label / "img1.npy", metadata.encode(image))
+        metadata.save(str(tmp_path))
+
+        loader = DatasetLoader(str(tmp_path), mode=mode)
+        x, _ = next(iter(loader.get_dataset()))
+
+        assert x.dtype == tf.as_dtype(metadata.decoded_dtype)
+        np.testing.assert_allclose(x[0].numpy(), image, atol=1e-3)
+
+    @pytest.mark.parametrize("mode", LOADER_MODES)
+    def test_resized_dataset(self, tmp_path, mode):
+        """Test that images are loaded in the resolution recorded in the metadata."""
+        metadata = DatasetMetadata(height=RESIZED_SIZE, width=RESIZED_SIZE)
+        image = np.random.rand(RESIZED_SIZE, RESIZED_SIZE)
+        for label in ["nodule", "non_nodule"]:
+            (tmp_path / label).mkdir()
+            np.save(tmp_path / label / "img1.npy", image)
+        metadata.save(str(tmp_path))
+
+        loader = DatasetLoader(str(tmp_path), mode=mode)
+        x, _ = next(iter(loader.get_dataset()))
+
+        assert x.shape == (NO_IMAGES, RESIZED_SIZE, RESIZED_SIZE)
+        np.testing.assert_allclose(x[0].numpy(), image)
+
+    @pytest.mark.parametrize("mode", LOADER_MODES)
+    def test_stacked_dataset(self, tmp_path, mode):
+        """Test that stacks of neighbouring slices are loaded with their channels."""
+        metadata = DatasetMetadata(height=RESIZED_SIZE, width=RESIZED_SIZE, channels=3)
+        image = np.random.rand(RESIZED_SIZE, RESIZED_SIZE, 3)
+        for label in ["nodule", "non_nodule"]:
+            (tmp_path / label).mkdir()
+            np.save(tmp_path / label / "img1.npy", image)
+        metadata.save(str(tmp_path))
+
+        dataset = DatasetLoader(str(tmp_path), mode=mode).get_dataset()
+        x, _ = next(iter(dataset))
+
+        assert dataset.element_spec[0].shape.as_list() == [None, RESIZED_SIZE, RESIZED_SIZE, 3]
+        np.testing.assert_allclose(x[0].numpy(), image)
+
+    @pytest.mark.parametrize("dtype", STORAGE_DTYPES)
+    def test_shards(self, tmp_path, dtype):
+        """Test that images written to shards are read with labels like npy files."""
+        metadata = DatasetMetadata.from_dtype(dtype, TFRECORD_BACKEND)
+        images = np.random.rand(NO_IMAGES, HEIGHT, WIDTH)
+        shards_dir = tmp_path / "shards"
+        shards_dir.mkdir()
+        with ShardWriter(str(shards_dir)) as writer:
+            shard_path = writer.write(metadata.encode(images[0]), "nodule", "img1")
+            writer.write(metadata.encode(images[1]), "non_nodule", "img2")
+        save_shard_index(str(tmp_path), [{"path": shard_path, "records": NO_IMAGES, "nodules": 1}])
+        metadata.save(str(tmp_path))
+
+        loader = DatasetLoader(str(tmp_path))
+        x, y = next(iter(loader.get_dataset()))
+
+        assert x.shape == (NO_IMAGES, HEIGHT, WIDTH)
+        assert x.dtype == tf.as_dtype(metadata.decoded_dtype)
+        for image, label in zip(x.numpy(), y.numpy()):
+            np.testing.assert_allclose(image, images[1 - label], atol=1e-3)
+
+    def test_manifest(self, mock_dataset_dir):
+        """Test that the DatasetLoader reads images listed in a manifest."""
+        manifest_path = os.path.join(mock_dataset_dir, "train.csv")
+        save_manifest(manifest_path, [(os.path.join(mock_dataset_dir, NODULE, "img1.npy"), NODULE)])
+
+        loader = DatasetLoader(manifest_path)
+        x, y = next(iter(loader.get_dataset()))
+
+        assert x.shape == (1, HEIGHT, WIDTH)
+        assert y.numpy().tolist() == [1]
+
+    def test_data_generator(self, mock_dataset_dir):
+        """Test that a batch is loaded into one array with the saved images."""
+        loader = DatasetLoader(mock_dataset_dir)
+
+        data_batch, batch_labels = next(loader._data_generator())
+
+        assert data_batch.shape == (NO_IMAGES, HEIGHT, WIDTH)
+        for image, label in zip(data_batch, batch_labels):
+            label_dir = NODULE if label else "non_nodule"
+            np.testing.assert_array_equal(image, np.load(os.path.join(mock_dataset_dir, label_dir, "img1.npy")))
+
+    @pytest.mark.parametrize("mode", LOADER_MODES)
+    def test_corrupt_image(self, mock_dataset_dir, mode):
+        """Test that a corrupt image is skipped and the batch is filled from the next images."""
+        np.save(os.path.join(mock_dataset_dir, NODULE, "img2.npy"), np.random.rand(HEIGHT, WIDTH))
+        corrupt_path = os.path.join(mock_dataset_dir, NODULE, "img3.npy")
+        with open(corrupt_path, "wb") as f:
+            f.write(b"corrupt")
+
+        loader = DatasetLoader(mock_dataset_dir, batch_size=3, mode=mode)
+        batches = [x.shape[0] for x, _ in loader.get_dataset()]
+
+        assert batches == [3]
+
+    def test_native_npy_version(self, mock_dataset_dir):
+        """Test that the native mode reads .npy files of version 2.0 like those of version 1.0."""
+        image = np.random.rand(HEIGHT, WIDTH)
+        with open(os.path.join(mock_dataset_dir, NODULE, "img1.npy"), "wb") as f:
+            np.lib.format.write_array(f, image, version=(2, 0))
+
+        loader = DatasetLoader(mock_dataset_dir, mode="native")
+        x, y = next(iter(loader.get_dataset()))
+
+        np.testing.assert_array_equal(x.numpy()[list(y.numpy()).index(1)], image)
+
+    def test_native_fortran_order(self, mock_dataset_dir):
+        """Test that the native mode rejects images in Fortran order."""
+        for label in [NODULE, "non_nodule"]:
+            np.save(os.path.join(mock_dataset_dir, label, "img1.npy"), np.asfortranarray(np.random.rand(HEIGHT, WIDTH)))
+
+        with pytest.raises(ValueError):
+            DatasetLoader(mock_dataset_dir, mode="native").get_dataset()
+
+    def test_native_invalid_magic(self, mock_dataset_dir):
+        """Test that the native mode skips a file with the data offset but no .npy magic string."""
+        image_path = os.path.join(mock_dataset_dir, NODULE, "img1.npy")
+        with open(image_path, "rb") as f:
+            contents = f.read()
+        with open(os.path.join(mock_dataset_dir, NODULE, "img2.npy"), "wb") as f:
+            f.write(b"\x00" * 6 + contents[6:])
+
+        loader = DatasetLoader(mock_dataset_dir, batch_size=3, mode="native")
+        batches = [x.shape[0] for x, _ in loader.get_dataset()]
+
+        assert batches == [2]
+
+    def test_quarantine(self, mock_dataset_dir):
+        """Test that corrupt images are quarantined and skipped by later runs."""
+        corrupt_path = os.path.join(mock_dataset_dir, NODULE, "img2.npy")
+        np.save(corrupt_path, np.random.rand(HEIGHT // 2, WIDTH))
+
+        assert DatasetLoader(mock_dataset_dir).verify() == [corrupt_path]
+
+        loader = DatasetLoader(mock_dataset_dir)
+        paths, _ = loader._get_data()
+        assert corrupt_path in loader.quarantine
+        assert corrupt_path not in paths
+        assert len(paths) == NO_IMAGES
+
+    @pytest.mark.parametrize("mode", LOADER_MODES)
+    def test_packed(self, mock_dataset_dir, tmp_path, mode):
+        """Test that images of a packed dataset are read with their labels."""
+        rows = [
+            (os.path.join(mock_dataset_dir, label, "img1.npy"), label)
+            for label in [NODULE, "non_nodule"]
+        ]
+        save_packed_dataset(str(tmp_path / "packed"), rows, DatasetMetadata())
+
+        loader = DatasetLoader(str(tmp_path / "packed"), mode=mode)
+        x, y = next(iter(loader.get_dataset()))
+
+        assert x.shape == (NO_IMAGES, HEIGHT, WIDTH)
+        for image, label in zip(x.numpy(), y.numpy()):
+            np.testing.assert_array_equal(image, np.load(rows[1 - label][0]))
+
+    def test_packed_patches(self, tmp_path):
+        """Test that multi-channel patches written by PackedWriter are read with their channels."""
+        patches = np.random.rand(NO_IMAGES, PATCH_SIZE, PATCH_SIZE, 3).astype(np.float32)
+        metadata = DatasetMetadata(dtype="float32", height=PATCH_SIZE, width=PATCH_SIZE, channels=3)
+        with PackedWriter(str(tmp_path / "patches"), metadata) as writer:
+            writer.write(patches[:1], ["patch0"], [NODULE])
+            writer.write(patches[1:], ["patch1"], ["non_nodule"])
+
+        loader = DatasetLoader(str(tmp_path / "patches"))
+        dataset = loader.get_dataset()
+        x, y = next(iter(dataset))
+
+        assert dataset.element_spec[0].shape.as_list() == [None, PATCH_SIZE, PATCH_SIZE, 3]
+        for image, label in zip(x.numpy(), y.numpy()):
+            np.testing.assert_array_equal(image, patches[1 - label])
+
+    @pytest.mark.parametrize("num_workers", [1, 2])
+    def test_packed_runs(self, tmp_path, num_workers):
+        """Test that runs of consecutive and single images are decoded into their rows."""
+        patches = np.stack([np.full((PATCH_SIZE, PATCH_SIZE), i, dtype=np.float32) for i in range(NO_IMAGES)])
+        metadata = DatasetMetadata(dtype="float32", height=PATCH_SIZE, width=PATCH_SIZE)
+        with PackedWriter(str(tmp_path / "patches"), metadata) as writer:
+            writer.write(patches, [f"patch{i}" for i in range(NO_IMAGES)], [NODULE] * NO_IMAGES)
+
+        loader = DatasetLoader(
+            str(tmp_path / "patches"), batch_size=NO_IMAGES, num_workers=num_workers, worker_index=0
+        )
+        x, _ = next(iter(loader.get_dataset()))
+
+        for image in x.numpy():
+            np.testing.assert_array_equal(image, patches[int(image[0, 0])])
+        assert sorted(x.numpy()[:, 0, 0]) == list(range(0, NO_IMAGES, num_workers))
+
+    def test_tf_config(self, mock_dataset_dir, monkeypatch):
+        """Test that number of workers and worker index are read from TF_CONFIG."""
+        monkeypatch.setenv("TF_CONFIG", json.dumps({
+            "cluster": {"chief": ["host0:2222"], "worker": ["host1:2222", "host2:2222"]},
+            "task": {"type": "worker", "index": 1},
+        }))
+
+        loader = DatasetLoader(mock_dataset_dir)
+
+        assert (loader.num_workers, loader.worker_index) == (3, 2)
+
+    def test_workers(self, mock_dataset_dir):
+        """Test that local worker processes read disjoint partitions of the dataset."""
+        for i in range(2, 5):
+            np.save(os.path.join(mock_dataset_dir, NODULE, f"img{i}.npy"), np.full((HEIGHT, WIDTH), i))
+
+        script = (
+            "import sys; from src.dataset.dataset_loader import DatasetLoader;"
+            "loader = DatasetLoader(sys.argv[1], batch_size=1);"
+            "print(sorted(float(x.numpy().sum()) for x, _ in loader.get_dataset()))"
+        )
+        partitions = []
+        for worker_index in range(2):
+            tf_config = {
+                "cluster": {"worker": ["host0:2222", "host1:2222"]},
+                "task": {"type": "worker", "index": worker_index},
+            }
+            output = subprocess.run(
+                [sys.executable, "-c", script, mock_dataset_dir],
+                env={**os.environ, "TF_CONFIG": json.dumps(tf_config)},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            partitions.append(json.loads(output.strip().splitlines()[-1]))
+
+        assert [len(partition) for partition in partitions] == [3, 2]
+        assert not set(partitions[0]) & set(partitions[1])
@@ -0,0 +1,119 @@
+import tempfile
+
+import numpy as np
+import pytest
+
+from src.dataset import epoch_cache
+from src.dataset.dataset_loader import DatasetLoader, AUTO_CACHE
+from src.dataset.epoch_cache import MEMORY_CACHE
+from src.preprocessing.utils import NODULE, NON_NODULE, UINT16, DatasetMetadata
+
+HEIGHT = 512
+WIDTH = 512
+
+NO_IMAGES = 6
+
+
+def write_dataset(path, dtype=UINT16):
+    metadata = DatasetMetadata.from_dtype(dtype)
+    for i in range(NO_IMAGES):
+        label = NODULE if i % 2 else NON_NODULE
+        (path / label).mkdir(parents=True, exist_ok=True)
+        np.save(path / label / f"img{i}.npy", metadata.encode(np.random.rand(HEIGHT, WIDTH)))
+    metadata.save(str(path))
+    return str(path)
+
+
+def epoch(dataset):
+    """Returns all images of one epoch by their sum, with labels"""
+    return sorted(
+        (round(float(image.sum()), 3), int(label))
+        for x, y in dataset
+        for image, label in zip(x.numpy(), y.numpy())
+    )
+
+
+class TestEpochCache:
+    def test_memory_cache(self, tmp_path):
+        """Test that the second epoch is served from memory with the same data."""
+        loader = DatasetLoader(write_dataset(tmp_path / "data"), batch_size=4, cache=MEMORY_CACHE)
+        dataset = loader.get_dataset()
+
+        first_epoch = epoch(dataset)
+        second_epoch = epoch(dataset)
+
+        info = loader.cache_info()
+        assert first_epoch == second_epoch
+        assert (info["hits"], info["misses"]) == (NO_IMAGES, NO_IMAGES)
+        assert info["hit_rate"] == 0.5
+        assert info["memory_bytes"] == NO_IMAGES * HEIGHT * WIDTH * 4
+
+    def test_disk_cache(self, tmp_path):
+        """Test that a complete disk cache is reused by a new loader."""
+        dataset_path = write_dataset(tmp_path / "data")
+        cache_path = str(tmp_path / "cache")
+
+        loader = DatasetLoader(dataset_path, batch_size=4, cache=cache_path)
+        first_epoch = epoch(loader.get_dataset())
+        assert loader.cache_info()["disk_bytes"] == NO_IMAGES * HEIGHT * WIDTH * 2
+
+        loader = DatasetLoader(dataset_path, batch_size=4, cache=cache_path)
+        assert epoch(loader.get_dataset()) == first_epoch
+        assert loader.cache_info()["hit_rate"] == 1.0
+
+    def test_auto_cache(self, tmp_path):
+        """Test that a small dataset is cached in memory."""
+        loader = DatasetLoader(write_dataset(tmp_path / "data"), cache=AUTO_CACHE)
+        epoch(loader.get_dataset())
+
+        assert loader.cache_info()["location"] == MEMORY_CACHE
+
+    def test_auto_disk_cache_workers(self, tmp_path, monkeypatch):
+        """Test that workers on one host cache their partitions in their own directories."""
+        monkeypatch.setattr(epoch_cache, "available_memory", lambda: 0)
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "tmp"))
+        dataset_path = write_dataset(tmp_path / "data")
+
+        loaders = [
+            DatasetLoader(dataset_path, batch_size=4, cache=AUTO_CACHE, num_workers=2, worker_index=i)
+            for i in range(2)
+        ]
+        epochs = [epoch(loader.get_dataset()) for loader in loaders]
+        locations = [loader.cache_info()["location"] for loader in loaders]
+
+        assert locations[0] != locations[1]
+        assert all(location.startswith(str(tmp_path / "tmp")) for location in locations)
+        assert not set(epochs[0]) & set(epochs[1])
+        assert [epoch(loader.get_dataset()) for loader in loaders] == epochs
+
+    @pytest.mark.parametrize("corrupt_last", [False, True])
+    def test_disk_cache_corrupt_image(self, tmp_path, monkeypatch, corrupt_last):
+        """Test that a disk cache with a corrupt image read first or last completes without it and is reused."""
+        dataset_path = write_dataset(tmp_path / "data")
+        corrupt_path = str(tmp_path / "data" / NON_NODULE / "img0.npy")
+        with open(corrupt_path, "wb") as f:
+            f.write(b"corrupt")
+        cache_path = str(tmp_path / "cache")
+
+        loader = DatasetLoader(dataset_path, batch_size=4, cache=cache_path)
+        # Epochs read the corrupt image first or last instead of in random order
+        monkeypatch.setattr(np.random, "permutation", lambda n: np.argsort(
+            [(path == corrupt_path) == corrupt_last for path in loader._epoch_cache.paths], kind="stable"
+        ))
+        first_epoch = epoch(loader.get_dataset())
+        monkeypatch.undo()
+        assert len(first_epoch) == NO_IMAGES - 1
+        assert loader.cache_info()["disk_bytes"] == NO_IMAGES * HEIGHT * WIDTH * 2
+
+        loader = DatasetLoader(dataset_path, batch_size=4, cache=cache_path)
+        assert epoch(loader.get_dataset()) == first_epoch
+        assert loader.cache_info()["hit_rate"] == 1.0
+        assert loader.cache_info()["disk_bytes"] == (NO_IMAGES - 1) * HEIGHT * WIDTH * 2
+
+    def test_empty_cache(self, tmp_path):
+        """Test that a cache of an empty split takes the image shape from the metadata."""
+        cache = epoch_cache.EpochCache(
+            np.array([], dtype=str), np.array([], dtype=np.uint8), DatasetMetadata.from_dtype(UINT16), str(tmp_path)
+        )
+
+        assert cache.info()["images"] == 0
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.model.builders.base import ModelBuilderError
+
+from tests.model.builders.test_single_channel import INPUT_SHAPE, SmallBuilder
+
+BATCH_SIZE = 2
+
+
+class TestModelBuilder:
+    def test_preprocessing_layers(self):
+        """Test that slices are resized to the input shape before the RGB conversion."""
+        builder = SmallBuilder()
+        builder.set_preprocessing_layers()
+
+        layers = builder.preprocessing_layers.layers
+        assert any(isinstance(layer, tf.keras.layers.Resizing) for layer in layers)
+        assert builder.preprocessing_layers(np.zeros((BATCH_SIZE, 512, 512))).shape == (BATCH_SIZE, *INPUT_SHAPE)
+
+    def test_preprocessing_layers_resized_input(self):
+        """Test that slices resized in preprocessing aren't resized again."""
+        builder = SmallBuilder(input_size=INPUT_SHAPE[:2])
+        builder.set_preprocessing_layers()
+
+        layers = builder.preprocessing_layers.layers
+        assert not any(isinstance(layer, tf.keras.layers.Resizing) for layer in layers)
+        x = np.zeros((BATCH_SIZE, *INPUT_SHAPE[:2]))
+        assert builder.preprocessing_layers(x).shape == (BATCH_SIZE, *INPUT_SHAPE)
+
+    def test_preprocessing_layers_stacked_input(self):
+        """Test that stacks of neighbouring slices feed the RGB channels without conversion."""
+        builder = SmallBuilder(input_size=INPUT_SHAPE[:2], channels=3)
+        builder.set_preprocessing_layers()
+
+        layers = builder.preprocessing_layers.layers
+        assert not any(
+            isinstance(layer, tf.keras.layers.Lambda) and layer.function is tf.image.grayscale_to_rgb
+            for layer in layers
+        )
+        x = np.random.rand(BATCH_SIZE, *INPUT_SHAPE).astype(np.float32)
+        np.testing.assert_allclose(builder.preprocessing_layers(x), tf.keras.applications.vgg16.preprocess_input(x.copy()), rtol=1e-6)
+
+    def test_stacked_input_single_channel(self):
+        """Test that single-channel base models don't take stacks of slices."""
+        with pytest.raises(ModelBuilderError):
+            SmallBuilder(single_channel=True, channels=3)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.model.builders import ModelBuilder
+from src.model.builders.single_channel import fold_single_channel
+from src.preprocessing.utils import HEIGHT, WIDTH
+
+INPUT_SHAPE = (64, 64, 3)
+BATCH_SIZE = 2
+
+APPLICATIONS = [
+    (tf.keras.applications.MobileNetV3Small, tf.keras.applications.mobilenet_v3.preprocess_input),
+    (tf.keras.applications.ResNet50, tf.keras.applications.resnet.preprocess_input),
+    (tf.keras.applications.VGG16, tf.keras.applications.vgg16.preprocess_input),
+    (tf.keras.applications.ConvNeXtTiny, tf.keras.applications.convnext.preprocess_input),
+]
+
+
+def small_application(input_shape, include_top, weights):
+    """Application with affine preprocessing layers, padding and a batch normalized stem"""
+    tf.keras.utils.set_random_seed(0)
+    inputs = tf.keras.Input(shape=input_shape)
+    x = tf.keras.layers.Rescaling(1 / 255)(inputs)
+    x = tf.keras.layers.Normalization(mean=[0.485, 0.456, 0.406], variance=[0.052, 0.05, 0.051])(x)
+    x = tf.keras.layers.ZeroPadding2D(padding=1)(x)
+    x = tf.keras.layers.Conv2D(4, 3, strides=2, use_bias=False)(x)
+    x = tf.keras.layers.BatchNormalization()(x)
+    x = tf.keras.layers.Conv2D(4, 3, padding="same", activation="relu")(x)
+    return tf.keras.Model(inputs, x)
+
+
+class SmallBuilder(ModelBuilder):
+    """Builder with a small base model, so tests don't download weights"""
+
+    def __str__(self):
+        return "Small"
+
+    def set_preprocessing_layers(self):
+        self.preprocessing_layers = self.create_preprocessing_layers(
+            INPUT_SHAPE, tf.keras.applications.vgg16.preprocess_input
+        )
+
+    def set_model_layers(self):
+        self.model_layers = self.create_base_model(
+            small_application, INPUT_SHAPE, tf.keras.applications.vgg16.preprocess_input
+        )
+
+    def set_output_layers(self):
+        self.output_layers = tf.keras.Sequential([
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(1, activation="sigmoid", dtype="float32"),
+        ])
+
+    def build(self):
+        return super().build()
+
+    def reset(self):
+        super().reset()
+
+
+def features(builder, x):
+    builder.set_preprocessing_layers()
+    builder.set_model_layers()
+    return builder.model_layers(builder.preprocessing_layers(x), training=False).numpy()
+
+
+class TestSingleChannel:
+    @pytest.mark.parametrize("application, preprocess_input", APPLICATIONS, ids=lambda value: value.__name__)
+    def test_fold_single_channel(self, application, preprocess_input):
+        """Test that the folded base model has the features of the RGB base model, borders included."""
+        base_model = application(input_shape=INPUT_SHAPE, include_top=False, weights=None)
+        x = np.random.default_rng(0).uniform(0, 255, size=(BATCH_SIZE, *INPUT_SHAPE[:2], 1)).astype(np.float32)
+        expected = base_model(preprocess_input(np.repeat(x, 3, axis=-1)), training=False).numpy()
+
+        folded_model = fold_single_channel(base_model, preprocess_input)
+
+        assert folded_model.input_shape == (None, *INPUT_SHAPE[:2], 1)
+        np.testing.assert_allclose(
+            folded_model(x, training=False).numpy(), expected, rtol=1e-4, atol=1e-4 * np.abs(expected).max()
+        )
+
+    def test_single_channel_builder(self):
+        """Test that the single-channel builder skips the RGB conversion and keeps the features."""
+        x = np.random.default_rng(0).uniform(0, 255, size=(BATCH_SIZE, HEIGHT, WIDTH)).astype(np.float32)
+        expected = features(SmallBuilder(), x)
+
+        builder = SmallBuilder(single_channel=True)
+        np.testing.assert_allclose(features(builder, x), expected, rtol=1e-4, atol=1e-4)
+        assert builder.model_layers.input_shape == (None, *INPUT_SHAPE[:2], 1)
+        assert not builder.model_layers.trainable
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from src.model.builders import (
+    ConvNeXtBuilder,
+    DenseNetBuilder,
+    EfficientNetBuilder,
+    EfficientNetV2Builder,
+    InceptionNetBuilder,
+    InceptionResNetBuilder,
+    MobileNetBuilder,
+    NASNetBuilder,
+    ResNetBuilder,
+    ResNetV2Builder,
+    VGGBuilder,
+    XceptionBuilder,
+)
+from src.model.director import ModelDirector
+from src.model.execution import EXECUTION_MODES, GRAPH_EXECUTION, get_compile_options
+from src.preprocessing.utils import HEIGHT, WIDTH
+
+BUILDERS = [
+    ConvNeXtBuilder,
+    DenseNetBuilder,
+    EfficientNetBuilder,
+    EfficientNetV2Builder,
+    InceptionNetBuilder,
+    InceptionResNetBuilder,
+    MobileNetBuilder,
+    NASNetBuilder,
+    ResNetBuilder,
+    ResNetV2Builder,
+    VGGBuilder,
+    XceptionBuilder,
+]
+
+BATCH_SIZE = 2
+
+
+class TestExecution:
+    @pytest.mark.parametrize("execution", EXECUTION_MODES)
+    def test_get_compile_options(self, execution):
+        options = get_compile_options(execution)
+        assert options["run_eagerly"] == (execution == "eager")
+        assert options["jit_compile"] == (execution == "xla")
+
+    def test_get_compile_options_invalid(self):
+        with pytest.raises(ValueError):
+            get_compile_options("lazy")
+
+    @pytest.mark.parametrize("builder_cls", BUILDERS, ids=lambda builder_cls: builder_cls.__name__)
+    def test_graph_training(self, builder_cls):
+        """Test that every model, including its Lambda preprocessing layers, trains as a graph."""
+        model = ModelDirector(builder_cls()).make()
+        model.compile(optimizer="adam", loss="binary_crossentropy", **get_compile_options(GRAPH_EXECUTION))
+
+        x = np.random.rand(BATCH_SIZE, HEIGHT, WIDTH)
+        y = np.array([0, 1], dtype=np.uint8)
+        history = model.fit(x, y, batch_size=BATCH_SIZE, epochs=1, verbose=0)
+
+        assert not model.run_eagerly
+        assert np.isfinite(history.history["loss"][0])
+        assert model.predict(x, verbose=0).shape == (BATCH_SIZE, 1)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.model.builders import ModelBuilder
+from src.model.director import ModelDirector
+from src.model.feature_extractor import FeatureExtractor
+
+SIZE = 16
+NO_IMAGES = 8
+
+
+class SmallBuilder(ModelBuilder):
+    """Builder with a small frozen base model, so tests don't download weights"""
+
+    def __str__(self):
+        return "Small"
+
+    def set_preprocessing_layers(self):
+        self.preprocessing_layers = tf.keras.Sequential(
+            [tf.keras.layers.Reshape(target_shape=(SIZE, SIZE, 1), input_shape=(SIZE, SIZE))]
+        )
+
+    def set_model_layers(self):
+        base_model = tf.keras.Sequential(
+            [tf.keras.layers.Conv2D(4, 3, input_shape=(SIZE, SIZE, 1))]
+        )
+        base_model.trainable = False
+        self.model_layers = base_model
+
+    def set_output_layers(self):
+        self.output_layers = tf.keras.Sequential([
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(units=8, activation="relu"),
+            tf.keras.layers.Dropout(rate=0.2),
+            tf.keras.layers.Dense(1, activation="sigmoid"),
+        ])
+
+    def build(self):
+        return super().build()
+
+    def reset(self):
+        super().reset()
+
+
+@pytest.fixture
+def builder():
+    builder = SmallBuilder()
+    ModelDirector(builder).make()
+    return builder
+
+
+@pytest.fixture
+def dataset():
+    x = np.random.rand(NO_IMAGES, SIZE, SIZE).astype(np.float32)
+    y = (np.arange(NO_IMAGES) % 2).astype(np.uint8)
+    return tf.data.Dataset.from_tensor_slices((x, y)).batch(3)
+
+
+class TestFeatureExtractor:
+    def test_extract(self, builder, dataset, tmp_path):
+        """Test that pooled embeddings and labels of all slices are saved."""
+        extractor = FeatureExtractor(builder)
+        extractor.extract(dataset, str(tmp_path))
+
+        assert FeatureExtractor.exists(str(tmp_path))
+        features, labels = next(iter(FeatureExtractor.load(str(tmp_path), batch_size=NO_IMAGES, shuffle=False)))
+        x, y = next(iter(dataset.unbatch().batch(NO_IMAGES)))
+        np.testing.assert_allclose(features, extractor.embedding_model(x), rtol=1e-5)
+        np.testing.assert_array_equal(labels, y)
+
+    def test_head_matches_model(self, builder, dataset, tmp_path):
+        """Test that the head on embeddings predicts like the whole model and shares its weights."""
+        extractor = FeatureExtractor(builder)
+        extractor.extract(dataset, str(tmp_path))
+
+        extractor.head.compile(optimizer="adam", loss="binary_crossentropy")
+        extractor.head.fit(FeatureExtractor.load(str(tmp_path)), epochs=2, verbose=0)
+
+        x, _ = next(iter(dataset))
+        np.testing.assert_allclose(
+            extractor.head(extractor.embedding_model(x)), builder.model(x), rtol=1e-5
+        )
+        assert builder.model.layers[-1].layers[-1] is extractor.head.layers[-1]
+
+    def test_embedding_model_input_cast(self):
+        """Test that embeddings of a mixed model are computed with the input cast of the model."""
+        builder = SmallBuilder(precision="mixed_bfloat16")
+        ModelDirector(builder).make()
+        extractor = FeatureExtractor(builder)
+
+        assert extractor.embedding_model.layers[0] is builder.model.layers[0] is builder.input_cast_layer
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.model.builders import ModelBuilder
+from src.model.builders.base import ModelBuilderError, PRECISION_POLICIES
+from src.model.director import ModelDirector
+
+SIZE = 16
+RESIZED_SIZE = 8
+BATCH_SIZE = 4
+
+
+class SmallBuilder(ModelBuilder):
+    """Builder with the preprocessing steps of the builders and a small base model"""
+
+    def __str__(self):
+        return "Small"
+
+    def set_preprocessing_layers(self):
+        self.preprocessing_layers = tf.keras.Sequential([
+            tf.keras.layers.Reshape(target_shape=(SIZE, SIZE, 1), input_shape=(SIZE, SIZE)),
+            tf.keras.layers.Lambda(tf.image.grayscale_to_rgb),
+            tf.keras.layers.Resizing(height=RESIZED_SIZE, width=RESIZED_SIZE),
+        ])
+
+    def set_model_layers(self):
+        base_model = tf.keras.Sequential(
+            [tf.keras.layers.Conv2D(4, 3, input_shape=(RESIZED_SIZE, RESIZED_SIZE, 3))]
+        )
+        base_model.trainable = False
+        self.model_layers = base_model
+
+    def set_output_layers(self):
+        self.output_layers = tf.keras.Sequential([
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(units=8, activation="relu"),
+            tf.keras.layers.Dense(1, activation="sigmoid", dtype="float32"),
+        ])
+
+    def build(self):
+        return super().build()
+
+    def reset(self):
+        super().reset()
+
+
+class TestPrecision:
+    @pytest.mark.parametrize("precision", PRECISION_POLICIES)
+    def test_make(self, precision):
+        """Test that layers compute with the precision and the output stays float32."""
+        model = ModelDirector(SmallBuilder(precision=precision)).make()
+
+        compute_dtype = tf.keras.mixed_precision.Policy(precision).compute_dtype
+        assert model.layers[0].compute_dtype == compute_dtype
+        assert model.layers[-2].layers[0].compute_dtype == compute_dtype
+
+        x = np.random.rand(BATCH_SIZE, SIZE, SIZE)
+        y = np.arange(BATCH_SIZE) % 2
+        model.compile(optimizer="adam", loss="binary_crossentropy")
+        history = model.fit(x, y, batch_size=BATCH_SIZE, epochs=1, verbose=0)
+
+        assert np.isfinite(history.history["loss"][0])
+        assert all(weight.dtype == tf.float32 for weight in model.weights)
+        assert model(x).dtype == tf.float32
+
+    @pytest.mark.parametrize("precision", PRECISION_POLICIES)
+    def test_make_input_cast(self, precision):
+        """Test that only mixed models cast the input and that the cast is serializable."""
+        builder = SmallBuilder(precision=precision)
+        model = ModelDirector(builder).make()
+
+        assert ("input_cast" in [layer.name for layer in model.layers]) == (precision != "float32")
+        assert (builder.input_cast_layer is None) == (precision == "float32")
+        restored = tf.keras.Sequential.from_config(model.get_config())
+        assert restored.layers[0].compute_dtype == model.layers[0].compute_dtype
+
+    def test_make_restores_policy(self):
+        """Test that the global policy is restored after building."""
+        ModelDirector(SmallBuilder()).make(precision="mixed_bfloat16")
+        assert tf.keras.mixed_precision.global_policy().name == "float32"
+
+    def test_make_precision_overrides_builder(self):
+        model = ModelDirector(SmallBuilder(precision="mixed_float16")).make(precision="mixed_bfloat16")
+        assert model.layers[0].compute_dtype == "bfloat16"
+
+    def test_invalid_precision(self):
+        with pytest.raises(ModelBuilderError):
+            SmallBuilder(precision="float8")
+        with pytest.raises(ModelBuilderError):
+            ModelDirector(SmallBuilder()).make(precision="float8")
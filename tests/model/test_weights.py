@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.model.builders import ModelBuilder
+from src.model.weights import (
+    IMAGENET_WEIGHTS,
+    WEIGHTS_DIR_ENV,
+    WeightStore,
+    WeightStoreError,
+)
+
+SIZE = 16
+
+
+class SmallBuilder(ModelBuilder):
+    """Builder with a small base model loading its weights like Keras applications"""
+
+    def __str__(self):
+        return "Small"
+
+    def set_preprocessing_layers(self):
+        self.preprocessing_layers = tf.keras.Sequential(
+            [tf.keras.layers.Reshape(target_shape=(SIZE, SIZE, 1), input_shape=(SIZE, SIZE))]
+        )
+
+    def set_model_layers(self):
+        base_model = tf.keras.Sequential(
+            [tf.keras.layers.Conv2D(4, 3, input_shape=(SIZE, SIZE, 1))]
+        )
+        weights = self.pretrained_weights()
+        if weights != IMAGENET_WEIGHTS:
+            base_model.load_weights(weights)
+        base_model.trainable = False
+        self.model_layers = base_model
+
+    def set_output_layers(self):
+        self.output_layers = tf.keras.Sequential([
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(1, activation="sigmoid", dtype="float32"),
+        ])
+
+    def build(self):
+        return super().build()
+
+    def reset(self):
+        super().reset()
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Store with weights of the small base model"""
+    store = WeightStore(str(tmp_path / "weights"))
+    builder = SmallBuilder(weight_store=store)
+    builder.set_model_layers()
+    store.save(str(builder), builder.model_layers)
+    return store, builder.model_layers
+
+
+class TestWeightStore:
+    def test_resolve(self, store):
+        """Test that builders load the stored weights instead of downloading them."""
+        store, base_model = store
+        assert store.resolve("Small") == os.path.join(store.path, "small.h5")
+
+        builder = SmallBuilder(weight_store=store)
+        builder.set_model_layers()
+        for loaded, saved in zip(builder.model_layers.get_weights(), base_model.get_weights()):
+            np.testing.assert_array_equal(loaded, saved)
+
+    def test_resolve_not_stored(self, store, monkeypatch):
+        """Test that weights which aren't stored are downloaded."""
+        store, _ = store
+        assert store.resolve("VGG") == IMAGENET_WEIGHTS
+
+        monkeypatch.delenv(WEIGHTS_DIR_ENV, raising=False)
+        assert WeightStore().resolve("Small") == IMAGENET_WEIGHTS
+
+    def test_resolve_from_environment(self, store, monkeypatch):
+        store, _ = store
+        monkeypatch.setenv(WEIGHTS_DIR_ENV, store.path)
+        assert SmallBuilder().pretrained_weights() == store.resolve("Small")
+
+    def test_resolve_corrupt(self, store):
+        """Test that weights not matching their checksum aren't loaded."""
+        store, _ = store
+        with open(os.path.join(store.path, "small.h5"), "ab") as f:
+            f.write(b"corrupt")
+
+        with pytest.raises(WeightStoreError):
+            store.resolve("Small")
+
+    def test_remove(self, store):
+        store, _ = store
+        store.remove("Small")
+
+        assert not store.contains("Small")
+        assert not os.path.exists(os.path.join(store.path, "small.h5"))
@@ -0,0 +1,113 @@
+import pytest
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+SIZE = 64
+
+NO_SLICES = 4
+
+PATIENT_NO_SLICES = [2, 13, 4, 25]
+
+NODULE_Z_POSITION = -10.0
+
+ANNOTATION_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<LidcReadMessage xmlns="http://www.nih.gov">
+  <readingSession>
+    <unblindedReadNodule>
+      <roi>
+        <imageZposition>{z}</imageZposition>
+        <edgeMap><xCoord>20</xCoord><yCoord>30</yCoord></edgeMap>
+        <edgeMap><xCoord>24</xCoord><yCoord>30</yCoord></edgeMap>
+        <edgeMap><xCoord>24</xCoord><yCoord>34</yCoord></edgeMap>
+        <edgeMap><xCoord>20</xCoord><yCoord>34</yCoord></edgeMap>
+      </roi>
+    </unblindedReadNodule>
+  </readingSession>
+</LidcReadMessage>
+"""
+
+
+def make_image(size=SIZE):
+    """Returns a synthetic CT slice with a body and two lungs"""
+    yy, xx = np.mgrid[:size, :size]
+    center = size / 2
+    image = np.full((size, size), -50, dtype=np.int16)
+
+    body = ((yy - center) / (0.45 * size)) ** 2 + ((xx - center) / (0.45 * size)) ** 2 < 1
+    image[body] = 1000
+
+    for lung_center in (0.3 * size, 0.7 * size):
+        lung = ((yy - center) / (0.3 * size)) ** 2 + ((xx - lung_center) / (0.15 * size)) ** 2 < 1
+        image[lung] = 100
+
+    # Add noise so that Otsu threshold falls between lungs and body
+    noise = np.random.default_rng(0).integers(-20, 20, size=image.shape)
+    return (image + noise).astype(np.int16)
+
+
+def write_dicom(path, image, z_position, series_uid, patient_id="LIDC-IDRI-0001"):
+    """Writes a minimal CT dicom file and returns its SOPInstanceUID"""
+    uid = generate_uid()
+
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = pydicom.uid.CTImageStorage
+    file_meta.MediaStorageSOPInstanceUID = uid
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.SOPClassUID = pydicom.uid.CTImageStorage
+    ds.SOPInstanceUID = uid
+    ds.SeriesInstanceUID = series_uid
+    ds.PatientID = patient_id
+    ds.SliceLocation = z_position
+    ds.Rows, ds.Columns = image.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1
+    ds.PixelData = image.astype(np.int16).tobytes()
+    ds.save_as(str(path), write_like_original=False)
+
+    return uid
+
+
+@pytest.fixture
+def dicom_path(tmp_path):
+    path = tmp_path / "slice.dcm"
+    write_dicom(path, make_image(), NODULE_Z_POSITION, generate_uid())
+    return str(path)
+
+
+def write_series(dataset_dir, patient_id, no_slices=NO_SLICES):
+    """Writes an annotated series of a patient with a nodule on the first slice"""
+    series_dir = dataset_dir / patient_id / "study/series"
+    series_dir.mkdir(parents=True)
+
+    series_uid = generate_uid()
+    for i in range(no_slices):
+        z_position = NODULE_Z_POSITION + 2.5 * i
+        write_dicom(series_dir / f"1-{i:03d}.dcm", make_image(), z_position, series_uid, patient_id)
+
+    (series_dir / "069.xml").write_text(ANNOTATION_XML.format(z=NODULE_Z_POSITION))
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    """LIDC-IDRI like directory with one annotated series"""
+    write_series(tmp_path / "LIDC-IDRI", "LIDC-IDRI-0001")
+    return str(tmp_path / "LIDC-IDRI")
+
+
+@pytest.fixture
+def multi_patient_dataset_dir(tmp_path):
+    """LIDC-IDRI like directory with annotated series of different sizes"""
+    for i, no_slices in enumerate(PATIENT_NO_SLICES):
+        write_series(tmp_path / "LIDC-IDRI", f"LIDC-IDRI-{i:04d}", no_slices)
+    return str(tmp_path / "LIDC-IDRI")
@@ -0,0 +1,57 @@
+import os
+
+from src.preprocessing.annotation_index import AnnotationIndex
+from src.preprocessing.annotation_processor import AnnotationProcessor
+from src.preprocessing.utils import ProcessedAnnotation, Z_TOLERANCE
+
+from tests.preprocessing.conftest import NODULE_Z_POSITION
+
+
+def make_annotation(z_position):
+    return ProcessedAnnotation(
+        z_position=z_position, x_positions=[0, 1, 1], y_positions=[0, 0, 1]
+    )
+
+
+class TestAnnotationIndex:
+    def test_lookup(self):
+        """Test that annotations are grouped by z position and matched with tolerance."""
+        index = AnnotationIndex(
+            [make_annotation(z) for z in [2.5, -1.25, 2.5, 0.0]]
+        )
+
+        assert len(index) == 3
+        assert index.z_positions == [-1.25, 0.0, 2.5]
+        assert len(index.lookup(2.5)) == 2
+        assert len(index.lookup(2.5 + Z_TOLERANCE / 2)) == 2
+        assert index.lookup(2.5 + Z_TOLERANCE) == []
+        assert index.lookup(1.0) == []
+
+    def test_contains(self):
+        """Test that slice labels do not depend on exact float equality."""
+        index = AnnotationIndex([make_annotation(0.1 + 0.2)])
+
+        assert 0.3 in index
+        assert 0.3 + 2 * Z_TOLERANCE not in index
+
+    def test_polygons(self):
+        """Test that polygons are returned as (y, x) arrays."""
+        index = AnnotationIndex([make_annotation(0.0)])
+
+        ((y_positions, x_positions),) = index.polygons(0.0)
+        assert list(y_positions) == [0, 0, 1]
+        assert list(x_positions) == [0, 1, 1]
+
+    def test_annotation_processor_index(self, dataset_dir):
+        """Test that AnnotationProcessor builds the index of processed annotations."""
+        xml_path = next(
+            os.path.join(root, f)
+            for root, _, files in os.walk(dataset_dir)
+            for f in files
+            if f.endswith(".xml")
+        )
+        ap = AnnotationProcessor(path=xml_path)
+        ap.process()
+
+        assert ap.index is ap.index
+        assert NODULE_Z_POSITION in ap.index
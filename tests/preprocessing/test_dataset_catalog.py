@@ -0,0 +1,51 @@
+import os
+
+from src.preprocessing.dataset_catalog import DatasetCatalog
+from src.preprocessing.utils import DICOM_KEY, ANNOTATION_KEY
+
+from tests.preprocessing.conftest import NO_SLICES, NODULE_Z_POSITION, SIZE
+
+
+class TestDatasetCatalog:
+    def test_build(self, dataset_dir, tmp_path):
+        """Test that the catalog indexes headers of all slices."""
+        catalog = DatasetCatalog(dataset_dir, str(tmp_path / "catalog.sqlite"))
+        catalog.build()
+
+        slices = catalog.slices()
+        assert catalog.exists()
+        assert len(catalog) == 1
+        assert len(slices) == NO_SLICES
+        assert all(s["rows"] == SIZE and s["columns"] == SIZE for s in slices)
+        assert min(s["z_position"] for s in slices) == NODULE_Z_POSITION
+
+    def test_series(self, dataset_dir, tmp_path):
+        """Test that series are yielded with z-sorted dicom paths."""
+        catalog = DatasetCatalog(dataset_dir, str(tmp_path / "catalog.sqlite"))
+        catalog.build()
+
+        (series,) = list(catalog.series())
+        z_positions = {s["path"]: s["z_position"] for s in catalog.slices()}
+        assert series[ANNOTATION_KEY].endswith(".xml")
+        assert [z_positions[path] for path in series[DICOM_KEY]] == sorted(z_positions.values())
+
+    def test_incremental_build(self, dataset_dir, tmp_path, monkeypatch):
+        """Test that rebuilding only reads new or changed dicoms."""
+        catalog = DatasetCatalog(dataset_dir, str(tmp_path / "catalog.sqlite"))
+        catalog.build()
+
+        read_paths = []
+        read_header = DatasetCatalog._read_header
+        monkeypatch.setattr(
+            DatasetCatalog,
+            "_read_header",
+            staticmethod(lambda path, stat: read_paths.append(path) or read_header(path, stat)),
+        )
+        catalog.build()
+        assert read_paths == []
+
+        removed_path = catalog.slices()[0]["path"]
+        os.remove(removed_path)
+        catalog.build()
+        assert read_paths == []
+        assert len(catalog.slices()) == NO_SLICES - 1
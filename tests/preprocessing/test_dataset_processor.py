@@ -0,0 +1,364 @@
+import os
+
+import pytest
+import numpy as np
+
+from src.preprocessing import dataset_processor
+from src.preprocessing.dataset_processor import DatasetProcessor
+from src.preprocessing.utils import (
+    NODULE,
+    NON_NODULE,
+    TRAIN_FOLDER,
+    TEST_FOLDER,
+    UINT16,
+    COPY_SPLIT,
+    HARDLINK_SPLIT,
+    RENAME_SPLIT,
+    MANIFEST_SPLIT,
+    PACKED_SPLIT,
+    PACKED_BACKEND,
+    load_manifest,
+    SHARDS_FOLDER,
+    TFRECORD_BACKEND,
+    DatasetMetadata,
+    get_resized_path,
+    CROP_SLICE,
+    CROP_SERIES,
+    CROPS_FILENAME,
+    PATCH_2D,
+    PATCH_25D,
+    MIN_NEGATIVES_PER_SERIES,
+    PACKED_RAW_FILENAME,
+    LEDGER_FILENAME,
+)
+from src.preprocessing.lung_crop import load_crops
+from src.preprocessing.shard_writer import load_shard_index
+from src.preprocessing.packed_dataset import load_packed_dataset
+
+from tests.preprocessing.conftest import NO_SLICES, PATIENT_NO_SLICES, write_series
+
+
+class TestDatasetProcessor:
+    @pytest.mark.parametrize("series_mode", [False, True])
+    def test_process(self, multi_patient_dataset_dir, series_mode):
+        """Test that slices of all patients processed by workers are returned."""
+        data = DatasetProcessor(multi_patient_dataset_dir, series_mode=series_mode).process(
+            as_output=True
+        )
+
+        assert len(data["dicom"]) == sum(PATIENT_NO_SLICES)
+        assert data["annotation"].count(NODULE) == len(PATIENT_NO_SLICES)
+
+    def test_progress(self, multi_patient_dataset_dir, monkeypatch):
+        """Test that every series is counted once, also when its tasks finish one by one."""
+        bars = []
+
+        class RecordingTqdm(dataset_processor.tqdm):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                bars.append(self)
+
+        # One task in flight, so tasks of a series finish before its next task is submitted
+        monkeypatch.setattr(dataset_processor, "tqdm", RecordingTqdm)
+        monkeypatch.setattr(dataset_processor, "MAX_WORKERS", 1)
+        monkeypatch.setattr(dataset_processor, "TASKS_IN_FLIGHT_PER_WORKER", 1)
+        DatasetProcessor(multi_patient_dataset_dir).process()
+
+        assert bars[0].n == bars[0].total == len(PATIENT_NO_SLICES)
+
+    @pytest.mark.parametrize("series_mode", [False, True])
+    def test_process_and_save(self, dataset_dir, tmp_path, series_mode):
+        """Test that processed slices are saved in label folders."""
+        output_dir = tmp_path / "processed"
+        DatasetProcessor(dataset_dir, series_mode=series_mode).process_and_save(str(output_dir))
+
+        assert len(os.listdir(output_dir / NODULE)) == 1
+        assert len(os.listdir(output_dir / NON_NODULE)) == NO_SLICES - 1
+
+    def test_process_and_save_with_catalog(self, dataset_dir, tmp_path):
+        """Test that processing with a catalog saves the same slices."""
+        output_dir = tmp_path / "processed"
+        catalog_path = str(tmp_path / "catalog.sqlite")
+        DatasetProcessor(dataset_dir, catalog_path=catalog_path).process_and_save(str(output_dir))
+
+        assert os.path.exists(catalog_path)
+        assert len(os.listdir(output_dir / NODULE)) == 1
+        assert len(os.listdir(output_dir / NON_NODULE)) == NO_SLICES - 1
+
+    def test_process_and_save_with_catalog_new_series(self, dataset_dir, tmp_path):
+        """Test that a series added after the catalog was built is processed by the next run."""
+        output_dir = tmp_path / "processed"
+        dp = DatasetProcessor(dataset_dir, catalog_path=str(tmp_path / "catalog.sqlite"))
+        dp.process_and_save(str(output_dir))
+
+        write_series(tmp_path / "LIDC-IDRI", "LIDC-IDRI-0002")
+        dp.process_and_save(str(output_dir))
+
+        assert len(os.listdir(output_dir / NODULE)) == 2
+        assert len(os.listdir(output_dir / NON_NODULE)) == 2 * (NO_SLICES - 1)
+
+    def test_process_and_save_dtype(self, dataset_dir, tmp_path):
+        """Test that slices are saved in the requested dtype with metadata."""
+        output_dir = tmp_path / "processed"
+        dp = DatasetProcessor(dataset_dir)
+        dp.process_and_save(str(output_dir), dtype=UINT16)
+        dp.train_test_split(str(output_dir))
+
+        nodule_dir = output_dir / NODULE
+        image = np.load(nodule_dir / os.listdir(nodule_dir)[0])
+        assert image.dtype == np.uint16
+        assert image.max() == np.iinfo(np.uint16).max
+        for directory in [output_dir, output_dir / TRAIN_FOLDER, output_dir / TEST_FOLDER]:
+            assert DatasetMetadata.load(str(directory)).dtype == UINT16
+
+    def test_process_and_save_sizes(self, dataset_dir, tmp_path):
+        """Test that resized derivatives of every slice are saved with their metadata."""
+        output_dir = str(tmp_path / "processed")
+        DatasetProcessor(dataset_dir).process_and_save(output_dir, dtype=UINT16, sizes=[16, 32])
+
+        for size in [16, 32]:
+            resized_dir = get_resized_path(output_dir, size)
+            metadata = DatasetMetadata.load(resized_dir)
+            assert (metadata.dtype, metadata.shape) == (UINT16, (size, size))
+
+            for label in [NODULE, NON_NODULE]:
+                files = sorted(os.listdir(os.path.join(resized_dir, label)))
+                assert files == sorted(os.listdir(os.path.join(output_dir, label)))
+                assert np.load(os.path.join(resized_dir, label, files[0])).shape == (size, size)
+
+    def test_process_and_save_sizes_stale(self, dataset_dir, tmp_path):
+        """Test that derivatives are kept on resume and removed when the parameters change."""
+        output_dir = str(tmp_path / "processed")
+        dp = DatasetProcessor(dataset_dir)
+        dp.process_and_save(output_dir, sizes=[16])
+        nodule_file = os.listdir(os.path.join(output_dir, NODULE))[0]
+        resized_file = os.path.join(get_resized_path(output_dir, 16), NODULE, nodule_file)
+        mtime = os.stat(resized_file).st_mtime_ns
+
+        dp.process_and_save(output_dir, sizes=[16])
+        assert os.stat(resized_file).st_mtime_ns == mtime
+
+        dp.process_and_save(output_dir, sizes=[32])
+        assert not os.path.exists(get_resized_path(output_dir, 16))
+        assert os.path.exists(get_resized_path(output_dir, 32))
+
+    @pytest.mark.parametrize("split_mode", [None, RENAME_SPLIT])
+    def test_remove_processed_data_keeps_ledger(self, dataset_dir, tmp_path, split_mode):
+        """Test that a run after removing or moving processed images processes them again."""
+        output_dir = str(tmp_path / "processed")
+        dp = DatasetProcessor(dataset_dir)
+        dp.process_and_save(output_dir)
+        if split_mode is None:
+            dp.remove_processed_data(output_dir)
+        else:
+            dp.train_test_split(output_dir, mode=split_mode)
+
+        dp.process_and_save(output_dir)
+
+        assert os.path.exists(os.path.join(output_dir, LEDGER_FILENAME))
+        assert len(os.listdir(os.path.join(output_dir, NODULE))) == 1
+        assert len(os.listdir(os.path.join(output_dir, NON_NODULE))) == NO_SLICES - 1
+
+    def test_process_and_save_sizes_shards(self, dataset_dir, tmp_path):
+        """Test that resized derivatives aren't written next to shards."""
+        with pytest.raises(ValueError):
+            DatasetProcessor(dataset_dir).process_and_save(
+                str(tmp_path), backend=TFRECORD_BACKEND, sizes=[16]
+            )
+
+    @pytest.mark.parametrize("crop, series_mode", [(CROP_SLICE, False), (CROP_SERIES, True)])
+    def test_process_and_save_crop(self, dataset_dir, tmp_path, crop, series_mode):
+        """Test that slices are cropped to the lungs and their boxes are saved by uid."""
+        output_dir = str(tmp_path / "processed")
+        dp = DatasetProcessor(dataset_dir, series_mode=series_mode, crop=crop, crop_size=32)
+        dp.process_and_save(output_dir)
+
+        metadata = DatasetMetadata.load(output_dir)
+        assert (metadata.crop, metadata.shape) == (crop, (32, 32))
+
+        crops = load_crops(os.path.join(output_dir, CROPS_FILENAME))
+        assert len(crops) == NO_SLICES
+        for label in [NODULE, NON_NODULE]:
+            for file in os.listdir(os.path.join(output_dir, label)):
+                assert np.load(os.path.join(output_dir, label, file)).shape == (32, 32)
+                y0, x0, y1, x1 = crops[file.removesuffix(".npy")]
+                assert y1 - y0 == x1 - x0 < 64
+        if crop == CROP_SERIES:
+            assert len(set(crops.values())) == 1
+
+    def test_process_and_save_stack_slices(self, dataset_dir, tmp_path):
+        """Test that slices are saved with their neighbours as channels and metadata records them."""
+        output_dir = str(tmp_path / "processed")
+        DatasetProcessor(dataset_dir, series_mode=True, stack_slices=True).process_and_save(output_dir, sizes=[16])
+
+        assert DatasetMetadata.load(output_dir).channels == 3
+        assert DatasetMetadata.load(get_resized_path(output_dir, 16)).shape == (16, 16, 3)
+        nodule_dir = os.path.join(output_dir, NODULE)
+        image = np.load(os.path.join(nodule_dir, os.listdir(nodule_dir)[0]))
+        assert image.shape == (64, 64, 3)
+
+    @pytest.mark.parametrize("series_mode, crop", [(False, None), (True, CROP_SLICE)])
+    def test_stack_slices_invalid(self, dataset_dir, series_mode, crop):
+        """Test that slices are only stacked when workers see aligned whole series."""
+        with pytest.raises(ValueError):
+            DatasetProcessor(dataset_dir, series_mode=series_mode, crop=crop, stack_slices=True)
+
+    def test_crop_series_requires_series_mode(self, dataset_dir):
+        """Test that the series crop isn't used when workers see single slices."""
+        with pytest.raises(ValueError):
+            DatasetProcessor(dataset_dir, crop=CROP_SERIES)
+
+    @pytest.mark.parametrize("mode, shape", [(PATCH_2D, (16, 16)), (PATCH_25D, (16, 16, 3))])
+    def test_extract_patches(self, multi_patient_dataset_dir, tmp_path, mode, shape):
+        """Test that patches of every series are packed with nodule and non-nodule labels."""
+        output_dir = str(tmp_path / "patches")
+        DatasetProcessor(multi_patient_dataset_dir).extract_patches(
+            output_dir, size=16, mode=mode, negative_ratio=2, dtype=UINT16, seed=0
+        )
+
+        images, uids, labels = load_packed_dataset(output_dir)
+        metadata = DatasetMetadata.load(output_dir)
+        assert (metadata.backend, metadata.dtype, metadata.shape) == (PACKED_BACKEND, UINT16, shape)
+        assert images.shape == (len(uids), *shape)
+        assert (labels == NODULE).sum() == len(PATIENT_NO_SLICES)
+        assert (labels == NON_NODULE).sum() == len(PATIENT_NO_SLICES) * MIN_NEGATIVES_PER_SERIES
+        assert not os.path.exists(os.path.join(output_dir, PACKED_RAW_FILENAME))
+
+    def test_process_and_save_resume(self, dataset_dir, tmp_path):
+        """Test that a re-run only processes changed slices and changed parameters."""
+        output_dir = tmp_path / "processed"
+        dp = DatasetProcessor(dataset_dir)
+        dp.process_and_save(str(output_dir))
+
+        def output_mtimes():
+            return {
+                f: os.stat(output_dir / label / f).st_mtime_ns
+                for label in [NODULE, NON_NODULE]
+                for f in os.listdir(output_dir / label)
+            }
+
+        first_run = output_mtimes()
+        dp.process_and_save(str(output_dir))
+        assert output_mtimes() == first_run
+
+        # Touch one source dicom, only its output is written again
+        dicom_path = next(
+            os.path.join(root, f)
+            for root, _, files in os.walk(dataset_dir)
+            for f in files
+            if f.endswith(".dcm")
+        )
+        os.utime(dicom_path, ns=(0, 0))
+        dp.process_and_save(str(output_dir))
+        changed = {f for f, mtime in output_mtimes().items() if first_run[f] != mtime}
+        assert len(changed) == 1
+
+        # Changing parameters invalidates all outputs
+        dp.process_and_save(str(output_dir), dtype=UINT16)
+        nodule_dir = output_dir / NODULE
+        assert np.load(nodule_dir / os.listdir(nodule_dir)[0]).dtype == np.uint16
+        assert len(output_mtimes()) == NO_SLICES
+
+    def test_process_and_save_shards(self, multi_patient_dataset_dir, tmp_path):
+        """Test that slices are written to shards with an index and split by shard."""
+        output_dir = tmp_path / "processed"
+        dp = DatasetProcessor(multi_patient_dataset_dir)
+        dp.process_and_save(str(output_dir), backend=TFRECORD_BACKEND)
+
+        shards = load_shard_index(str(output_dir))
+        assert not os.path.exists(output_dir / NODULE)
+        assert len(shards) == len(os.listdir(output_dir / SHARDS_FOLDER)) == len(PATIENT_NO_SLICES)
+        assert sum(shard["records"] for shard in shards) == sum(PATIENT_NO_SLICES)
+        assert sum(shard["nodules"] for shard in shards) == len(PATIENT_NO_SLICES)
+        assert all(os.path.exists(shard["path"]) for shard in shards)
+
+        dp.train_test_split(str(output_dir), train_size=0.5)
+        train_shards = load_shard_index(str(output_dir / TRAIN_FOLDER))
+        test_shards = load_shard_index(str(output_dir / TEST_FOLDER))
+        assert sorted(shard["path"] for shard in train_shards + test_shards) == sorted(
+            shard["path"] for shard in shards
+        )
+        assert DatasetMetadata.load(str(output_dir / TRAIN_FOLDER)).backend == TFRECORD_BACKEND
+
+    @pytest.mark.parametrize("mode", [COPY_SPLIT, HARDLINK_SPLIT, RENAME_SPLIT])
+    def test_train_test_split_modes(self, multi_patient_dataset_dir, tmp_path, mode):
+        """Test that every file ends up in exactly one split, linked files share their data."""
+        output_dir = tmp_path / "processed"
+        dp = DatasetProcessor(multi_patient_dataset_dir)
+        dp.process_and_save(str(output_dir))
+        source_inodes = {
+            f: os.stat(output_dir / label / f).st_ino
+            for label in [NODULE, NON_NODULE]
+            for f in os.listdir(output_dir / label)
+        }
+
+        dp.train_test_split(str(output_dir), train_size=0.5, mode=mode, seed=0)
+
+        split_inodes = {
+            f: os.stat(output_dir / folder / label / f).st_ino
+            for folder in [TRAIN_FOLDER, TEST_FOLDER]
+            for label in [NODULE, NON_NODULE]
+            for f in os.listdir(output_dir / folder / label)
+        }
+        assert split_inodes.keys() == source_inodes.keys()
+        if mode == COPY_SPLIT:
+            assert all(split_inodes[f] != inode for f, inode in source_inodes.items())
+        else:
+            assert split_inodes == source_inodes
+
+    def test_train_test_split_manifest(self, multi_patient_dataset_dir, tmp_path):
+        """Test that manifests cover all images and are reproducible from a seed."""
+        output_dir = tmp_path / "processed"
+        dp = DatasetProcessor(multi_patient_dataset_dir)
+        dp.process_and_save(str(output_dir))
+
+        def split(seed):
+            dp.train_test_split(str(output_dir), train_size=0.5, mode=MANIFEST_SPLIT, seed=seed)
+            return [
+                load_manifest(str(output_dir / f"{folder}.csv"))
+                for folder in [TRAIN_FOLDER, TEST_FOLDER]
+            ]
+
+        train_rows, test_rows = split(seed=0)
+        assert split(seed=0) == [train_rows, test_rows]
+        assert not os.path.exists(output_dir / TRAIN_FOLDER)
+        assert len(train_rows) + len(test_rows) == sum(PATIENT_NO_SLICES)
+        assert all(
+            os.path.exists(path) and os.path.basename(os.path.dirname(path)) == label
+            for path, label in train_rows + test_rows
+        )
+
+    def test_train_test_split_invalid_mode(self, dataset_dir, tmp_path):
+        """Test that an unknown split mode is rejected."""
+        with pytest.raises(ValueError):
+            DatasetProcessor(dataset_dir).train_test_split(str(tmp_path), mode="symlink")
+
+    def test_train_test_split_packed(self, multi_patient_dataset_dir, tmp_path):
+        """Test that every split is packed into one file with an index of its images."""
+        output_dir = tmp_path / "processed"
+        dp = DatasetProcessor(multi_patient_dataset_dir)
+        dp.process_and_save(str(output_dir), dtype=UINT16)
+        dp.train_test_split(str(output_dir), train_size=0.5, mode=PACKED_SPLIT, seed=0)
+
+        total = 0
+        for folder in [TRAIN_FOLDER, TEST_FOLDER]:
+            images, uids, labels = load_packed_dataset(str(output_dir / folder))
+            assert images.dtype == np.uint16
+            assert len(images) == len(uids) == len(labels)
+            for image, uid, label in zip(images, uids, labels):
+                np.testing.assert_array_equal(image, np.load(output_dir / label / f"{uid}.npy"))
+            assert DatasetMetadata.load(str(output_dir / folder)).backend == PACKED_BACKEND
+            total += len(images)
+
+        assert total == sum(PATIENT_NO_SLICES)
+
+
+class TestDatasetMetadata:
+    def test_decode_shape(self):
+        """Test that images aren't broadcast into an out of another shape."""
+        metadata = DatasetMetadata.from_dtype(UINT16)
+        image = metadata.encode(np.full((2, 4), 0.5))
+
+        np.testing.assert_allclose(metadata.decode(image, out=np.empty((2, 4), dtype=np.float32)), 0.5, atol=1e-4)
+        with pytest.raises(ValueError):
+            metadata.decode(image, out=np.empty((3, 2, 4), dtype=np.float32))
@@ -0,0 +1,53 @@
+import numpy as np
+import pydicom
+
+from src.preprocessing.dicom_processor import DicomProcessor
+from src.preprocessing.utils import ProcessedAnnotation, ProcessedDicom
+
+from tests.preprocessing.conftest import SIZE, NODULE_Z_POSITION
+
+
+class TestDicomProcessor:
+    def test_process(self, dicom_path):
+        """Test that processing returns a normalized, segmented image."""
+        processed_dicom = DicomProcessor(dicom_path).process(as_output=True)
+
+        assert isinstance(processed_dicom, ProcessedDicom)
+        assert processed_dicom.image.shape == (SIZE, SIZE)
+        assert processed_dicom.image.max() == 1
+        assert processed_dicom.image.min() == 0
+        assert processed_dicom.z_position == NODULE_Z_POSITION
+        # Background outside the body is removed by the lung mask
+        assert processed_dicom.image[0, 0] == 0
+
+    def test_single_decode(self, dicom_path, monkeypatch):
+        """Test that pixel data is decoded once and never re-encoded."""
+        calls = []
+        convert_pixel_data = pydicom.dataset.Dataset.convert_pixel_data
+
+        def counting_convert_pixel_data(self, *args, **kwargs):
+            calls.append(1)
+            return convert_pixel_data(self, *args, **kwargs)
+
+        monkeypatch.setattr(
+            pydicom.dataset.Dataset, "convert_pixel_data", counting_convert_pixel_data
+        )
+        DicomProcessor(dicom_path).process()
+
+        assert len(calls) == 1
+
+    def test_include_annotation(self, dicom_path):
+        """Test that annotated nodules are always part of the lung mask."""
+        # Polygon inside the body, which is removed by the lung mask
+        annotation = ProcessedAnnotation(
+            z_position=NODULE_Z_POSITION,
+            x_positions=[30, 34, 34, 30],
+            y_positions=[8, 8, 12, 12],
+        )
+        without_annotation = DicomProcessor(dicom_path).process(as_output=True)
+        with_annotation = DicomProcessor(
+            dicom_path, annotations=[annotation]
+        ).process(as_output=True)
+
+        assert np.all(without_annotation.image[9:11, 31:33] == 0)
+        assert np.all(with_annotation.image[9:11, 31:33] > 0)
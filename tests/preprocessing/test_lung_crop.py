@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.preprocessing.lung_crop import (
+    crop_and_resize,
+    crop_processed_dicoms,
+    load_crops,
+    lung_bounding_box,
+    save_crops,
+    to_original_frame,
+)
+from src.preprocessing.utils import CROP_SERIES, CROP_SLICE, ProcessedDicom
+
+
+def make_slice(y0, x0, y1, x1, size=64):
+    image = np.zeros((size, size))
+    image[y0:y1, x0:x1] = 1.0
+    return image
+
+
+class TestLungCrop:
+    def test_lung_bounding_box(self):
+        """Test that the box is a square around the lungs with a margin."""
+        assert lung_bounding_box(make_slice(20, 10, 30, 50), margin=2) == (3, 8, 47, 52)
+
+    def test_lung_bounding_box_border(self):
+        """Test that the box is shifted and clipped to lie within the frame."""
+        assert lung_bounding_box(make_slice(0, 0, 10, 60), margin=8) == (0, 0, 64, 64)
+        assert lung_bounding_box(make_slice(50, 0, 60, 20), margin=0) == (44, 0, 64, 20)
+
+    def test_lung_bounding_box_empty(self):
+        """Test that empty slices aren't cropped."""
+        assert lung_bounding_box(np.zeros((64, 64))) == (0, 0, 64, 64)
+
+    def test_crop_processed_dicoms(self):
+        """Test that slices are cropped to their own box or the box of the whole series."""
+        processed_dicoms = [
+            ProcessedDicom(image=make_slice(10, 10, 20, 20), uid="1", z_position=0.0),
+            ProcessedDicom(image=make_slice(30, 30, 50, 50), uid="2", z_position=1.0),
+        ]
+
+        slices = crop_processed_dicoms(processed_dicoms, CROP_SLICE, size=16)
+        series = crop_processed_dicoms(processed_dicoms, CROP_SERIES, size=16)
+
+        assert [processed_dicom.image.shape for processed_dicom in slices] == [(16, 16)] * 2
+        assert slices[0].crop_box != slices[1].crop_box
+        assert series[0].crop_box == series[1].crop_box == lung_bounding_box(
+            np.stack([processed_dicom.image for processed_dicom in processed_dicoms])
+        )
+
+    def test_to_original_frame(self):
+        """Test that pixel centres of the crop map back to the cropped region."""
+        image = np.arange(64 * 64, dtype=float).reshape(64, 64)
+        box = (8, 16, 40, 48)
+        cropped = crop_and_resize(image, box, size=32)
+
+        y, x = to_original_frame(np.array([0, 31]), np.array([5, 20]), box, size=32)
+
+        np.testing.assert_allclose(y, [8, 39])
+        np.testing.assert_allclose(x, [21, 36])
+        np.testing.assert_allclose(cropped[0, 5], image[8, 21])
+
+    def test_save_and_load_crops(self, tmp_path):
+        """Test that boxes are saved by uid and later rows replace earlier ones."""
+        path = str(tmp_path / "crops.csv")
+        save_crops(path, [("1", (0, 0, 64, 64)), ("2", (1, 2, 3, 4))])
+        save_crops(path, [("1", (5, 6, 7, 8))])
+
+        assert load_crops(path) == {"1": (5, 6, 7, 8), "2": (1, 2, 3, 4)}
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from src.preprocessing.annotation_index import AnnotationIndex
+from src.preprocessing.patch_extractor import PatchExtractor
+from src.preprocessing.utils import (
+    NODULE,
+    NON_NODULE,
+    PATCH_25D,
+    ProcessedAnnotation,
+    ProcessedDicom,
+)
+
+SIZE = 64
+PATCH_SIZE = 16
+
+
+def make_series(no_slices=5):
+    """Returns z-sorted slices with lungs in the middle and a nodule on the middle slice"""
+    processed_dicoms = []
+    for z in range(no_slices):
+        image = np.zeros((SIZE, SIZE))
+        image[8:56, 8:56] = 0.5 + 0.01 * z
+        processed_dicoms.append(ProcessedDicom(image=image, uid=f"slice{z}", z_position=float(z)))
+
+    annotations = AnnotationIndex([
+        # Two readers annotated the same nodule
+        ProcessedAnnotation(z_position=2.0, x_positions=[20, 24, 24, 20], y_positions=[30, 30, 34, 34]),
+        ProcessedAnnotation(z_position=2.0, x_positions=[21, 25, 25, 21], y_positions=[30, 30, 35, 35]),
+        # Small nodule annotated with one point
+        ProcessedAnnotation(z_position=2.0, x_positions=[45], y_positions=[12]),
+    ])
+    return processed_dicoms, annotations
+
+
+class TestPatchExtractor:
+    def test_extract(self):
+        """Test that every nodule gives one centred patch and negatives don't contain nodules."""
+        processed_dicoms, annotations = make_series()
+        patches, uids, labels = PatchExtractor(PATCH_SIZE, negative_ratio=2, seed=0).extract(
+            processed_dicoms, annotations
+        )
+
+        assert patches.shape == (6, PATCH_SIZE, PATCH_SIZE)
+        assert labels == [NODULE] * 2 + [NON_NODULE] * 4
+        assert sorted(uids[:2]) == ["slice2_12_45", "slice2_32_23"]
+
+        for uid, label in zip(uids, labels):
+            slice_uid, y, x = uid.rsplit("_", 2)
+            assert processed_dicoms[int(slice_uid[-1])].image[int(y), int(x)] > 0
+            if label == NON_NODULE and slice_uid == "slice2":
+                assert max(abs(int(y) - 32), abs(int(x) - 23)) > PATCH_SIZE // 2
+
+    def test_extract_25d(self):
+        """Test that 2.5D patches hold the neighbouring slices as channels."""
+        processed_dicoms, annotations = make_series()
+        patches, uids, _ = PatchExtractor(PATCH_SIZE, mode=PATCH_25D, seed=0).extract(
+            processed_dicoms, annotations
+        )
+
+        assert patches.shape[1:] == (PATCH_SIZE, PATCH_SIZE, 3)
+        y, x = 32, 23
+        expected = [processed_dicoms[z].image[y, x] for z in [1, 2, 3]]
+        np.testing.assert_allclose(patches[uids.index("slice2_32_23"), PATCH_SIZE // 2, PATCH_SIZE // 2], expected)
+
+    def test_extract_25d_negatives(self):
+        """Test that 2.5D negatives contain no nodule pixels in any channel."""
+        processed_dicoms, annotations = make_series(no_slices=3)
+        extractor = PatchExtractor(PATCH_SIZE, mode=PATCH_25D, negative_ratio=20, seed=0)
+        _, uids, labels = extractor.extract(processed_dicoms, annotations)
+        nodules = extractor._nodule_masks(processed_dicoms, (SIZE, SIZE), annotations)
+
+        for uid, label in zip(uids, labels):
+            if label == NODULE:
+                continue
+            slice_uid, y, x = uid.rsplit("_", 2)
+            z = int(slice_uid[-1])
+            y0 = min(max(int(y) - PATCH_SIZE // 2, 0), SIZE - PATCH_SIZE)
+            x0 = min(max(int(x) - PATCH_SIZE // 2, 0), SIZE - PATCH_SIZE)
+            for neighbour in [max(z - 1, 0), z, min(z + 1, 2)]:
+                if neighbour in nodules:
+                    assert not nodules[neighbour][y0 : y0 + PATCH_SIZE, x0 : x0 + PATCH_SIZE].any()
+
+    def test_extract_lung_masks(self):
+        """Test that negatives are sampled in the given lung masks."""
+        processed_dicoms, annotations = make_series()
+        lung_masks = np.zeros((len(processed_dicoms), SIZE, SIZE), dtype=bool)
+        lung_masks[:, 40:56, 8:56] = True
+
+        _, uids, labels = PatchExtractor(PATCH_SIZE, negative_ratio=5, seed=0).extract(
+            processed_dicoms, annotations, lung_masks
+        )
+
+        for uid, label in zip(uids, labels):
+            if label == NON_NODULE:
+                slice_uid, y, x = uid.rsplit("_", 2)
+                assert lung_masks[int(slice_uid[-1]), int(y), int(x)]
+
+    def test_extract_seed(self):
+        """Test that negatives of a series are reproducible with a seed."""
+        processed_dicoms, annotations = make_series()
+
+        first = PatchExtractor(PATCH_SIZE, seed=1).extract(processed_dicoms, annotations)
+        second = PatchExtractor(PATCH_SIZE, seed=1).extract(processed_dicoms, annotations)
+
+        assert first[1] == second[1]
+        np.testing.assert_array_equal(first[0], second[0])
+
+    def test_invalid_mode(self):
+        """Test that an unknown patch mode is rejected."""
+        with pytest.raises(ValueError):
+            PatchExtractor(mode="3d")
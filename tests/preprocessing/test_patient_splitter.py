@@ -0,0 +1,91 @@
+import os
+from pathlib import Path
+
+import pytest
+import numpy as np
+
+from src.preprocessing.dataset_processor import DatasetProcessor
+from src.preprocessing.patient_splitter import PatientSplitter
+from src.preprocessing.utils import (
+    TRAIN_FOLDER,
+    VALIDATION_FOLDER,
+    TEST_FOLDER,
+    NUMPY_EXTENSION,
+    load_manifest,
+)
+
+from tests.preprocessing.conftest import PATIENT_NO_SLICES, write_series
+
+
+@pytest.fixture
+def processed_dir(multi_patient_dataset_dir, tmp_path):
+    """Processed dataset with a catalog of its source"""
+    output_dir = str(tmp_path / "processed")
+    dp = DatasetProcessor(multi_patient_dataset_dir, catalog_path=str(tmp_path / "catalog.sqlite"))
+    dp.process_and_save(output_dir)
+    return dp, output_dir
+
+
+class TestPatientSplitter:
+    def test_split(self, processed_dir):
+        """Test that every slice is in one split and patients are not shared between splits."""
+        dp, output_dir = processed_dir
+        manifests = dp.patient_split(output_dir, val_size=0.25, test_size=0.25, seed=0)
+
+        rows = {folder: load_manifest(path) for folder, path in manifests.items()}
+        assert sum(len(folder_rows) for folder_rows in rows.values()) == sum(PATIENT_NO_SLICES)
+
+        patient_ids = dp.catalog.patient_ids()
+        patients = {
+            folder: {patient_ids[os.path.basename(path).removesuffix(NUMPY_EXTENSION)] for path, _ in folder_rows}
+            for folder, folder_rows in rows.items()
+        }
+        assert [len(patients[folder]) for folder in [TRAIN_FOLDER, VALIDATION_FOLDER, TEST_FOLDER]] == [2, 1, 1]
+        assert len(set.union(*patients.values())) == len(PATIENT_NO_SLICES)
+
+        assert dp.patient_split(output_dir, val_size=0.25, test_size=0.25, seed=0) == manifests
+        assert [load_manifest(path) for path in manifests.values()] == list(rows.values())
+
+    def test_k_fold(self, processed_dir):
+        """Test that every patient is validated in exactly one fold."""
+        dp, output_dir = processed_dir
+        folds = dp.patient_k_fold(output_dir, k=2, seed=0)
+
+        validation_sizes = [len(load_manifest(fold[VALIDATION_FOLDER])) for fold in folds]
+        assert sum(validation_sizes) == sum(PATIENT_NO_SLICES)
+        for fold in folds:
+            train_paths = {path for path, _ in load_manifest(fold[TRAIN_FOLDER])}
+            validation_paths = {path for path, _ in load_manifest(fold[VALIDATION_FOLDER])}
+            assert train_paths.isdisjoint(validation_paths)
+
+    def test_split_updates_catalog(self, processed_dir, multi_patient_dataset_dir):
+        """Test that patients added to the dataset after the catalog was built are catalogued."""
+        dp, output_dir = processed_dir
+        write_series(Path(multi_patient_dataset_dir), "LIDC-IDRI-0100")
+
+        dp.patient_split(output_dir, val_size=0.25, test_size=0.25, seed=0)
+
+        assert "LIDC-IDRI-0100" in set(dp.catalog.patient_ids().values())
+
+    def test_split_requires_catalog(self, dataset_dir, tmp_path):
+        """Test that the split fails without a catalog to group slices by patient."""
+        with pytest.raises(ValueError):
+            DatasetProcessor(dataset_dir).patient_split(str(tmp_path))
+
+    def test_assign_groups_stratified(self):
+        """Test that patients with and without nodules are split by the same fractions."""
+        positive = np.array([True] * 10 + [False] * 30)
+        groups = PatientSplitter._assign_groups(
+            positive, np.array([0.7, 0.1, 0.2]), np.random.default_rng(0)
+        )
+
+        assert np.bincount(groups[positive]).tolist() == [7, 1, 2]
+        assert np.bincount(groups[~positive]).tolist() == [21, 3, 6]
+
+    def test_assign_folds_stratified(self):
+        """Test that folds have equal sizes and an equal share of patients with nodules."""
+        positive = np.array([True] * 10 + [False] * 15)
+        folds = PatientSplitter._assign_folds(positive, 5, np.random.default_rng(0))
+
+        assert np.bincount(folds).tolist() == [5] * 5
+        assert np.bincount(folds[positive]).tolist() == [2] * 5
@@ -0,0 +1,60 @@
+import os
+
+from src.preprocessing.processing_ledger import ProcessingLedger
+from src.preprocessing.utils import DONE, FAILED
+
+PARAMS = {"version": 1, "dtype": "float64"}
+
+
+def make_result(source_path, status=DONE, output_path=None):
+    stat = os.stat(source_path)
+    return {
+        "source_path": str(source_path),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "status": status,
+        "output_path": output_path,
+    }
+
+
+class TestProcessingLedger:
+    def test_is_done(self, tmp_path):
+        """Test that only unchanged slices done with the same parameters and with outputs are done."""
+        source_path = tmp_path / "slice.dcm"
+        source_path.write_bytes(b"dicom")
+        output_path = tmp_path / "slice.npy"
+        output_path.write_bytes(b"image")
+        failed_path = tmp_path / "failed.dcm"
+        failed_path.write_bytes(b"dicom")
+
+        ledger = ProcessingLedger(str(tmp_path / "ledger.sqlite"), PARAMS)
+        ledger.record([make_result(source_path, output_path=str(output_path)), make_result(failed_path, FAILED)])
+
+        reloaded = ProcessingLedger(str(tmp_path / "ledger.sqlite"), PARAMS)
+        assert reloaded.is_done(str(source_path))
+        assert not reloaded.is_done(str(failed_path))
+        assert not reloaded.is_done(str(tmp_path / "new.dcm"))
+        assert reloaded.summary() == {DONE: 1, FAILED: 1}
+
+        changed_params = ProcessingLedger(str(tmp_path / "ledger.sqlite"), {**PARAMS, "dtype": "uint16"})
+        assert not changed_params.is_done(str(source_path))
+
+        output_path.unlink()
+        assert not reloaded.is_done(str(source_path))
+
+        output_path.write_bytes(b"image")
+        source_path.write_bytes(b"changed dicom")
+        assert not reloaded.is_done(str(source_path))
+
+    def test_record_removes_replaced_output(self, tmp_path):
+        """Test that an output replaced by a new output path is removed."""
+        source_path = tmp_path / "slice.dcm"
+        source_path.write_bytes(b"dicom")
+        old_output_path = tmp_path / "old.npy"
+        old_output_path.write_bytes(b"image")
+
+        ledger = ProcessingLedger(str(tmp_path / "ledger.sqlite"), PARAMS)
+        ledger.record([make_result(source_path, output_path=str(old_output_path))])
+        ledger.record([make_result(source_path, output_path=str(tmp_path / "new.npy"))])
+
+        assert not old_output_path.exists()
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+from src.preprocessing.dicom_processor import DicomProcessor
+from src.preprocessing.series_processor import SeriesProcessor, stack_neighbours
+
+from tests.preprocessing.conftest import NO_SLICES
+
+
+def get_dicom_paths(dataset_dir):
+    return [
+        os.path.join(root, f)
+        for root, _, files in os.walk(dataset_dir)
+        for f in files
+        if f.endswith(".dcm")
+    ]
+
+
+class TestSeriesProcessor:
+    def test_process(self, dataset_dir):
+        """Test that processing returns z-sorted processed slices."""
+        paths = get_dicom_paths(dataset_dir)
+        processed_dicoms = SeriesProcessor(paths[::-1]).process(as_output=True)
+
+        z_positions = [processed_dicom.z_position for processed_dicom in processed_dicoms]
+        assert len(processed_dicoms) == NO_SLICES
+        assert z_positions == sorted(z_positions)
+
+    def test_matches_dicom_processor(self, dataset_dir):
+        """Test that vectorized masks match the per-slice segmentation."""
+        paths = get_dicom_paths(dataset_dir)
+        processed_dicoms = SeriesProcessor(paths).process(as_output=True)
+        expected = {
+            processed_dicom.uid: processed_dicom.image
+            for processed_dicom in (
+                DicomProcessor(path).process(as_output=True) for path in paths
+            )
+        }
+
+        for processed_dicom in processed_dicoms:
+            np.testing.assert_array_equal(processed_dicom.image, expected[processed_dicom.uid])
+
+    def test_stack_neighbours(self, dataset_dir):
+        """Test that every slice is stacked with its z-sorted neighbours as channels."""
+        processed_dicoms = SeriesProcessor(get_dicom_paths(dataset_dir)).process(as_output=True)
+        images = [processed_dicom.image for processed_dicom in processed_dicoms]
+
+        stacks = list(stack_neighbours(processed_dicoms))
+
+        assert [stack.uid for stack in stacks] == [processed_dicom.uid for processed_dicom in processed_dicoms]
+        for z, stack in enumerate(stacks):
+            assert stack.image.shape == (*images[z].shape, 3)
+            for channel, neighbour in enumerate([max(z - 1, 0), z, min(z + 1, NO_SLICES - 1)]):
+                np.testing.assert_array_equal(stack.image[..., channel], images[neighbour])